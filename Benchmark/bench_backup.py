@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import tempfile
+import threading
+import http.client
+import multiprocessing
+
+# Rende importabili Dati/database.py, Dati/backup.py e Script/app.py come negli altri script del progetto
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, 'Dati'))
+sys.path.append(os.path.join(ROOT_DIR, 'Script'))
+
+from generate_data import generate_db
+from bench_writes import serve, wait_for_port, percentile
+from backup import create_backup, PAGES_PER_STEP, STEP_PAUSE
+
+def client(port, num_apps, num_accounts, write_ratio, stop, seed, latencies):
+    """Alterna letture (una pagina di app) e scritture (associazioni) finché 'stop' non viene impostato."""
+    rnd = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while not stop.is_set():
+        if rnd.random() < write_ratio:
+            path = '/api/accounts/add' if rnd.random() < 0.5 else '/api/accounts/remove'
+            body = json.dumps({'app_id': rnd.randint(1, num_apps), 'account_id': rnd.randint(1, num_accounts)})
+            start = time.perf_counter()
+            conn.request('POST', path, body, {'Content-Type': 'application/json'})
+        else:
+            start = time.perf_counter()
+            conn.request('GET', f'/api/manage/data/apps?limit=100&prefix=App%20{rnd.randint(1, num_apps)}')
+        conn.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+
+def run(clients, duration, num_apps, num_accounts, link_density, write_ratio):
+    """Confronta la latenza delle richieste senza copia, durante una copia a passi e durante una copia in un passo solo."""
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'bench_backup.db')
+        links = generate_db(db_file, num_apps, num_accounts=num_accounts, link_density=link_density)
+        print(f"{num_apps} app, {num_accounts} account, {links} collegamenti, {os.path.getsize(db_file) / 2**20:.0f} MiB")
+        print(f"{'copia':<24} {'durata s':>9} {'ripart.':>8} {'richieste':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        port = 18100
+        process = context.Process(target=serve, args=(db_file, port, False), daemon=True)
+        process.start()
+        try:
+            wait_for_port(port, timeout=120)
+            phases = [
+                ('nessuna', None),
+                (f'a passi ({PAGES_PER_STEP} pag.)', dict(pages=PAGES_PER_STEP, pause=STEP_PAUSE)),
+                ('in un passo solo', dict(pages=-1, pause=0)),
+            ]
+            for name, options in phases:
+                latencies, stop = [], threading.Event()
+                threads = [
+                    threading.Thread(target=client, args=(port, num_apps, num_accounts, write_ratio, stop, i, latencies))
+                    for i in range(clients)
+                ]
+                for thread in threads:
+                    thread.start()
+                time.sleep(0.5) # Riscaldamento prima della misura
+                del latencies[:]
+                start = time.perf_counter()
+                info = {'restarts': ''}
+                if options is None:
+                    time.sleep(duration)
+                else:
+                    info = create_backup(db_file, os.path.join(tmp_dir, 'backups'), keep=1, **options)
+                elapsed = time.perf_counter() - start
+                stop.set()
+                for thread in threads:
+                    thread.join()
+                print(f"{name:<24} {elapsed:>9.2f} {info['restarts']:>8} {len(latencies):>10} "
+                      f"{percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} "
+                      f"{max(latencies, default=0) * 1000:>8.2f}")
+        finally:
+            process.terminate()
+            process.join()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Latenza delle richieste mentre viene creata una copia del database.")
+    parser.add_argument('--clients', type=int, default=8, help="Client concorrenti")
+    parser.add_argument('--duration', type=float, default=5, help="Secondi della misura senza copia")
+    parser.add_argument('--apps', type=int, default=50000)
+    parser.add_argument('--accounts', type=int, default=500)
+    parser.add_argument('--link-density', type=float, default=0.04)
+    parser.add_argument('--write-ratio', type=float, default=0.1, help="Frazione di richieste in scrittura")
+    args = parser.parse_args()
+    run(args.clients, args.duration, args.apps, args.accounts, args.link_density, args.write_ratio)
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# Rende importabili Dati/database.py e Script/app.py come negli altri script del progetto
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, 'Dati'))
+sys.path.append(os.path.join(ROOT_DIR, 'Script'))
+
+from generate_data import generate_db
+
+def run(sizes, accounts_per_app, num_accounts, repeat):
+    """Misura get_data_grouped_by_folder() per ogni dimensione e stampa il costo per riga."""
+    print(f"{'app':>8} {'righe':>10} {'secondi':>9} {'us/riga':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_apps in sizes:
+            db_file = os.path.join(tmp_dir, f'bench_{num_apps}.db')
+            generate_db(db_file, num_apps, num_folders=40, num_accounts=num_accounts,
+                        link_density=accounts_per_app / num_accounts, hidden_ratio=0)
+
+            os.environ['APPMANAGER_DB'] = db_file
+            os.environ['MAINTENANCE'] = '0'
+            import app as app_module
+            # Il modulo viene importato una volta sola: per le dimensioni successive si sostituisce il dispositivo predefinito
+            app_module.DB_FILE = db_file
+            app_module.devices.default = app_module.Device(app_module.DEFAULT_DEVICE, db_file)
+            with app_module.app.app_context():
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    tree = app_module.get_data_grouped_by_folder()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+            rows = sum(len(app_data['accounts']) for apps in tree.values() for app_data in apps)
+            print(f"{num_apps:>8} {rows:>10} {best:>9.3f} {best / rows * 1e6:>8.3f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark del raggruppamento per cartella di /api/apps.")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="Numero di app per ogni misura, separati da virgola")
+    parser.add_argument('--accounts-per-app', type=int, default=50)
+    parser.add_argument('--accounts', type=int, default=500, help="Numero totale di account")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(',')], args.accounts_per_app, args.accounts, args.repeat)
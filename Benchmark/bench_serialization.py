@@ -0,0 +1,74 @@
+import os
+import sys
+import gzip
+import time
+import argparse
+import tempfile
+
+# Rende importabili Dati/database.py e Script/app.py come negli altri script del progetto
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, 'Dati'))
+sys.path.append(os.path.join(ROOT_DIR, 'Script'))
+
+from generate_data import generate_db
+
+def best_time(function, repeat):
+    """Esegue function() 'repeat' volte e restituisce (miglior tempo, ultimo risultato)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def run(num_apps, num_accounts, link_density, repeat):
+    """Confronta dimensione e tempo di serializzazione/compressione di /api/apps e /api/manage/data."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'bench_serialization.db')
+        links = generate_db(db_file, num_apps, num_accounts=num_accounts, link_density=link_density)
+        os.environ['APPMANAGER_DB'] = db_file
+        os.environ['MAINTENANCE'] = '0'
+        import app as app_module
+        from flask.json.provider import DefaultJSONProvider
+        app_module.DB_FILE = db_file
+
+        encoders = {'json': DefaultJSONProvider(app_module.app)}
+        if app_module.orjson is not None:
+            encoders['orjson'] = app_module.OrjsonProvider(app_module.app)
+        compressors = {
+            'gzip-1': lambda body: gzip.compress(body, compresslevel=1, mtime=0),
+            'gzip-6': lambda body: gzip.compress(body, compresslevel=6, mtime=0),
+        }
+        if app_module.brotli is not None:
+            compressors['br-5'] = lambda body: app_module.brotli.compress(body, quality=5)
+            compressors['br-11'] = lambda body: app_module.brotli.compress(body, quality=11)
+
+        payloads = {
+            '/api/apps': app_module.get_data_grouped_by_folder,
+            '/api/apps?format=columnar': app_module.get_apps_columnar,
+            '/api/manage/data': app_module._build_manage_data,
+            '/api/manage/data?format=columnar': app_module._build_manage_data_columnar,
+        }
+        print(f"{num_apps} app, {num_accounts} account, {links} collegamenti")
+        print(f"{'risposta':<34} {'codifica':<9} {'byte':>11} {'ms':>9}")
+        with app_module.app.app_context():
+            for name, build in payloads.items():
+                build_seconds, data = best_time(build, repeat)
+                print(f"{name:<34} {'(query)':<9} {'':>11} {build_seconds * 1000:>9.1f}")
+                body = None
+                for encoder_name, provider in encoders.items():
+                    seconds, body = best_time(lambda: provider.response(data).get_data(), repeat)
+                    print(f"{'':<34} {encoder_name:<9} {len(body):>11,} {seconds * 1000:>9.1f}")
+                for compressor_name, compress in compressors.items():
+                    seconds, compressed = best_time(lambda: compress(body), repeat)
+                    print(f"{'':<34} {compressor_name:<9} {len(compressed):>11,} {seconds * 1000:>9.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Confronto tra formati, serializzatori e compressione delle risposte.")
+    parser.add_argument('--apps', type=int, default=20000)
+    parser.add_argument('--accounts', type=int, default=500)
+    parser.add_argument('--link-density', type=float, default=0.04)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.apps, args.accounts, args.link_density, args.repeat)
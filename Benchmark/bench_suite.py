@@ -0,0 +1,253 @@
+import os
+import sys
+import io
+import json
+import time
+import random
+import sqlite3
+import platform
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+import http.client
+import multiprocessing
+
+# Rende importabili Dati/*.py e Script/app.py come negli altri script del progetto
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, 'Dati'))
+sys.path.append(os.path.join(ROOT_DIR, 'Script'))
+
+from generate_data import generate_db, generate_workbook
+from bench_writes import serve, wait_for_port, percentile
+
+def summarize(latencies, errors, elapsed):
+    """Statistiche di una serie di misure: throughput, percentili in millisecondi ed errori."""
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0.0,
+        'throughput': round(count / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+def _failed(status, body):
+    # Alcuni endpoint storici restituiscono gli errori come [messaggio, codice] con stato 200
+    return status >= 400 or body[:1] == b'['
+
+def build_scenarios(num_apps, num_folders, num_accounts, seed):
+    """
+    Elenca le richieste da misurare, una voce per route: (nome, metodo, funzione che restituisce
+    (percorso, corpo JSON), ripetizioni relative). Le scritture usano id casuali ma riproducibili;
+    le eliminazioni agiscono su app e account creati dalle voci precedenti.
+    """
+    rnd = random.Random(seed)
+    created = {'apps': [], 'accounts': []}
+    counter = iter(range(10 ** 9))
+    app_id = lambda: rnd.randint(1, num_apps)
+    account_id = lambda: rnd.randint(1, num_accounts)
+    return created, [
+        ('GET /api/apps', 'GET', lambda: ('/api/apps', None), 1),
+        ('GET /api/apps?stream=1', 'GET', lambda: ('/api/apps?stream=1', None), 0.2),
+        ('GET /api/manage/data', 'GET', lambda: ('/api/manage/data', None), 1),
+        ('GET /api/manage/data/apps', 'GET', lambda: ('/api/manage/data/apps?limit=100', None), 1),
+        ('GET /api/manage/data/accounts', 'GET', lambda: ('/api/manage/data/accounts?limit=100', None), 1),
+        ('GET /api/search', 'GET', lambda: (f'/api/search?q=App+{rnd.randint(1, 99)}', None), 1),
+        ('GET /api/accounts/<id>/apps', 'GET', lambda: (f'/api/accounts/{account_id()}/apps', None), 1),
+        ('GET /api/accounts/apps', 'GET', lambda: (f'/api/accounts/apps?ids={account_id()},{account_id()},{account_id()}', None), 1),
+        ('GET /api/changes', 'GET', lambda: ('/api/changes?since=0&limit=100', None), 1),
+        ('GET /api/export.csv', 'GET', lambda: ('/api/export.csv', None), 0.1),
+        ('GET /api/export.xlsx', 'GET', lambda: ('/api/export.xlsx', None), 0.02),
+        ('GET /metrics', 'GET', lambda: ('/metrics', None), 0.2),
+        ('POST /api/accounts/add', 'POST', lambda: ('/api/accounts/add', {'app_id': app_id(), 'account_id': account_id()}), 1),
+        ('POST /api/accounts/remove', 'POST', lambda: ('/api/accounts/remove', {'app_id': app_id(), 'account_id': account_id()}), 1),
+        ('POST /api/accounts/batch', 'POST', lambda: ('/api/accounts/batch', {
+            'add': [[app_id(), account_id()] for _ in range(20)], 'remove': [[app_id(), account_id()] for _ in range(20)]
+        }), 0.5),
+        ('PUT /api/apps/order', 'PUT', lambda: ('/api/apps/order', {
+            'folder': 'Cartella 0', 'ids': rnd.sample(range(1, num_apps + 1, num_folders), 2)
+        }), 0.5),
+        ('PUT /api/accounts/order', 'PUT', lambda: ('/api/accounts/order', {'ids': rnd.sample(range(1, num_accounts + 1), 2)}), 0.5),
+        ('PUT /api/apps/<id>', 'PUT', lambda: (f'/api/apps/{app_id()}', {'order': rnd.randint(0, 9), 'is_hidden': False}), 0.5),
+        ('PUT /api/accounts/<id>', 'PUT', lambda: (f'/api/accounts/{account_id()}', {'order': rnd.randint(0, 9), 'is_hidden': False}), 0.5),
+        ('POST /api/apps', 'POST', lambda: ('/api/apps', {'name': f'Bench app {next(counter)}', 'folder': 'Bench'}), 0.5),
+        ('POST /api/accounts', 'POST', lambda: ('/api/accounts', {'name': f'bench{next(counter)}@example.com', 'abbreviation': 'B'}), 0.5),
+        ('DELETE /api/apps/<id>', 'DELETE', lambda: (f"/api/apps/{created['apps'].pop() if created['apps'] else 0}", None), 0.5),
+        ('DELETE /api/accounts/<id>', 'DELETE', lambda: (f"/api/accounts/{created['accounts'].pop() if created['accounts'] else 0}", None), 0.5),
+        ('POST /api/login', 'POST', lambda: ('/api/login', {'username': 'bench', 'password': 'bench'}), 0.2),
+        ('POST /api/logout', 'POST', lambda: ('/api/logout', None), 1),
+    ]
+
+def run_test_client(app_module, scenarios, created, iterations):
+    """Misura ogni route in sequenza tramite il test client di Flask (nessun costo di rete)."""
+    client = app_module.app.test_client()
+    results = {}
+    for name, method, make_request, weight in scenarios:
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for _ in range(max(1, int(iterations * weight))):
+            path, body = make_request()
+            begin = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            data = response.get_data()
+            latencies.append(time.perf_counter() - begin)
+            if _failed(response.status_code, data):
+                errors += 1
+            elif method == 'POST' and path in ('/api/apps', '/api/accounts'):
+                created[path.rsplit('/', 1)[1]].append(json.loads(data)['id'])
+        results[name] = summarize(latencies, errors, time.perf_counter() - start)
+
+    # /api/events non termina mai: si misura il tempo fino al primo evento
+    latencies = []
+    for _ in range(max(1, iterations // 10)):
+        begin = time.perf_counter()
+        response = client.get('/api/events', buffered=False)
+        next(response.response)
+        latencies.append(time.perf_counter() - begin)
+        response.close()
+    results['GET /api/events (primo evento)'] = summarize(latencies, 0, sum(latencies))
+    return results
+
+def run_http(port, scenarios, clients, duration):
+    """
+    Misura le route di lettura (escluse le esportazioni) con 'clients' thread concorrenti
+    per 'duration' secondi ciascuna, contro un worker dell'applicazione in un processo separato.
+    """
+    results = {}
+    for name, method, make_request, weight in scenarios:
+        if method != 'GET' or 'export' in name:
+            continue
+        latencies, errors = [], []
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker():
+            while time.monotonic() < deadline:
+                with lock:
+                    path, _ = make_request()
+                begin = time.perf_counter()
+                try:
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    conn.request('GET', path)
+                    response = conn.getresponse()
+                    failed = _failed(response.status, response.read())
+                    conn.close()
+                except OSError:
+                    failed = True
+                latencies.append(time.perf_counter() - begin)
+                if failed:
+                    errors.append(1)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results[name] = summarize(latencies, len(errors), time.perf_counter() - start)
+    return results
+
+def run_import(tmp_dir, options):
+    """Misura import_data() su un file Excel generato: prima importazione e reimportazione invariata."""
+    import database
+    from import_data import import_data
+    xlsx_file = os.path.join(tmp_dir, 'bench_import.xlsx')
+    generate_workbook(xlsx_file, os.path.join(tmp_dir, 'bench_source.db'), **options)
+    db_file = os.path.join(tmp_dir, 'bench_import.db')
+    database.DB_FILE = db_file
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db()
+        for phase in ('prima importazione', 'reimportazione invariata'):
+            start = time.perf_counter()
+            import_data(xlsx_file, db_file)
+            results[phase] = {'seconds': round(time.perf_counter() - start, 3)}
+    return results
+
+def add_bench_user(db_file):
+    """Crea l'utente 'bench' (password 'bench') usato dalle misure di /api/login."""
+    from werkzeug.security import generate_password_hash
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', ('bench', generate_password_hash('bench')))
+        conn.commit()
+    finally:
+        conn.close()
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(options, iterations, clients, duration, seed):
+    """Esegue tutte le misure e restituisce il risultato come dizionario serializzabile in JSON."""
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'dataset': options,
+            'iterations': iterations,
+            'http_clients': clients,
+            'http_duration': duration,
+        }
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'gestione.db')
+        report['meta']['links'] = generate_db(db_file, **options)
+        add_bench_user(db_file)
+
+        os.environ['APPMANAGER_DB'] = db_file
+        os.environ['MAINTENANCE'] = '0'
+        import app as app_module
+        app_module.DB_FILE = db_file
+        created, scenarios = build_scenarios(options['num_apps'], options['num_folders'], options['num_accounts'], seed)
+        report['test_client'] = run_test_client(app_module, scenarios, created, iterations)
+
+        # Il worker HTTP lavora su una copia, così le scritture precedenti non influiscono
+        http_db = os.path.join(tmp_dir, 'gestione_http.db')
+        generate_db(http_db, **options)
+        port = 18100
+        process = multiprocessing.get_context('spawn').Process(target=serve, args=(http_db, port, False), daemon=True)
+        process.start()
+        try:
+            wait_for_port(port)
+            _, scenarios = build_scenarios(options['num_apps'], options['num_folders'], options['num_accounts'], seed)
+            report['http'] = run_http(port, scenarios, clients, duration)
+        finally:
+            process.terminate()
+            process.join()
+
+        report['import_data'] = run_import(tmp_dir, options)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark di tutte le route e dell'importazione, con risultato in JSON.")
+    parser.add_argument('--apps', type=int, default=2000)
+    parser.add_argument('--folders', type=int, default=40)
+    parser.add_argument('--accounts', type=int, default=200)
+    parser.add_argument('--link-density', type=float, default=0.05)
+    parser.add_argument('--hidden-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=200, help="Richieste per route con il test client")
+    parser.add_argument('--clients', type=int, default=8, help="Thread concorrenti per la prova HTTP")
+    parser.add_argument('--duration', type=float, default=3, help="Secondi per route nella prova HTTP")
+    parser.add_argument('--output', help="File JSON in cui salvare il risultato (predefinito: stdout)")
+    args = parser.parse_args()
+    options = dict(num_apps=args.apps, num_folders=args.folders, num_accounts=args.accounts,
+                   link_density=args.link_density, hidden_ratio=args.hidden_ratio, seed=args.seed)
+    report = run(options, args.iterations, args.clients, args.duration, args.seed)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(text + '\n')
+        print(f"Risultati salvati in '{args.output}'.")
+    else:
+        print(text)
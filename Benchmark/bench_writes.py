@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import json
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import http.client
+import multiprocessing
+
+# Rende importabili Dati/database.py e Script/app.py come negli altri script del progetto
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, 'Dati'))
+sys.path.append(os.path.join(ROOT_DIR, 'Script'))
+
+from generate_data import generate_db
+
+def serve(db_file, port, group_commit):
+    """Avvia un worker dell'applicazione (processo separato, come un worker di gunicorn)."""
+    os.environ['APPMANAGER_DB'] = db_file
+    os.environ['GROUP_COMMIT'] = '1' if group_commit else '0'
+    os.environ['MAINTENANCE'] = '0'
+    from werkzeug.serving import make_server
+    import app as app_module
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # Niente log per ogni richiesta
+    make_server('127.0.0.1', port, app_module.app, threaded=True).serve_forever()
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/manage/data/accounts?limit=1')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Il worker sulla porta {port} non risponde')
+
+def client(ports, num_apps, num_accounts, deadline, seed, latencies, errors):
+    """Invia scritture (aggiunta e rimozione di associazioni) finché non scade il tempo."""
+    rnd = random.Random(seed)
+    while time.monotonic() < deadline:
+        path = '/api/accounts/add' if rnd.random() < 0.5 else '/api/accounts/remove'
+        body = json.dumps({'app_id': rnd.randint(1, num_apps), 'account_id': rnd.randint(1, num_accounts)})
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', rnd.choice(ports), timeout=30)
+            conn.request('POST', path, body, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            data = json.loads(response.read())
+            conn.close()
+            # Gli endpoint storici restituiscono gli errori come [messaggio, codice] con stato 200
+            failed = response.status != 200 or isinstance(data, list)
+        except (OSError, ValueError):
+            failed = True
+        latencies.append(time.perf_counter() - start)
+        if failed:
+            errors.append(1)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+def run(workers, clients, duration, num_apps, num_accounts):
+    """Misura le scritture concorrenti con GROUP_COMMIT disattivato e attivato."""
+    print(f"{'group commit':>12} {'richieste':>10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errori':>7}")
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for group_commit in (False, True):
+            db_file = os.path.join(tmp_dir, f'bench_writes_{int(group_commit)}.db')
+            generate_db(db_file, num_apps, num_accounts=num_accounts, link_density=5 / num_accounts)
+            ports = [18000 + 10 * group_commit + i for i in range(workers)]
+            processes = [context.Process(target=serve, args=(db_file, port, group_commit), daemon=True) for port in ports]
+            for process in processes:
+                process.start()
+            try:
+                for port in ports:
+                    wait_for_port(port)
+                latencies, errors = [], []
+                deadline = time.monotonic() + duration
+                threads = [
+                    threading.Thread(target=client, args=(ports, num_apps, num_accounts, deadline, i, latencies, errors))
+                    for i in range(clients)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            finally:
+                for process in processes:
+                    process.terminate()
+                    process.join()
+            print(f"{'on' if group_commit else 'off':>12} {len(latencies):>10} {len(latencies) / duration:>8.0f} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} "
+                  f"{len(errors) / max(len(latencies), 1):>7.2%}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark delle scritture concorrenti con e senza group commit.")
+    parser.add_argument('--workers', type=int, default=4, help="Processi dell'applicazione")
+    parser.add_argument('--clients', type=int, default=32, help="Client concorrenti")
+    parser.add_argument('--duration', type=float, default=10, help="Secondi per ogni modalità")
+    parser.add_argument('--apps', type=int, default=2000)
+    parser.add_argument('--accounts', type=int, default=200)
+    args = parser.parse_args()
+    run(args.workers, args.clients, args.duration, args.apps, args.accounts)
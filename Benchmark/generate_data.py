@@ -0,0 +1,93 @@
+import os
+import sys
+import io
+import random
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+
+# Rende importabili Dati/database.py e Dati/export_data.py come negli altri script del progetto
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, 'Dati'))
+
+def generate_db(db_file, num_apps=1000, num_folders=40, num_accounts=100, link_density=0.05,
+                hidden_ratio=0.1, seed=1, quiet=True):
+    """
+    Crea (o sostituisce) un database sintetico con lo schema di Dati/database.py.
+    - num_apps app distribuite in modo uniforme su num_folders cartelle;
+    - num_accounts account;
+    - ogni app è collegata in media a link_density * num_accounts account (tra 0 e il doppio);
+    - una frazione hidden_ratio di app e account è nascosta.
+    Con lo stesso seed genera sempre gli stessi dati. Restituisce il numero di collegamenti.
+    """
+    import database
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    database.DB_FILE = db_file
+    output = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(output):
+        database.init_db()
+
+    rnd = random.Random(seed)
+    mean_links = link_density * num_accounts
+    links = [
+        (app_id, account_id)
+        for app_id in range(1, num_apps + 1)
+        for account_id in rnd.sample(range(1, num_accounts + 1),
+                                     min(num_accounts, round(rnd.uniform(0, 2 * mean_links))))
+    ]
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.executemany(
+            'INSERT INTO accounts (name, abbreviation, "order", is_hidden) VALUES (?, ?, ?, ?)',
+            ((f'account{i}@example.com', f'A{i}', rnd.randint(0, 9), int(rnd.random() < hidden_ratio))
+             for i in range(num_accounts))
+        )
+        conn.executemany(
+            'INSERT INTO apps (name, folder, "order", is_hidden) VALUES (?, ?, ?, ?)',
+            ((f'App {i}', f'Cartella {i % num_folders}', rnd.randint(0, 9), int(rnd.random() < hidden_ratio))
+             for i in range(num_apps))
+        )
+        conn.executemany('INSERT INTO app_accounts (app_id, account_id) VALUES (?, ?)', links)
+        conn.commit()
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return len(links)
+
+def generate_workbook(xlsx_file, db_file, **options):
+    """
+    Genera un file Excel con la struttura letta da Dati/import_data.py (fogli 'Account' e
+    'POCO' con la matrice delle associazioni), passando da un database sintetico 'db_file'
+    creato con generate_db(**options).
+    """
+    from export_data import write_xlsx
+    generate_db(db_file, **options)
+    conn = sqlite3.connect(db_file)
+    try:
+        write_xlsx(conn, xlsx_file)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Crea un database (o un file Excel) con dati sintetici.")
+    parser.add_argument('output', help="Database da creare (es. scratch.db); con --xlsx, il file Excel")
+    parser.add_argument('--apps', type=int, default=1000)
+    parser.add_argument('--folders', type=int, default=40)
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--link-density', type=float, default=0.05, help="Frazione media di account collegati a ogni app")
+    parser.add_argument('--hidden-ratio', type=float, default=0.1, help="Frazione di app e account nascosti")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--xlsx', action='store_true', help="Genera un file Excel da importare invece del database")
+    args = parser.parse_args()
+    options = dict(num_apps=args.apps, num_folders=args.folders, num_accounts=args.accounts,
+                   link_density=args.link_density, hidden_ratio=args.hidden_ratio, seed=args.seed)
+    if args.xlsx:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            generate_workbook(args.output, os.path.join(tmp_dir, 'generate.db'), **options)
+        print(f"File Excel sintetico creato: '{args.output}'.")
+    else:
+        links = generate_db(args.output, **options)
+        print(f"Database sintetico creato: '{args.output}' ({args.apps} app, {args.accounts} account, {links} collegamenti).")
@@ -0,0 +1,181 @@
+import sqlite3
+import os
+import re
+import sys
+import time
+import argparse
+from datetime import datetime
+from urllib.parse import quote
+
+# Definisce i percorsi relativi alla posizione dello script
+BASE_DIR = os.path.dirname(__file__)
+DB_FILE = os.path.join(BASE_DIR, 'gestione.db')
+BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
+
+PAGES_PER_STEP = 256 # Pagine copiate a ogni passo (con pagine da 4 KiB, 1 MiB)
+STEP_PAUSE = 0.005 # Secondi di pausa tra due passi, per lasciare spazio alle richieste
+MAX_RESTARTS = 20 # Ripartenze tollerate (per scritture concorrenti) prima di copiare in un passo solo
+KEEP_SNAPSHOTS = 10 # Copie conservate dalla rotazione
+SNAPSHOT_NAME = re.compile(r'^(?P<stem>.+)-(?P<stamp>\d{8}-\d{6})\.db$')
+STAMP_FORMAT = '%Y%m%d-%H%M%S'
+
+class _TooManyRestarts(Exception):
+    """La copia incrementale continua a ripartire per le scritture concorrenti."""
+
+def _copy(source, target, pages, pause):
+    """
+    Copia 'source' in 'target' con l'API di backup di SQLite, 'pages' pagine per passo e una
+    pausa tra i passi: tra un passo e l'altro il database non resta bloccato. Se un'altra
+    connessione scrive durante la copia SQLite la fa ripartire; dopo MAX_RESTARTS ripartenze
+    la copia viene completata in un passo solo (in modalità WAL non blocca comunque chi scrive).
+    Restituisce il numero di ripartenze.
+    """
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining >= state['remaining']: # Nessun progresso: ripartita
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        if remaining and pause:
+            time.sleep(pause)
+
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    except _TooManyRestarts:
+        source.backup(target)
+    return state['restarts']
+
+def list_backups(backup_dir=None, db_file=None):
+    """Restituisce le copie di db_file presenti in backup_dir come lista di (data, percorso), dalla più recente."""
+    backup_dir = backup_dir or BACKUP_DIR
+    stem = os.path.splitext(os.path.basename(db_file or DB_FILE))[0]
+    snapshots = []
+    if os.path.isdir(backup_dir):
+        for file_name in os.listdir(backup_dir):
+            match = SNAPSHOT_NAME.match(file_name)
+            if match and match.group('stem') == stem:
+                snapshots.append((datetime.strptime(match.group('stamp'), STAMP_FORMAT), os.path.join(backup_dir, file_name)))
+    return sorted(snapshots, reverse=True)
+
+def create_backup(db_file=None, backup_dir=None, keep=KEEP_SNAPSHOTS, pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+    """
+    Crea una copia coerente del database anche mentre l'applicazione è in funzione, in
+    backup_dir/<nome>-AAAAMMGG-HHMMSS.db. La copia viene scritta su un file temporaneo,
+    verificata con PRAGMA quick_check e solo allora rinominata, quindi una copia con il nome
+    definitivo è sempre completa. Poi conserva solo le 'keep' copie più recenti.
+    Restituisce un dizionario con percorso, dimensione, durata e ripartenze.
+    """
+    db_file = db_file or DB_FILE
+    backup_dir = backup_dir or BACKUP_DIR
+    os.makedirs(backup_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db_file))[0]
+    stamp = datetime.now()
+    while os.path.exists(os.path.join(backup_dir, f'{stem}-{stamp.strftime(STAMP_FORMAT)}.db')):
+        stamp = datetime.fromtimestamp(stamp.timestamp() + 1) # Una copia per secondo al massimo
+    snapshot = os.path.join(backup_dir, f'{stem}-{stamp.strftime(STAMP_FORMAT)}.db')
+    partial = snapshot + '.part'
+
+    start = time.perf_counter()
+    source = sqlite3.connect(db_file)
+    target = sqlite3.connect(partial)
+    try:
+        restarts = _copy(source, target, pages, pause)
+        result = target.execute('PRAGMA quick_check').fetchone()[0]
+        if result != 'ok':
+            raise sqlite3.DatabaseError(f'quick_check sulla copia non riuscito: {result}')
+    except BaseException:
+        target.close()
+        os.remove(partial)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(partial, snapshot)
+
+    removed = [path for _, path in list_backups(backup_dir, db_file)[keep:]] if keep else []
+    for path in removed:
+        os.remove(path)
+    return {
+        'file': snapshot,
+        'bytes': os.path.getsize(snapshot),
+        'seconds': round(time.perf_counter() - start, 3),
+        'restarts': restarts,
+        'removed': removed,
+    }
+
+def find_backup(at=None, backup_dir=None, db_file=None):
+    """Restituisce la copia più recente creata non oltre 'at' (datetime; None = la più recente), o None."""
+    for stamp, path in list_backups(backup_dir, db_file):
+        if at is None or stamp <= at:
+            return path
+    return None
+
+def _new_epoch(conn):
+    """
+    Cambia l'epoca del registro delle modifiche dopo un ripristino: le versioni successive
+    riusano numeri già visti prima del ripristino, e l'epoca le distingue (es. nelle ETag).
+    """
+    try:
+        conn.execute(
+            "INSERT INTO change_log_meta (name, value) VALUES ('epoch', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (time.time_ns(),)
+        )
+        conn.commit()
+    except sqlite3.OperationalError:
+        pass # Database senza registro delle modifiche
+
+def restore_backup(snapshot, db_file=None, backup_dir=None, pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+    """
+    Riporta il database al contenuto della copia 'snapshot'. Prima salva lo stato attuale con
+    create_backup() (così anche il ripristino si può annullare), poi copia la snapshot dentro
+    il database in uso con l'API di backup: le altre connessioni aperte, compresa quella
+    dell'applicazione, vedono il nuovo contenuto senza bisogno di riavviare.
+    La copia verso il database in uso avviene in un passo solo: il lock in scrittura sulla
+    destinazione resta comunque preso fino alla fine, le pause lo allungherebbero soltanto.
+    Infine viene assegnata una nuova epoca al registro delle modifiche (vedi _new_epoch()).
+    Restituisce il dizionario della copia di sicurezza.
+    """
+    db_file = db_file or DB_FILE
+    safety = create_backup(db_file, backup_dir, keep=0, pages=pages, pause=pause)
+    source = sqlite3.connect(f'file:{quote(os.path.abspath(snapshot))}?mode=ro', uri=True)
+    target = sqlite3.connect(db_file, timeout=30)
+    try:
+        source.backup(target)
+        _new_epoch(target)
+    finally:
+        source.close()
+        target.close()
+    return safety
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Copie di sicurezza del database con l'API di backup di SQLite.")
+    parser.add_argument('command', choices=['create', 'list', 'restore'])
+    parser.add_argument('--db', default=DB_FILE, help="Database (predefinito: Dati/gestione.db)")
+    parser.add_argument('--dir', default=BACKUP_DIR, help="Cartella delle copie (predefinita: Dati/backups)")
+    parser.add_argument('--keep', type=int, default=KEEP_SNAPSHOTS, help="Copie da conservare dopo 'create'")
+    parser.add_argument('--at', help="Con 'restore': ripristina la copia più recente fino a questa data (AAAA-MM-GGTHH:MM[:SS])")
+    parser.add_argument('--file', help="Con 'restore': copia da ripristinare")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'create':
+            info = create_backup(args.db, args.dir, args.keep)
+            print(f"Copia creata: '{info['file']}' ({info['bytes']} byte, {info['seconds']}s, {info['restarts']} ripartenze).")
+            for path in info['removed']:
+                print(f"Copia eliminata dalla rotazione: '{path}'.")
+        elif args.command == 'list':
+            for stamp, path in list_backups(args.dir, args.db):
+                print(f"{stamp.isoformat(sep=' ')}  {path}  ({os.path.getsize(path)} byte)")
+        else:
+            snapshot = args.file or find_backup(datetime.fromisoformat(args.at) if args.at else None, args.dir, args.db)
+            if snapshot is None:
+                print("Nessuna copia trovata per la data indicata.")
+                sys.exit(1)
+            safety = restore_backup(snapshot, args.db, args.dir)
+            print(f"Database ripristinato da '{snapshot}'. Stato precedente salvato in '{safety['file']}'.")
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"Errore durante l'operazione di backup: {e}")
+        sys.exit(1)
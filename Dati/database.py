@@ -1,87 +1,448 @@
 import sqlite3
 import os
+import re
+import sys
 
 # Il database si troverà nella stessa cartella di questo script
 DB_FILE = os.path.join(os.path.dirname(__file__), 'gestione.db')
+# Un database per ogni dispositivo aggiuntivo: DEVICES_DIR/<nome>.db
+DEVICES_DIR = os.environ.get('DEVICES_DIR', os.path.join(os.path.dirname(__file__), 'devices'))
+DEVICE_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$') # Anche nei percorsi e negli URL: niente '/' o '.'
 
-def init_db():
+def device_db_file(name, devices_dir=None):
+    """Restituisce il file del database del dispositivo 'name' (ValueError se il nome non è valido)."""
+    if not DEVICE_NAME.match(name or ''):
+        raise ValueError(f"Nome di dispositivo non valido: {name!r}")
+    return os.path.join(devices_dir or DEVICES_DIR, f'{name}.db')
+
+def list_devices(devices_dir=None):
+    """Restituisce, in ordine alfabetico, i nomi dei dispositivi che hanno un database in devices_dir."""
+    devices_dir = devices_dir or DEVICES_DIR
+    if not os.path.isdir(devices_dir):
+        return []
+    return sorted(
+        file_name[:-3] for file_name in os.listdir(devices_dir)
+        if file_name.endswith('.db') and DEVICE_NAME.match(file_name[:-3])
+    )
+
+def _column_names(cursor, table):
+    """Restituisce l'insieme dei nomi di colonna di una tabella."""
+    return {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+
+def _migration_001_base_schema(cursor):
     """
-    Crea e inizializza il database con le tabelle necessarie se non esistono già.
-    Le tabelle sono:
+    Schema di base. Le tabelle sono:
     - accounts: contiene le informazioni sugli account (es. indirizzi email).
     - apps: contiene i nomi delle app e la cartella in cui si trovano.
     - app_accounts: tabella di collegamento per la relazione molti-a-molti tra app e account.
+    - users: utenti per l'autenticazione locale.
+    È scritta per funzionare anche sui database creati prima delle migrazioni versionate,
+    che possono avere già alcune tabelle e non avere ancora le colonne 'order' e 'is_hidden'.
     """
-    try:
-        # Si connette al database (lo crea se non esiste)
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+    # Creazione tabella 'accounts'
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        abbreviation TEXT
+    );
+    """)
 
-        # Creazione tabella 'accounts'
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS accounts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            abbreviation TEXT
-        );
+    # Creazione tabella 'apps'
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS apps (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        folder TEXT NOT NULL
+    );
+    """)
+
+    # Aggiungi colonne 'order' e 'is_hidden' alle tabelle 'accounts' e 'apps' se non esistono
+    for table in ('accounts', 'apps'):
+        columns = _column_names(cursor, table)
+        if 'order' not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN 'order' INTEGER DEFAULT 0;")
+            print(f"Colonna 'order' aggiunta alla tabella '{table}'.")
+        if 'is_hidden' not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN is_hidden INTEGER DEFAULT 0;")
+            print(f"Colonna 'is_hidden' aggiunta alla tabella '{table}'.")
+
+    # Creazione tabella di collegamento 'app_accounts'
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS app_accounts (
+        app_id INTEGER,
+        account_id INTEGER,
+        FOREIGN KEY (app_id) REFERENCES apps (id),
+        FOREIGN KEY (account_id) REFERENCES accounts (id),
+        PRIMARY KEY (app_id, account_id)
+    );
+    """)
+
+    # Creazione tabella 'users' per l'autenticazione locale
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        is_admin INTEGER DEFAULT 0
+    );
+    """)
+
+def _migration_002_indexes(cursor):
+    """
+    Indici secondari:
+    - app_accounts(account_id, app_id): ricerca delle associazioni di un account
+      (es. eliminazione di un account) senza scansione completa della tabella.
+    - apps/accounts(is_hidden, "order", name): elenco delle voci visibili già ordinato.
+    """
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_app_accounts_account ON app_accounts (account_id, app_id);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_apps_visible_order ON apps (is_hidden, "order", name);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_accounts_visible_order ON accounts (is_hidden, "order", name);')
+
+def _migration_003_keyset_indexes(cursor):
+    """
+    Indici per la paginazione keyset di /api/manage/data/<kind> su ("order", name, id),
+    con e senza filtro per cartella. I valori NULL di "order" diventano 0, perché il
+    confronto tra chiavi non è definito su NULL.
+    """
+    cursor.execute('UPDATE apps SET "order" = 0 WHERE "order" IS NULL;')
+    cursor.execute('UPDATE accounts SET "order" = 0 WHERE "order" IS NULL;')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_apps_order ON apps ("order", name);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_accounts_order ON accounts ("order", name);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_apps_folder_order ON apps (folder, "order", name);')
+
+def _migration_004_search_index(cursor):
+    """
+    Indice full-text FTS5 'search_index' su nome e cartella delle app e su nome e abbreviazione
+    degli account, usato da /api/search. Il rowid codifica la voce indicizzata
+    (id * 2 per le app, id * 2 + 1 per gli account), così i trigger aggiornano o eliminano
+    la riga corrispondente senza scansioni. I trigger tengono l'indice allineato anche per
+    le scritture fatte fuori dall'applicazione (es. import_data.py).
+    """
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        kind UNINDEXED,
+        name,
+        folder,
+        abbreviation,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    );
+    """)
+    cursor.execute("""
+    INSERT INTO search_index (rowid, kind, name, folder, abbreviation)
+    SELECT id * 2, 'app', name, folder, NULL FROM apps;
+    """)
+    cursor.execute("""
+    INSERT INTO search_index (rowid, kind, name, folder, abbreviation)
+    SELECT id * 2 + 1, 'account', name, NULL, abbreviation FROM accounts;
+    """)
+
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS apps_search_insert AFTER INSERT ON apps BEGIN
+        INSERT INTO search_index (rowid, kind, name, folder, abbreviation)
+        VALUES (new.id * 2, 'app', new.name, new.folder, NULL);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS apps_search_update AFTER UPDATE OF name, folder ON apps BEGIN
+        UPDATE search_index SET name = new.name, folder = new.folder WHERE rowid = old.id * 2;
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS apps_search_delete AFTER DELETE ON apps BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 2;
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS accounts_search_insert AFTER INSERT ON accounts BEGIN
+        INSERT INTO search_index (rowid, kind, name, folder, abbreviation)
+        VALUES (new.id * 2 + 1, 'account', new.name, NULL, new.abbreviation);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS accounts_search_update AFTER UPDATE OF name, abbreviation ON accounts BEGIN
+        UPDATE search_index SET name = new.name, abbreviation = new.abbreviation WHERE rowid = old.id * 2 + 1;
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS accounts_search_delete AFTER DELETE ON accounts BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 2 + 1;
+    END;
+    """)
+
+def _migration_005_import_state(cursor):
+    """
+    Tabelle usate da import_data.py per l'importazione incrementale:
+    - import_rows: hash del contenuto di ogni riga importata, per foglio e chiave della riga.
+    - import_sheets: hash complessivo di ogni foglio e data dell'ultima importazione.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS import_rows (
+        sheet TEXT NOT NULL,
+        row_key TEXT NOT NULL,
+        row_hash TEXT NOT NULL,
+        PRIMARY KEY (sheet, row_key)
+    ) WITHOUT ROWID;
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS import_sheets (
+        sheet TEXT PRIMARY KEY,
+        content_hash TEXT NOT NULL,
+        imported_at TEXT NOT NULL
+    );
+    """)
+
+def _migration_006_change_log(cursor):
+    """
+    Registro delle modifiche 'change_log' usato da /api/changes per la sincronizzazione
+    incrementale. Ogni inserimento, modifica o eliminazione su apps, accounts e app_accounts
+    aggiunge, tramite trigger, una riga con una versione crescente (AUTOINCREMENT: i numeri
+    non vengono mai riutilizzati, nemmeno dopo la compattazione). I trigger coprono anche
+    le scritture fatte fuori dall'applicazione.
+    'change_log_meta' conserva la versione minima ancora ricostruibile ('floor') dopo la compattazione.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS change_log (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        related_id INTEGER,
+        op TEXT NOT NULL,
+        changed_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS change_log_meta (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    """)
+    cursor.execute("INSERT OR IGNORE INTO change_log_meta (name, value) VALUES ('floor', 0);")
+
+    for table in ('apps', 'accounts'):
+        for event, op, ref in (('INSERT', 'upsert', 'new'), ('UPDATE', 'upsert', 'new'), ('DELETE', 'delete', 'old')):
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_change_log_{event.lower()} AFTER {event} ON {table} BEGIN
+                INSERT INTO change_log (entity, entity_id, op) VALUES ('{table}', {ref}.id, '{op}');
+            END;
+            """)
+    for event, op, ref in (('INSERT', 'upsert', 'new'), ('DELETE', 'delete', 'old')):
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS app_accounts_change_log_{event.lower()} AFTER {event} ON app_accounts BEGIN
+            INSERT INTO change_log (entity, entity_id, related_id, op) VALUES ('app_accounts', {ref}.app_id, {ref}.account_id, '{op}');
+        END;
         """)
 
-        # Aggiungi colonne 'order' e 'is_hidden' alla tabella 'accounts' se non esistono
-        try:
-            cursor.execute("ALTER TABLE accounts ADD COLUMN 'order' INTEGER DEFAULT 0;")
-            print("Colonna 'order' aggiunta alla tabella 'accounts'.")
-        except sqlite3.OperationalError:
-            pass # Colonna già esistente
-        try:
-            cursor.execute("ALTER TABLE accounts ADD COLUMN is_hidden INTEGER DEFAULT 0;")
-            print("Colonna 'is_hidden' aggiunta alla tabella 'accounts'.")
-        except sqlite3.OperationalError:
-            pass # Colonna già esistente
+def _migration_007_maintenance_state(cursor):
+    """
+    Tabelle usate dalla manutenzione periodica di Script/app.py, condivise tra i worker:
+    - maintenance_runs: ultima esecuzione, durata ed esito di ogni attività;
+    - maintenance_lease: il worker che sta eseguendo la manutenzione e fino a quando (al più
+      una riga), così due worker non la eseguono contemporaneamente.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS maintenance_runs (
+        task TEXT PRIMARY KEY,
+        last_run REAL NOT NULL,
+        seconds REAL NOT NULL,
+        result TEXT NOT NULL
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS maintenance_lease (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    """)
 
-        # Creazione tabella 'apps'
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS apps (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            folder TEXT NOT NULL
-        );
+def _migration_008_incremental_vacuum(cursor):
+    """
+    auto_vacuum = INCREMENTAL: le pagine lasciate libere da eliminazioni e importazioni
+    restano nel file finché incremental_vacuum() non le restituisce al sistema.
+    Su un database con tabelle la modalità cambia solo ricostruendo il file con VACUUM, che
+    non può essere eseguito in una transazione (vedi 'transactional' in migrate()).
+    """
+    if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+
+_migration_008_incremental_vacuum.transactional = False
+
+def _migration_009_order_not_null(cursor):
+    """
+    Riporta a 0 i valori NULL di "order" scritti dalle PUT senza 'order' prima che
+    mantenessero il valore attuale: come nella migrazione 3, il confronto tra chiavi della
+    paginazione keyset non è definito su NULL.
+    """
+    cursor.execute('UPDATE apps SET "order" = 0 WHERE "order" IS NULL;')
+    cursor.execute('UPDATE accounts SET "order" = 0 WHERE "order" IS NULL;')
+
+def _migration_010_change_log_epoch(cursor):
+    """
+    Epoca casuale del registro delle modifiche, in change_log_meta: insieme alla versione
+    identifica il contenuto di questo database (es. nelle ETag), anche rispetto a un altro
+    database con lo stesso numero di modifiche o a uno ricreato da zero. Il ripristino di una
+    copia ne assegna una nuova (vedi Dati/backup.py).
+    """
+    cursor.execute("INSERT OR REPLACE INTO change_log_meta (name, value) VALUES ('epoch', random());")
+
+def _migration_011_users_version(cursor):
+    """
+    Versione della tabella users in change_log_meta ('users'), aumentata dai trigger a ogni
+    modifica degli utenti (anche da setup_admin.py): la cache degli utenti di Script/app.py
+    si svuota solo quando cambia questa, non a ogni scrittura su app e account.
+    """
+    cursor.execute("INSERT OR IGNORE INTO change_log_meta (name, value) VALUES ('users', 0);")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS users_version_{event.lower()} AFTER {event} ON users BEGIN
+            UPDATE change_log_meta SET value = value + 1 WHERE name = 'users';
+        END;
         """)
 
-        # Aggiungi colonne 'order' e 'is_hidden' alla tabella 'apps' se non esistono
-        try:
-            cursor.execute("ALTER TABLE apps ADD COLUMN 'order' INTEGER DEFAULT 0;")
-            print("Colonna 'order' aggiunta alla tabella 'apps'.")
-        except sqlite3.OperationalError:
-            pass # Colonna già esistente
+# Elenco ordinato delle migrazioni: (versione, descrizione, funzione).
+# La versione applicata è salvata in PRAGMA user_version; per modificare lo schema si
+# aggiunge una nuova voce in coda, senza mai modificare quelle già rilasciate.
+MIGRATIONS = [
+    (1, "schema di base", _migration_001_base_schema),
+    (2, "indici su app_accounts, apps e accounts", _migration_002_indexes),
+    (3, "indici per la paginazione di apps e accounts", _migration_003_keyset_indexes),
+    (4, "indice full-text per la ricerca", _migration_004_search_index),
+    (5, "stato dell'importazione incrementale", _migration_005_import_state),
+    (6, "registro delle modifiche per la sincronizzazione", _migration_006_change_log),
+    (7, "stato della manutenzione periodica", _migration_007_maintenance_state),
+    (8, "auto_vacuum incrementale", _migration_008_incremental_vacuum),
+    (9, "valori NULL dell'ordine riportati a 0", _migration_009_order_not_null),
+    (10, "epoca del registro delle modifiche", _migration_010_change_log_epoch),
+    (11, "versione della tabella users", _migration_011_users_version),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate(conn):
+    """
+    Applica in ordine le migrazioni non ancora eseguite, ognuna nella propria transazione
+    insieme all'aggiornamento di PRAGMA user_version.
+    Le migrazioni con l'attributo transactional = False (es. quelle che eseguono VACUUM)
+    vengono eseguite fuori da una transazione: devono quindi poter essere ripetute.
+    Restituisce l'elenco delle versioni applicate.
+    """
+    current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+        cursor = conn.cursor()
+        if not getattr(migration, 'transactional', True):
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            print(f"Migrazione {version} applicata: {description}.")
+            applied.append(version)
+            continue
+        cursor.execute('BEGIN')
         try:
-            cursor.execute("ALTER TABLE apps ADD COLUMN is_hidden INTEGER DEFAULT 0;")
-            print("Colonna 'is_hidden' aggiunta alla tabella 'apps'.")
-        except sqlite3.OperationalError:
-            pass # Colonna già esistente
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            cursor.execute('COMMIT')
+        except sqlite3.Error:
+            cursor.execute('ROLLBACK')
+            raise
+        print(f"Migrazione {version} applicata: {description}.")
+        applied.append(version)
+    return applied
 
-        # Creazione tabella di collegamento 'app_accounts'
+def compact_change_log(conn, retention_seconds=7 * 24 * 3600, max_rows=100000):
+    """
+    Compatta il registro delle modifiche:
+    - per ogni riga modificata più volte tiene solo la modifica più recente (chi si sincronizza
+      riceve comunque lo stato finale della riga);
+    - elimina le modifiche più vecchie di retention_seconds o oltre le ultime max_rows, alzando
+      la versione 'floor': i client fermi a una versione precedente ricevono un'istantanea completa.
+    Restituisce (righe eliminate, nuova floor).
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
         cursor.execute("""
-        CREATE TABLE IF NOT EXISTS app_accounts (
-            app_id INTEGER,
-            account_id INTEGER,
-            FOREIGN KEY (app_id) REFERENCES apps (id),
-            FOREIGN KEY (account_id) REFERENCES accounts (id),
-            PRIMARY KEY (app_id, account_id)
-        );
+            DELETE FROM change_log WHERE version NOT IN (
+                SELECT MAX(version) FROM change_log GROUP BY entity, entity_id, related_id
+            )
         """)
+        removed = cursor.rowcount
+        floor = cursor.execute("SELECT value FROM change_log_meta WHERE name = 'floor'").fetchone()[0]
+        by_age = cursor.execute(
+            "SELECT MAX(version) FROM change_log WHERE changed_at < CAST(strftime('%s', 'now') AS INTEGER) - ?",
+            (retention_seconds,)
+        ).fetchone()[0]
+        by_size = cursor.execute(
+            'SELECT version FROM change_log ORDER BY version DESC LIMIT 1 OFFSET ?', (max_rows,)
+        ).fetchone()
+        new_floor = max(floor, by_age or 0, by_size[0] if by_size else 0)
+        if new_floor > floor:
+            cursor.execute('DELETE FROM change_log WHERE version <= ?', (new_floor,))
+            removed += cursor.rowcount
+            cursor.execute("UPDATE change_log_meta SET value = ? WHERE name = 'floor'", (new_floor,))
+        cursor.execute('COMMIT')
+    except sqlite3.Error:
+        cursor.execute('ROLLBACK')
+        raise
+    return removed, new_floor
 
-        # Creazione tabella 'users' per l'autenticazione locale
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password_hash TEXT NOT NULL,
-            is_admin INTEGER DEFAULT 0
-        );
-        """)
+# --- Manutenzione (eseguita periodicamente da Script/app.py o con 'python Dati/database.py maintenance') ---
+
+def incremental_vacuum(conn, max_pages=0):
+    """
+    Restituisce al sistema fino a max_pages pagine libere (0 = tutte) con PRAGMA
+    incremental_vacuum; serve auto_vacuum = INCREMENTAL (migrazione 8).
+    Restituisce il numero di pagine liberate.
+    """
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if before:
+        # executescript esegue il PRAGMA fino in fondo: execute() libererebbe una sola pagina
+        conn.executescript(f'PRAGMA incremental_vacuum({int(max_pages)});')
+    return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+def analyze_db(conn, analysis_limit=0):
+    """
+    Ricalcola le statistiche del query planner con ANALYZE. Con analysis_limit > 0 ogni indice
+    viene esaminato solo in parte (statistiche approssimate, ma in una frazione del tempo).
+    """
+    conn.execute(f'PRAGMA analysis_limit = {int(analysis_limit)}')
+    conn.execute('ANALYZE')
+
+def optimize_db(conn):
+    """Esegue PRAGMA optimize, che aggiorna solo le statistiche che ne hanno bisogno."""
+    conn.execute('PRAGMA optimize')
+
+def checkpoint_wal(conn):
+    """
+    Riporta nel database le pagine del file WAL e lo tronca a zero byte
+    (PRAGMA wal_checkpoint(TRUNCATE)). Restituisce (busy, pagine nel WAL, pagine riportate):
+    busy = 1 se lettori o scrittori attivi hanno impedito di completare il checkpoint.
+    """
+    return tuple(conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone())
 
-        conn.commit()
-        print(f"Database '{DB_FILE}' creato e tabelle inizializzate con successo.")
+def init_db(db_file=None):
+    """
+    Crea il database (predefinito: DB_FILE) se non esiste e lo porta all'ultima versione dello
+    schema applicando le migrazioni mancanti; aggiorna poi le statistiche usate dal query planner.
+    """
+    db_file = db_file or DB_FILE
+    conn = None
+    try:
+        # Si connette al database (lo crea se non esiste); le transazioni sono gestite da migrate()
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        applied = migrate(conn)
+
+        # Statistiche aggiornate per la scelta degli indici
+        if applied:
+            conn.execute('ANALYZE;')
+        conn.execute('PRAGMA optimize;')
+
+        print(f"Database '{db_file}' creato e tabelle inizializzate con successo (schema versione {SCHEMA_VERSION}).")
 
     except sqlite3.Error as e:
         print(f"Errore durante l'inizializzazione del database: {e}")
@@ -90,5 +451,35 @@ def init_db():
             conn.close()
 
 if __name__ == '__main__':
-    print("Inizializzazione del database...")
-    init_db()
+    # python Dati/database.py [compact-changes | maintenance] [--device <nome>]
+    db_file = DB_FILE
+    if '--device' in sys.argv[1:-1]:
+        db_file = device_db_file(sys.argv[sys.argv.index('--device') + 1])
+    if len(sys.argv) > 1 and sys.argv[1] == 'compact-changes':
+        # Pensato per essere eseguito periodicamente (es. da cron)
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        try:
+            removed, floor = compact_change_log(conn)
+        finally:
+            conn.close()
+        print(f"Registro delle modifiche compattato: {removed} righe eliminate, versione minima {floor}.")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'maintenance':
+        # Manutenzione completa, da eseguire a mano o da cron quando l'applicazione non la esegue
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        try:
+            removed, floor = compact_change_log(conn)
+            print(f"Registro delle modifiche compattato: {removed} righe eliminate, versione minima {floor}.")
+            print(f"Pagine libere restituite: {incremental_vacuum(conn)}.")
+            analyze_db(conn)
+            optimize_db(conn)
+            print("Statistiche aggiornate.")
+            busy, log_pages, checkpointed = checkpoint_wal(conn)
+            if log_pages < 0:
+                print("Checkpoint non necessario: il database non è in modalità WAL.")
+            else:
+                print(f"Checkpoint del WAL: {checkpointed} pagine su {log_pages}{' (incompleto, database in uso)' if busy else ''}.")
+        finally:
+            conn.close()
+    else:
+        print("Inizializzazione del database...")
+        init_db(db_file)
@@ -0,0 +1,122 @@
+import sqlite3
+import os
+import sys
+import csv
+import argparse
+from openpyxl import Workbook
+
+# Aggiunge la directory dello script al path, come negli altri script della cartella Dati
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Definisce i percorsi relativi alla posizione dello script
+BASE_DIR = os.path.dirname(__file__)
+DB_FILE = os.path.join(BASE_DIR, 'gestione.db')
+
+# Stessa struttura letta da import_data.py
+ACCOUNT_SHEET = 'Account'
+ACCOUNT_HEADER = ('indirizzo email', 'abbreviazione')
+APP_SHEET = 'POCO'
+APP_HEADER = ('Cartella', 'Nome App')
+LINK_MARK = 'x' # Valore scritto nelle celle della matrice per un'associazione
+
+def iter_account_rows(conn):
+    """Genera le righe del foglio 'Account': prima l'intestazione, poi un account per riga."""
+    yield ACCOUNT_HEADER
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    yield from cursor.execute('SELECT name, abbreviation FROM accounts ORDER BY "order", name')
+
+def iter_app_rows(conn):
+    """
+    Genera le righe del foglio 'POCO': l'intestazione contiene 'Cartella', 'Nome App' e una
+    colonna per ogni account (la matrice delle associazioni), poi un'app per riga con LINK_MARK
+    nelle colonne degli account collegati. Le app vengono lette in streaming dal cursore: in
+    memoria restano solo l'elenco degli account e la riga corrente.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    accounts = cursor.execute('SELECT id, name FROM accounts ORDER BY "order", name').fetchall()
+    column_of = {account_id: index for index, (account_id, _) in enumerate(accounts)}
+    yield APP_HEADER + tuple(name.strip() for _, name in accounts)
+
+    current_id = None
+    row = None
+    for app_id, folder, name, account_id in cursor.execute("""
+        SELECT a.id, a.folder, a.name, aa.account_id
+        FROM apps a
+        LEFT JOIN app_accounts aa ON aa.app_id = a.id
+        ORDER BY a.folder, a."order", a.name
+    """):
+        if app_id != current_id:
+            if row is not None:
+                yield tuple(row)
+            current_id = app_id
+            row = [folder, name] + [None] * len(accounts)
+        if account_id in column_of:
+            row[len(APP_HEADER) + column_of[account_id]] = LINK_MARK
+    if row is not None:
+        yield tuple(row)
+
+SHEET_ROWS = {ACCOUNT_SHEET: iter_account_rows, APP_SHEET: iter_app_rows}
+
+def write_xlsx(conn, output):
+    """
+    Scrive l'intera esportazione (fogli 'Account' e 'POCO') in formato XLSX su 'output'
+    (percorso o file binario). Usa openpyxl in modalità write_only, che tiene le righe su
+    file temporanei invece che in memoria.
+    """
+    workbook = Workbook(write_only=True)
+    for sheet, iter_rows in SHEET_ROWS.items():
+        worksheet = workbook.create_sheet(sheet)
+        for row in iter_rows(conn):
+            worksheet.append(row)
+    workbook.save(output)
+
+class _LineBuffer:
+    """Raccoglie l'output di csv.writer riga per riga, per poterlo inviare in streaming."""
+    def __init__(self):
+        self.data = ''
+
+    def write(self, text):
+        self.data += text
+
+def iter_csv(conn, sheet=APP_SHEET):
+    """Genera, una riga alla volta, il foglio indicato in formato CSV."""
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    for row in SHEET_ROWS[sheet](conn):
+        writer.writerow(row)
+        yield buffer.data
+        buffer.data = ''
+
+def export_data(output, file_format='xlsx', sheet=APP_SHEET, db_file=None):
+    """
+    Esporta account, app e associazioni dal database nel file 'output', nella stessa struttura
+    letta da import_data.py. Le letture avvengono in un'unica transazione, così l'esportazione
+    è una fotografia coerente anche se il database viene modificato nel frattempo.
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file or DB_FILE)
+        conn.execute('BEGIN')
+        if file_format == 'xlsx':
+            write_xlsx(conn, output)
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as csv_file:
+                for line in iter_csv(conn, sheet):
+                    csv_file.write(line)
+        print(f"Esportazione completata: '{output}'.")
+    except sqlite3.Error as e:
+        print(f"Errore durante l'esportazione dei dati: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Esporta app, account e associazioni dal database.")
+    parser.add_argument('output', help="File da creare (.xlsx oppure .csv)")
+    parser.add_argument('--sheet', choices=list(SHEET_ROWS), default=APP_SHEET,
+                        help="Foglio da esportare in formato CSV (predefinito: POCO)")
+    args = parser.parse_args()
+    export_format = 'csv' if args.output.lower().endswith('.csv') else 'xlsx'
+    export_data(args.output, export_format, args.sheet)
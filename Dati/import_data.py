@@ -1,7 +1,14 @@
-import pandas as pd
 import sqlite3
 import os
+import io
 import sys
+import time
+import hashlib
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from openpyxl import load_workbook
 
 # Aggiunge la directory dello script al path per permettere l'import di 'database'
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -11,74 +18,375 @@ BASE_DIR = os.path.dirname(__file__)
 XLSX_FILE = os.path.join(BASE_DIR, 'AppCell.xlsx')
 DB_FILE = os.path.join(BASE_DIR, 'gestione.db')
 
-def import_data():
+IMPORT_BATCH_SIZE = 1000 # Righe scritte per ogni executemany
+
+# Nel foglio 'POCO' ogni colonna diversa da queste è una colonna della matrice delle associazioni:
+# l'intestazione è il nome (indirizzo email) o l'abbreviazione di un account e una cella
+# compilata (es. 'x', 1, 'sì') collega l'app della riga a quell'account.
+ASSOCIATION_SHEET = 'POCO'
+APP_COLUMNS = ('Cartella', 'Nome App')
+ASSOCIATION_ROW_KEY_SHEET = 'POCO:associazioni' # Chiave per gli hash in import_rows
+UNMARKED_VALUES = {'', '0', '-', 'n', 'no', 'false', 'falso'}
+
+def iter_sheet_records(workbook, sheet_name):
+    """
+    Legge un foglio in streaming (openpyxl in modalità read_only) e genera, per ogni riga
+    non vuota, un dizionario {intestazione di colonna: valore}. La prima riga è l'intestazione.
+    """
+    rows = workbook[sheet_name].iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [(index, str(title).strip()) for index, title in enumerate(header) if title is not None]
+    for row in rows:
+        if not row or all(value is None for value in row):
+            continue
+        yield {title: (row[index] if index < len(row) else None) for index, title in columns}
+
+def _text(value):
+    """Restituisce il valore come testo senza spazi iniziali e finali, oppure None se vuoto."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def normalize_account(record):
+    """
+    Normalizza una riga del foglio 'Account' (colonne 'indirizzo email', 'abbreviazione').
+    Restituisce (chiave, valori da scrivere) oppure None se la riga non ha un indirizzo.
+    """
+    name = record.get('indirizzo email')
+    # Il nome è salvato così come compare nel foglio, per restare allineato agli account già importati
+    if not isinstance(name, str) or not name.strip():
+        return None
+    return name, (name, _text(record.get('abbreviazione')))
+
+def normalize_app(record):
+    """
+    Normalizza una riga del foglio 'POCO' (colonne 'Nome App', 'Cartella').
+    Restituisce (chiave, valori da scrivere) oppure None se la riga non ha il nome dell'app.
+    """
+    app_name = record.get('Nome App')
+    if not isinstance(app_name, str) or not app_name.strip():
+        return None
+    folder_name = _text(record.get('Cartella')) or 'Senza cartella'
+    if folder_name == 'Telefono':
+        folder_name = 'Schermata Principale'
+    return app_name.strip(), (app_name.strip(), folder_name)
+
+# Fogli da importare, nell'ordine in cui vengono elaborati.
+# Gli UPSERT aggiornano una riga esistente solo se i valori sono davvero cambiati.
+SHEETS = [
+    {
+        'sheet': 'Account',
+        'table': 'accounts',
+        'normalize': normalize_account,
+        'existing': 'SELECT name FROM accounts',
+        'upsert': """
+            INSERT INTO accounts (name, abbreviation) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET abbreviation = excluded.abbreviation
+            WHERE abbreviation IS NOT excluded.abbreviation
+        """,
+    },
+    {
+        'sheet': 'POCO',
+        'table': 'apps',
+        'normalize': normalize_app,
+        'existing': 'SELECT name FROM apps',
+        'upsert': """
+            INSERT INTO apps (name, folder) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET folder = excluded.folder
+            WHERE folder IS NOT excluded.folder
+        """,
+    },
+]
+
+def _row_hash(values):
+    """Hash del contenuto normalizzato di una riga."""
+    raw = '\x1f'.join('' if value is None else str(value) for value in values)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+def import_sheet(cursor, workbook, spec, full=False):
+    """
+    Importa un foglio in modo incrementale: le righe vengono lette in streaming, normalizzate
+    e confrontate con l'hash salvato nell'importazione precedente; solo quelle nuove o cambiate
+    vengono scritte, a blocchi di IMPORT_BATCH_SIZE con executemany. Una riga invariata viene
+    comunque riscritta se nel frattempo è stata eliminata dalla tabella (es. dall'API).
+    Con full=True gli hash salvati vengono ignorati e tutte le righe vengono riscritte.
+    Restituisce le statistiche del foglio.
+    """
+    sheet = spec['sheet']
+    stats = {'read': 0, 'written': 0, 'unchanged': 0, 'duplicate': 0, 'invalid': 0}
+    start = time.perf_counter()
+
+    stored = {} if full else dict(cursor.execute(
+        'SELECT row_key, row_hash FROM import_rows WHERE sheet = ?', (sheet,)
+    ))
+    existing = {key for key, in cursor.execute(spec['existing'])} if stored else set()
+    sheet_hash = hashlib.blake2b(digest_size=16)
+    seen = set()
+    rows, hashes = [], []
+
+    def flush():
+        cursor.executemany(spec['upsert'], rows)
+        cursor.executemany(
+            'INSERT INTO import_rows (sheet, row_key, row_hash) VALUES (?, ?, ?) '
+            'ON CONFLICT(sheet, row_key) DO UPDATE SET row_hash = excluded.row_hash',
+            hashes
+        )
+        stats['written'] += len(rows)
+        rows.clear()
+        hashes.clear()
+
+    for record in iter_sheet_records(workbook, sheet):
+        normalized = spec['normalize'](record)
+        if normalized is None:
+            stats['invalid'] += 1
+            continue
+        key, values = normalized
+        stats['read'] += 1
+        if key in seen:
+            # Come nelle importazioni precedenti, vale la prima riga con lo stesso nome
+            stats['duplicate'] += 1
+            continue
+        seen.add(key)
+        row_hash = _row_hash(values)
+        sheet_hash.update(row_hash.encode('ascii'))
+        if stored.get(key) == row_hash and key in existing:
+            stats['unchanged'] += 1
+            continue
+        rows.append(values)
+        hashes.append((sheet, key, row_hash))
+        if len(rows) >= IMPORT_BATCH_SIZE:
+            flush()
+    if rows:
+        flush()
+
+    cursor.execute(
+        'INSERT INTO import_sheets (sheet, content_hash, imported_at) VALUES (?, ?, ?) '
+        'ON CONFLICT(sheet) DO UPDATE SET content_hash = excluded.content_hash, imported_at = excluded.imported_at',
+        (sheet, sheet_hash.hexdigest(), datetime.now(timezone.utc).isoformat(timespec='seconds'))
+    )
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+def _is_marked(value):
+    """Indica se una cella della matrice delle associazioni è compilata."""
+    if value is None:
+        return False
+    if isinstance(value, (bool, int, float)):
+        return bool(value)
+    return str(value).strip().lower() not in UNMARKED_VALUES
+
+def _account_lookup(cursor):
+    """
+    Costruisce una sola volta il dizionario {etichetta: id account} usato per interpretare le
+    intestazioni della matrice: vale il nome dell'account e, se non ambigua, la sua abbreviazione.
+    """
+    accounts = cursor.execute('SELECT id, name, abbreviation FROM accounts').fetchall()
+    lookup = {name.strip().lower(): account_id for account_id, name, _ in accounts}
+    for account_id, _, abbreviation in accounts:
+        if abbreviation:
+            lookup.setdefault(abbreviation.strip().lower(), account_id)
+    return lookup
+
+def import_associations(cursor, workbook, full=False):
+    """
+    Importa la matrice app-account dalle colonne aggiuntive del foglio 'POCO'.
+    App e account vengono risolti tramite dizionari in memoria caricati una volta sola.
+    Per ogni app le associazioni con gli account presenti come colonna vengono allineate al
+    foglio (aggiunte le celle compilate, rimosse quelle vuote); gli altri account non vengono
+    toccati. Le righe con hash invariato rispetto all'importazione precedente vengono saltate,
+    purché i collegamenti nel database corrispondano ancora al foglio.
+    Restituisce le statistiche della fase.
+    """
+    stats = {'apps': 0, 'added': 0, 'removed': 0, 'unchanged': 0, 'columns': 0, 'unknown_columns': []}
+    start = time.perf_counter()
+
+    account_lookup = _account_lookup(cursor)
+    app_ids = dict(cursor.execute('SELECT name, id FROM apps'))
+    stored = {} if full else dict(cursor.execute(
+        'SELECT row_key, row_hash FROM import_rows WHERE sheet = ?', (ASSOCIATION_ROW_KEY_SHEET,)
+    ))
+    links = {} # id app -> id degli account collegati, per verificare le righe invariate
+    if stored:
+        for app_id, account_id in cursor.execute('SELECT app_id, account_id FROM app_accounts'):
+            links.setdefault(app_id, set()).add(account_id)
+
+    matrix = None # [(intestazione, id account)] per le colonne riconosciute
+    seen = set()
+    additions, removals, hashes = [], [], []
+
+    def flush():
+        cursor.executemany('INSERT OR IGNORE INTO app_accounts (app_id, account_id) VALUES (?, ?)', additions)
+        stats['added'] += max(cursor.rowcount, 0)
+        cursor.executemany('DELETE FROM app_accounts WHERE app_id = ? AND account_id = ?', removals)
+        stats['removed'] += max(cursor.rowcount, 0)
+        cursor.executemany(
+            'INSERT INTO import_rows (sheet, row_key, row_hash) VALUES (?, ?, ?) '
+            'ON CONFLICT(sheet, row_key) DO UPDATE SET row_hash = excluded.row_hash',
+            hashes
+        )
+        additions.clear()
+        removals.clear()
+        hashes.clear()
+
+    for record in iter_sheet_records(workbook, ASSOCIATION_SHEET):
+        if matrix is None:
+            matrix = []
+            for title in record:
+                if title in APP_COLUMNS:
+                    continue
+                account_id = account_lookup.get(title.lower())
+                if account_id is None:
+                    stats['unknown_columns'].append(title)
+                else:
+                    matrix.append((title, account_id))
+            stats['columns'] = len(matrix)
+            if not matrix:
+                break # Nessuna colonna di associazione: il foglio contiene solo le app
+            matrix_set = {account_id for _, account_id in matrix}
+            matrix_ids = sorted(matrix_set)
+
+        normalized = normalize_app(record)
+        if normalized is None or normalized[0] in seen or normalized[0] not in app_ids:
+            continue
+        app_name = normalized[0]
+        seen.add(app_name)
+        app_id = app_ids[app_name]
+        stats['apps'] += 1
+
+        linked = sorted({account_id for title, account_id in matrix if _is_marked(record.get(title))})
+        row_hash = _row_hash(linked + ['|'] + matrix_ids)
+        linked_set = set(linked)
+        if stored.get(app_name) == row_hash and links.get(app_id, set()) & matrix_set == linked_set:
+            stats['unchanged'] += 1
+            continue
+        additions.extend((app_id, account_id) for account_id in linked)
+        removals.extend((app_id, account_id) for account_id in matrix_ids if account_id not in linked_set)
+        hashes.append((ASSOCIATION_ROW_KEY_SHEET, app_name, row_hash))
+        if len(additions) + len(removals) >= IMPORT_BATCH_SIZE:
+            flush()
+    if additions or removals or hashes:
+        flush()
+
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+def import_data(xlsx_file=None, db_file=None, full=False):
     """
     Legge i dati dal file AppCell.xlsx e li importa nel database SQLite.
     - Legge il foglio 'Account' e popola la tabella 'accounts'.
     - Legge il foglio 'POCO' e popola la tabella 'apps'.
+    - Legge le colonne della matrice nel foglio 'POCO' e popola la tabella 'app_accounts'.
+    Tutte le scritture avvengono in un'unica transazione; le righe già importate e non
+    modificate nel file vengono saltate. Restituisce le statistiche per foglio.
     """
-    if not os.path.exists(XLSX_FILE):
-        print(f"ERRORE: Il file '{XLSX_FILE}' non è stato trovato. Assicurati che sia nella stessa cartella.")
-        return
+    xlsx_file = xlsx_file or XLSX_FILE
+    db_file = db_file or DB_FILE
+    if not os.path.exists(xlsx_file):
+        print(f"ERRORE: Il file '{xlsx_file}' non è stato trovato. Assicurati che sia nella stessa cartella.")
+        return None
 
     conn = None  # Inizializza conn a None per un corretto error handling
+    workbook = None
     try:
-        # --- Importazione Account ---
-        # Colonne corrette: 'indirizzo email', 'abbreviazione'
-        df_accounts = pd.read_excel(XLSX_FILE, sheet_name='Account')
-        df_accounts = df_accounts[['indirizzo email', 'abbreviazione']].dropna(subset=['indirizzo email'])
-
-        conn = sqlite3.connect(DB_FILE)
+        workbook = load_workbook(xlsx_file, read_only=True, data_only=True)
+        conn = sqlite3.connect(db_file, isolation_level=None)
         cursor = conn.cursor()
+        start = time.perf_counter()
+        cursor.execute('BEGIN')
+        results = {}
+        for spec in SHEETS:
+            results[spec['sheet']] = stats = import_sheet(cursor, workbook, spec, full)
+            print(f"Foglio '{spec['sheet']}' -> tabella '{spec['table']}': {stats['read']} righe lette, "
+                  f"{stats['written']} scritte, {stats['unchanged']} invariate, "
+                  f"{stats['duplicate']} duplicate, {stats['invalid']} scartate ({stats['seconds']}s).")
+
+        results['associazioni'] = stats = import_associations(cursor, workbook, full)
+        print(f"Associazioni dal foglio '{ASSOCIATION_SHEET}': {stats['columns']} colonne account, "
+              f"{stats['apps']} app elaborate ({stats['unchanged']} invariate), "
+              f"{stats['added']} collegamenti aggiunti, {stats['removed']} rimossi ({stats['seconds']}s).")
+        if stats['unknown_columns']:
+            print(f"ATTENZIONE: colonne non riconosciute come account: {', '.join(stats['unknown_columns'])}.")
 
-        # Inserisce gli account nel database
-        for index, row in df_accounts.iterrows():
-            try:
-                cursor.execute("INSERT INTO accounts (name, abbreviation) VALUES (?, ?)", 
-                               (row['indirizzo email'], row['abbreviazione']))
-            except sqlite3.IntegrityError:
-                print(f"Account '{row['indirizzo email']}' già presente, saltato.")
-        
-        print(f"Importati {len(df_accounts)} account dal foglio 'Account'.")
-
-        # --- Importazione App ---
-        # Colonne corrette: 'Nome App', 'Cartella'
-        df_apps = pd.read_excel(XLSX_FILE, sheet_name='POCO')
-
-        apps_imported_count = 0
-        for index, row in df_apps.iterrows():
-            app_name = row.get('Nome App')
-            folder_name = row.get('Cartella', 'Senza cartella')
-
-            if not isinstance(app_name, str) or not app_name.strip():
-                print(f"ATTENZIONE: Trovata una riga senza nome app nella cartella '{folder_name}'. Riga saltata.")
-                continue
-            
-            if folder_name == 'Telefono':
-                folder_name = 'Schermata Principale'
-
-            try:
-                cursor.execute("INSERT INTO apps (name, folder) VALUES (?, ?)", 
-                               (app_name.strip(), str(folder_name).strip()))
-                apps_imported_count += 1
-            except sqlite3.IntegrityError:
-                print(f"Applicazione '{app_name}' già presente, saltata.")
-
-        conn.commit()
-        print(f"Importate {apps_imported_count} app dal foglio 'POCO'.")
+        cursor.execute('COMMIT')
+        print(f"Importazione completata in {time.perf_counter() - start:.3f}s.")
+        return results
 
     except Exception as e:
+        if conn and conn.in_transaction:
+            conn.rollback()
         print(f"Si è verificato un errore durante l'importazione dei dati: {e}")
+        return None
     finally:
+        if workbook is not None:
+            workbook.close()
         if conn:
             conn.close()
 
+def _import_device(name, xlsx_file, full):
+    """
+    Crea o aggiorna il database del dispositivo 'name' e vi importa xlsx_file (in un processo
+    separato). Restituisce (nome, riuscita, messaggi stampati), per non mescolare l'output
+    delle importazioni eseguite in parallelo.
+    """
+    from database import init_db, device_db_file
+    db_file = device_db_file(name)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        init_db(db_file)
+        results = import_data(xlsx_file, db_file, full)
+    return name, results is not None, output.getvalue()
+
+def import_devices(workbooks, full=False, jobs=None):
+    """
+    Importa un file Excel per dispositivo ({nome: file}), ognuno nel proprio database
+    (Dati/devices/<nome>.db). Le importazioni sono indipendenti e vengono eseguite in parallelo
+    su 'jobs' processi (la lettura dei file Excel impegna la CPU, i thread non basterebbero).
+    Restituisce i nomi dei dispositivi la cui importazione non è riuscita.
+    """
+    failed = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_import_device, name, xlsx_file, full) for name, xlsx_file in workbooks.items()]
+        for future in as_completed(futures):
+            name, succeeded, output = future.result()
+            print(f"--- Dispositivo '{name}' ---")
+            print(output, end='')
+            if not succeeded:
+                failed.append(name)
+    return failed
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Importa app e account da un file Excel nel database.")
+    parser.add_argument('--file', default=XLSX_FILE, help="File Excel da importare (predefinito: AppCell.xlsx)")
+    parser.add_argument('--full', action='store_true', help="Riscrive tutte le righe ignorando le importazioni precedenti")
+    parser.add_argument('--device', action='append', metavar='NOME=FILE.xlsx', default=[],
+                        help="Importa FILE.xlsx nel database del dispositivo NOME (ripetibile; i file vengono importati in parallelo)")
+    parser.add_argument('--jobs', type=int, default=None, help="Importazioni contemporanee con --device (predefinito: numero di CPU)")
+    args = parser.parse_args()
+
+    if args.device:
+        workbooks = {}
+        for item in args.device:
+            name, separator, xlsx_file = item.partition('=')
+            if not separator or not xlsx_file:
+                parser.error(f"--device richiede NOME=FILE.xlsx, ricevuto '{item}'")
+            workbooks[name] = xlsx_file
+        from database import DEVICE_NAME
+        invalid = [name for name in workbooks if not DEVICE_NAME.match(name)]
+        if invalid:
+            parser.error(f"nomi di dispositivo non validi: {', '.join(invalid)} (lettere, cifre, '-' e '_')")
+        start = time.perf_counter()
+        failed = import_devices(workbooks, args.full, args.jobs)
+        print(f"\n{len(workbooks) - len(failed)} dispositivi importati su {len(workbooks)} in {time.perf_counter() - start:.3f}s.")
+        sys.exit(1 if failed else 0)
+
     from database import init_db
     print("Step 1: Inizializzazione del database...")
-    # init_db() cancella il db esistente. Eseguiamolo per essere sicuri di ripartire da zero.
+    # init_db() crea il database se manca e applica le migrazioni mancanti senza perdere i dati.
     init_db()
-    
+
     print("\nStep 2: Importazione dei dati da Excel...")
-    import_data()
-    print("\nProcesso completato.")
\ No newline at end of file
+    import_data(args.file, full=args.full)
+    print("\nProcesso completato.")
@@ -1,148 +1,1507 @@
 import sqlite3
 import os
-from flask import Flask, request, jsonify # Removed render_template, redirect, url_for, session, flash
+import threading
+import hashlib
+import bisect
+import base64
+import json
+import re
+import sys
+import tempfile
+import time
+import collections
+import queue
+import hmac
+import heapq
+import secrets
+import random
+import gzip
+import mimetypes
+import atexit
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+from flask import Flask, request, jsonify, g, stream_with_context, send_file, has_app_context # Removed render_template, redirect, url_for, session, flash
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS # New import for CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-# from functools import wraps # Removed as login_required is removed temporarily
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
+from functools import wraps
+try:
+    import orjson # Opzionale: serializzazione JSON più veloce (pip install orjson)
+except ImportError:
+    orjson = None
+try:
+    import brotli # Opzionale: compressione Brotli delle risposte (pip install brotli)
+except ImportError:
+    brotli = None
 
 # Creazione dell'applicazione Flask
 app = Flask(__name__) # Removed template_folder and static_folder as we are creating an API
 CORS(app) # Enable CORS for all routes
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', os.urandom(24)) # Usa una chiave sicura per le sessioni
 
-# Definisce il percorso del database nella cartella Dati
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Provider JSON di Flask basato su orjson: stesse regole del provider predefinito (chiavi
+    ordinate, indentazione in debug, stessi tipi extra tramite default()), ma serializza
+    direttamente in byte UTF-8 e molto più velocemente.
+    """
+    def _option(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._option(bool(kwargs.get('indent')))).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._option(indent)) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+# JSON_ENCODER: 'auto' usa orjson se installato, 'stdlib' forza il modulo json standard
+if orjson is not None and os.environ.get('JSON_ENCODER', 'auto') != 'stdlib':
+    app.json = OrjsonProvider(app)
+else:
+    app.json.ensure_ascii = False # UTF-8 senza escape come orjson: stesse risposte in tutti i worker
+
+# Definisce il percorso del database nella cartella Dati (sovrascrivibile con APPMANAGER_DB)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, '../Dati/gestione.db')
+DB_FILE = os.environ.get('APPMANAGER_DB', os.path.join(BASE_DIR, '../Dati/gestione.db'))
+
+# Rende importabili gli script della cartella Dati (es. export_data.py)
+sys.path.append(os.path.join(BASE_DIR, '../Dati'))
+from export_data import write_xlsx, iter_csv, SHEET_ROWS, APP_SHEET
+from database import compact_change_log, incremental_vacuum, analyze_db, optimize_db, checkpoint_wal
+from database import DEVICES_DIR as DEFAULT_DEVICES_DIR, DEVICE_NAME, device_db_file, list_devices
+from backup import create_backup, list_backups, find_backup, restore_backup
+
+# --- Configurazione delle connessioni SQLite ---
+# Tutti i valori possono essere cambiati tramite variabili d'ambiente senza toccare il codice.
+DB_POOL_ENABLED = os.environ.get('DB_POOL', '1') == '1' # Riutilizza le connessioni per thread
+DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL') # WAL: i lettori non bloccano chi scrive
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL') # NORMAL è sicuro in modalità WAL
+DB_CACHE_SIZE = int(os.environ.get('DB_CACHE_SIZE', '-16000')) # Valore negativo = KiB (circa 16 MB)
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', str(64 * 1024 * 1024))) # Byte mappati in memoria
+DB_BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', '5000')) # Millisecondi di attesa su lock
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '100000')) # Limite di coppie per /api/accounts/batch
+BATCH_CHUNK_SIZE = 400 # Coppie per query: 2 parametri ciascuna, sotto il limite storico di 999 di SQLite
+ORDER_GAP = int(os.environ.get('ORDER_GAP', '1024')) # Distanza tra i valori di "order" dopo un ribilanciamento
+PAGE_DEFAULT_LIMIT = 100 # Voci per pagina di /api/manage/data/<kind> se 'limit' non è indicato
+PAGE_MAX_LIMIT = 1000
+NDJSON_MIMETYPE = 'application/x-ndjson'
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 200
+REVERSE_LOOKUP_MAX_IDS = 500 # Account per richiesta in /api/accounts/apps
+EXPORT_SPOOL_SIZE = 8 * 1024 * 1024 # Oltre questa dimensione l'XLSX esportato passa da memoria a file temporaneo
+CHANGES_DEFAULT_LIMIT = 1000 # Righe modificate per risposta di /api/changes
+CHANGES_MAX_LIMIT = 10000
+CHANGE_LOG_COMPACT_INTERVAL = int(os.environ.get('CHANGE_LOG_COMPACT_INTERVAL', '3600')) # Secondi tra due compattazioni (manutenzione), 0 = disattivata
+CHANGE_LOG_RETENTION = int(os.environ.get('CHANGE_LOG_RETENTION', str(7 * 24 * 3600))) # Secondi di storico conservati
+CHANGE_LOG_MAX_ROWS = int(os.environ.get('CHANGE_LOG_MAX_ROWS', '100000'))
+EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', '15')) # Secondi tra due heartbeat di /api/events
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', '1')) # Controllo delle scritture di altri processi
+EVENTS_BUFFER_SIZE = 1000 # Notifiche recenti tenute in memoria per i client più lenti
+EVENTS_RETRY_MS = 3000 # Attesa suggerita al browser prima di riconnettersi
+GROUP_COMMIT_ENABLED = os.environ.get('GROUP_COMMIT', '0') == '1' # Scritture raccolte da un unico thread
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', '256')) # Operazioni per transazione
+GROUP_COMMIT_WINDOW = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', '0')) / 1000 # Attesa extra per raccogliere operazioni
+TOKEN_TTL = int(os.environ.get('TOKEN_TTL', str(12 * 3600))) # Durata dei token di accesso in secondi
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '0') == '1' # Se 1, le API rispondono 401 senza un token valido
+USER_CACHE_SIZE = 1024 # Utenti tenuti in memoria da get_cached_user()
+QUERY_TOKEN_ENDPOINTS = {'events_api'} # Endpoint che accettano il token anche in ?access_token=
+METRICS_ENABLED = os.environ.get('METRICS', '1') == '1' # Statistiche esposte su /metrics
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0.1')) # Frazione di richieste con le query misurate
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '0')) # Query più lente di così finiscono nel log (0 = disattivato)
+COMPRESS_ENABLED = os.environ.get('COMPRESS', '1') == '1' # Compressione gzip/brotli negoziata con Accept-Encoding
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024')) # Byte: sotto questa soglia non conviene
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+COMPRESS_MIMETYPES = {'application/json', 'text/plain'} # Le risposte in streaming non vengono compresse
+SERVE_FRONTEND = os.environ.get('SERVE_FRONTEND', '0') == '1' # Serve anche il frontend compilato
+FRONTEND_DIST = os.environ.get('FRONTEND_DIST', os.path.join(BASE_DIR, '../Frontend/dist'))
+FRONTEND_INLINE_APPS = os.environ.get('FRONTEND_INLINE_APPS', '0') == '1' # Inserisce /api/apps in index.html
+HASHED_ASSET = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$') # Nomi generati da Vite (nome-hash.ext)
+PRECOMPRESSED_SUFFIXES = (('br', '.br'), ('gzip', '.gz')) # File compressi in fase di build, in ordine di preferenza
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(BASE_DIR, '../Dati/backups')) # Copie create da /api/admin/backups
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', '10')) # Copie conservate dalla rotazione
+BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', '256')) # Pagine copiate per passo
+BACKUP_STEP_PAUSE = float(os.environ.get('BACKUP_STEP_PAUSE_MS', '5')) / 1000 # Pausa tra i passi per non rallentare le richieste
+MAINTENANCE_ENABLED = os.environ.get('MAINTENANCE', '1') == '1' # Manutenzione periodica del database in background
+MAINTENANCE_CHECK_INTERVAL = float(os.environ.get('MAINTENANCE_CHECK_INTERVAL', '30')) # Secondi tra due controlli
+MAINTENANCE_IDLE = float(os.environ.get('MAINTENANCE_IDLE', '5')) # Secondi senza richieste perché il worker sia inattivo
+MAINTENANCE_LEASE_TTL = 600 # Secondi dopo cui il lease di un worker scomparso può essere preso da un altro
+MAINTENANCE_BUSY_TIMEOUT = 1000 # Millisecondi: la manutenzione cede subito il passo alle scritture
+MAINTENANCE_VACUUM_PAGES = int(os.environ.get('MAINTENANCE_VACUUM_PAGES', '2000')) # Pagine liberate per esecuzione (0 = tutte)
+MAINTENANCE_ANALYSIS_LIMIT = int(os.environ.get('MAINTENANCE_ANALYSIS_LIMIT', '1000')) # Righe esaminate per indice da ANALYZE (0 = tutte)
+MAINTENANCE_INTERVALS = { # Secondi tra due esecuzioni di ogni attività, 0 = disattivata
+    'compact_change_log': CHANGE_LOG_COMPACT_INTERVAL,
+    'incremental_vacuum': int(os.environ.get('MAINTENANCE_VACUUM_INTERVAL', '3600')),
+    'optimize': int(os.environ.get('MAINTENANCE_OPTIMIZE_INTERVAL', '3600')),
+    'analyze': int(os.environ.get('MAINTENANCE_ANALYZE_INTERVAL', str(24 * 3600))),
+    'wal_checkpoint': int(os.environ.get('MAINTENANCE_CHECKPOINT_INTERVAL', '600')),
+}
+DEVICES_DIR = os.environ.get('DEVICES_DIR', DEFAULT_DEVICES_DIR) # Un database per dispositivo: <nome>.db
+DEFAULT_DEVICE = 'default' # Nome del dispositivo che usa DB_FILE
+DEVICE_HEADER = 'X-Device' # Alternativa al prefisso /devices/<nome>/ negli URL
+DEVICE_CACHE_SIZE = int(os.environ.get('DEVICE_CACHE_SIZE', '32')) # Dispositivi tenuti aperti oltre al predefinito
+DEVICE_IDLE_TIMEOUT = float(os.environ.get('DEVICE_IDLE_TIMEOUT', '600')) # Secondi senza richieste prima di chiudere un dispositivo
+DEVICE_FANOUT_WORKERS = int(os.environ.get('DEVICE_FANOUT_WORKERS', '8')) # Thread per le ricerche su tutti i dispositivi
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10) # Secondi
+
+# --- Metriche (/metrics) ---
+
+class Metrics:
+    """
+    Contatori e istogrammi in formato Prometheus. Ogni thread aggiorna una propria copia
+    (nessun lock sul percorso delle richieste); /metrics somma le copie di tutti i thread.
+    Le copie dei thread terminati vengono accorpate in una sola alla lettura successiva.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = [] # (thread, copia)
+        self._retired = self._new_shard()
+
+    @staticmethod
+    def _new_shard():
+        return {'counters': collections.defaultdict(float), 'histograms': {}}
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._new_shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        """Incrementa il contatore 'name' con le etichette indicate (tupla di coppie)."""
+        self._shard()['counters'][(name, labels)] += value
+
+    def observe(self, name, labels, value):
+        """Registra 'value' nell'istogramma 'name' (conteggi per bucket, poi la somma)."""
+        histograms = self._shard()['histograms']
+        histogram = histograms.get((name, labels))
+        if histogram is None:
+            histogram = histograms[(name, labels)] = [0] * (len(METRICS_BUCKETS) + 2)
+        histogram[bisect.bisect_left(METRICS_BUCKETS, value)] += 1
+        histogram[-1] += value
+
+    @staticmethod
+    def _merge(target, shard):
+        for key, value in list(shard['counters'].items()):
+            target['counters'][key] += value
+        for key, histogram in list(shard['histograms'].items()):
+            total = target['histograms'].setdefault(key, [0] * len(histogram))
+            for i, value in enumerate(histogram):
+                total[i] += value
+
+    def snapshot(self):
+        """Restituisce la somma di tutte le copie: {'counters': {...}, 'histograms': {...}}."""
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            total = self._new_shard()
+            self._merge(total, self._retired)
+            for _, shard in alive:
+                self._merge(total, shard)
+        return total
+
+metrics = Metrics()
+_metrics_state = threading.local() # 'sampled': le query della richiesta corrente vanno misurate
+
+def _normalize_sql(sql):
+    """Riduce il testo di una query a un'etichetta stabile (spazi compattati, liste di '?' abbreviate)."""
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    sql = re.sub(r'\(\?(?:, ?\?)+\)(?:, ?\(\?(?:, ?\?)+\))+', '(?, ...), ...', sql)
+    return re.sub(r'\?(?:, ?\?)+', '?, ...', sql)[:200]
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursore che misura ogni query: tempo di execute() più quello speso a leggere le righe
+    (iterazione e fetch*), e numero di righe lette o modificate.
+    """
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, time.perf_counter() - start)
+
+    def _begin(self, sql, elapsed):
+        self._sql, self._elapsed, self._rows = sql, elapsed, 0
+        if self.description is None: # Non è una SELECT: nessuna riga da leggere
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        record_query(sql, self._elapsed, self._rows)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+        return result
 
-def get_db_connection():
-    """Crea una connessione al database."""
-    conn = sqlite3.connect(DB_FILE)
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connessione che crea cursori misurati per le richieste campionate o se il log delle query lente è attivo."""
+    def cursor(self, factory=None):
+        if factory is None and (SLOW_QUERY_MS > 0 or getattr(_metrics_state, 'sampled', False)):
+            factory = TimedCursor
+        return super().cursor(factory or sqlite3.Cursor)
+
+    # Le scorciatoie di sqlite3.Connection creano il cursore senza passare da cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def record_query(sql, elapsed, rows):
+    """Aggiorna le metriche di una query e, se supera SLOW_QUERY_MS, la scrive nel log."""
+    if SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS:
+        app.logger.warning('Query lenta (%.1f ms, %d righe): %s', elapsed * 1000, rows, re.sub(r'\s+', ' ', sql).strip())
+    if getattr(_metrics_state, 'sampled', False):
+        labels = (('query', _normalize_sql(sql)),)
+        metrics.inc('appmanager_sql_queries_total', labels)
+        metrics.inc('appmanager_sql_query_seconds_total', labels, elapsed)
+        metrics.inc('appmanager_sql_rows_total', labels, rows)
+        metrics.observe('appmanager_sql_query_duration_seconds', (), elapsed)
+
+def record_cache(cache, hit):
+    """Conta un accesso a una cache in memoria."""
+    if METRICS_ENABLED:
+        metrics.inc('appmanager_cache_requests_total', (('cache', cache), ('result', 'hit' if hit else 'miss')))
+
+@app.before_request
+def start_request_metrics():
+    if METRICS_ENABLED:
+        g.request_start = time.perf_counter()
+        _metrics_state.sampled = METRICS_SAMPLE_RATE >= 1 or random.random() < METRICS_SAMPLE_RATE
+
+@app.after_request
+def record_request_metrics(response):
+    """Registra durata (fino all'invio degli header, per le risposte in streaming) e stato della richiesta."""
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe('appmanager_http_request_duration_seconds',
+                        (('route', route), ('method', request.method)), time.perf_counter() - start)
+        metrics.inc('appmanager_http_requests_total',
+                    (('route', route), ('method', request.method), ('status', str(response.status_code))))
+    _metrics_state.sampled = False
+    return response
+
+METRICS_HELP = {
+    'appmanager_http_requests_total': ('counter', 'Richieste HTTP per route, metodo e stato'),
+    'appmanager_http_request_duration_seconds': ('histogram', 'Durata delle richieste HTTP'),
+    'appmanager_sql_queries_total': ('counter', 'Query SQL eseguite (richieste campionate)'),
+    'appmanager_sql_query_seconds_total': ('counter', 'Tempo speso nelle query SQL (richieste campionate)'),
+    'appmanager_sql_rows_total': ('counter', 'Righe lette o modificate dalle query SQL (richieste campionate)'),
+    'appmanager_sql_query_duration_seconds': ('histogram', 'Durata delle query SQL (richieste campionate)'),
+    'appmanager_cache_requests_total': ('counter', 'Accessi alle cache in memoria'),
+    'appmanager_device_evictions_total': ('counter', 'Dispositivi tolti dalla cache (spazio esaurito o inattività)'),
+    'appmanager_maintenance_runs_total': ('counter', 'Attività di manutenzione eseguite per esito'),
+    'appmanager_maintenance_duration_seconds': ('histogram', 'Durata delle attività di manutenzione'),
+    'appmanager_maintenance_pages_freed_total': ('counter', 'Pagine restituite al sistema da incremental_vacuum'),
+}
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+def render_metrics():
+    """Restituisce tutte le metriche nel formato testuale di Prometheus."""
+    snapshot = metrics.snapshot()
+    lines = []
+    series = collections.defaultdict(list)
+    for (name, labels), value in snapshot['counters'].items():
+        series[name].append((labels, value))
+    for (name, labels), histogram in snapshot['histograms'].items():
+        series[name].append((labels, histogram))
+    for name in sorted(series):
+        kind, text = METRICS_HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(series[name]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {value:g}')
+                continue
+            cumulative = 0
+            for bound, count in zip(METRICS_BUCKETS + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value[-1]:g}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+    lines.append('# HELP appmanager_db_file_bytes Dimensione dei file del database')
+    lines.append('# TYPE appmanager_db_file_bytes gauge')
+    for suffix, file_type in (('', 'db'), ('-wal', 'wal')):
+        try:
+            size = os.path.getsize(DB_FILE + suffix)
+        except OSError:
+            size = 0
+        lines.append(f'appmanager_db_file_bytes{{file="{file_type}"}} {size}')
+    lines.append('# HELP appmanager_devices_open Dispositivi aperti nella cache, oltre al predefinito')
+    lines.append('# TYPE appmanager_devices_open gauge')
+    lines.append(f'appmanager_devices_open {len(devices.open_files) - 1}')
+    return '\n'.join(lines) + '\n'
+
+@app.route('/metrics')
+def metrics_api():
+    """Endpoint per Prometheus con le metriche dell'applicazione."""
+    if not METRICS_ENABLED:
+        return jsonify({'message': 'Metrics are disabled'}), 404
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# Connessioni aperte, una per thread, per database e per tipo (sola lettura / lettura-scrittura)
+_db_pool = threading.local()
+
+def _connection_factory():
+    """Classe delle connessioni: misurate solo se servono metriche o log delle query lente."""
+    return InstrumentedConnection if METRICS_ENABLED or SLOW_QUERY_MS > 0 else sqlite3.Connection
+
+def _open_connection(readonly=False, db_file=None):
+    """
+    Apre una nuova connessione al database (predefinito: DB_FILE) e applica il profilo di PRAGMA
+    configurato. Le connessioni in sola lettura usano l'URI 'mode=ro', così non possono mai
+    scrivere per errore.
+    """
+    db_file = db_file or DB_FILE
+    if readonly:
+        uri = 'file:' + quote(os.path.abspath(db_file)) + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT / 1000, factory=_connection_factory())
+    else:
+        conn = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT / 1000, factory=_connection_factory())
+        # journal_mode è persistente nel file: basta impostarlo dalla connessione che può scrivere
+        conn.execute(f'PRAGMA journal_mode = {DB_JOURNAL_MODE}')
     conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}')
+    conn.execute(f'PRAGMA synchronous = {DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size = {DB_CACHE_SIZE}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
     return conn
 
+def _acquire_connection(readonly, db_file):
+    """
+    Restituisce la connessione del thread corrente dal pool, aprendola se necessario.
+    Quando un dispositivo esce dalla cache (devices.generation cambia) il thread chiude le
+    proprie connessioni ai database non più aperti.
+    """
+    if not DB_POOL_ENABLED:
+        return _open_connection(readonly, db_file)
+    conns = getattr(_db_pool, 'conns', None)
+    if conns is None:
+        conns = _db_pool.conns = {}
+        _db_pool.generation = devices.generation
+    if _db_pool.generation != devices.generation:
+        _db_pool.generation = devices.generation
+        open_files = devices.open_files
+        for key in [key for key in conns if key[0] not in open_files and key[0] != db_file]:
+            conns.pop(key).close()
+    key = (db_file, readonly)
+    conn = conns.get(key)
+    if conn is None:
+        conn = conns[key] = _open_connection(readonly, db_file)
+    return conn
+
+def get_db_connection(readonly=False, device=None):
+    """
+    Restituisce la connessione al database del dispositivo indicato (predefinito: quello della
+    richiesta corrente). La stessa connessione viene riutilizzata per tutta la richiesta e
+    rilasciata da close_db_connections() alla chiusura dell'app context; non va chiusa dal chiamante.
+    """
+    device = device or current_device()
+    conns = g.setdefault('db_conns', {})
+    key = (device.db_file, readonly)
+    conn = conns.get(key)
+    if conn is None:
+        conn = conns[key] = _acquire_connection(readonly, device.db_file)
+    return conn
+
+@app.teardown_appcontext
+def close_db_connections(exception=None):
+    """
+    Rilascia le connessioni usate dalla richiesta: annulla eventuali transazioni lasciate
+    aperte e, se il pool è disattivato, chiude la connessione.
+    """
+    for conn in g.pop('db_conns', {}).values():
+        if conn.in_transaction:
+            conn.rollback()
+        if not DB_POOL_ENABLED:
+            conn.close()
+
 def get_user_by_id(user_id):
-    """Recupera un utente dal database tramite ID."""
-    conn = get_db_connection()
+    """Recupera un utente dal database tramite ID (gli utenti sono nel database predefinito, comuni a tutti i dispositivi)."""
+    conn = get_db_connection(readonly=True, device=devices.default)
     user = conn.execute('SELECT id, username, is_admin FROM users WHERE id = ?', (user_id,)).fetchone() # Do not return password_hash
-    conn.close()
     return user
 
 def get_user_by_username(username):
     """Recupera un utente dal database tramite username."""
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True, device=devices.default)
     user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-    conn.close()
     return user
 
-# login_required decorator is removed temporarily as we are moving to token-based auth
+# --- Autenticazione con token firmati ---
+# Un token è "<payload>.<firma>": il payload JSON (id utente, scadenza, identificativo 'jti')
+# codificato in base64url e firmato con HMAC-SHA256 usando app.secret_key. La verifica non
+# richiede il database; con più worker FLASK_SECRET_KEY deve essere impostata, altrimenti
+# ogni processo genera una chiave diversa.
+
+def _token_key():
+    key = app.secret_key
+    return key.encode('utf-8') if isinstance(key, str) else key
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def create_token(user):
+    """Crea un token per l'utente indicato, valido TOKEN_TTL secondi."""
+    payload = {'sub': user['id'], 'exp': int(time.time()) + TOKEN_TTL, 'jti': secrets.token_urlsafe(12)}
+    encoded = _b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    signature = hmac.new(_token_key(), encoded.encode('ascii'), hashlib.sha256).digest()
+    return f'{encoded}.{_b64encode(signature)}'
+
+def verify_token(token):
+    """Restituisce il payload del token se la firma è valida, non è scaduto e non è revocato; altrimenti None."""
+    encoded, _, signature = token.partition('.')
+    expected = _b64encode(hmac.new(_token_key(), encoded.encode('ascii', 'replace'), hashlib.sha256).digest())
+    if not hmac.compare_digest(expected.encode('ascii'), signature.encode('ascii', 'replace')): # I byte non ASCII non sono mai validi
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+        if payload['exp'] <= time.time() or token_denylist.is_revoked(payload['jti']):
+            return None
+    except (ValueError, TypeError, KeyError):
+        return None
+    return payload
+
+class TokenDenylist:
+    """
+    Token revocati (logout) prima della loro scadenza, per identificativo 'jti'. Ogni voce
+    viene eliminata quando il token scade, perché da quel momento è comunque rifiutato:
+    la lista contiene al più i token revocati nelle ultime TOKEN_TTL secondi.
+    Vale per il processo corrente.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked = {} # jti -> scadenza
+        self._expiry = [] # heap di (scadenza, jti) per eliminare le voci scadute
+
+    def revoke(self, jti, expires_at):
+        with self._lock:
+            self._evict()
+            self._revoked[jti] = expires_at
+            heapq.heappush(self._expiry, (expires_at, jti))
+
+    def is_revoked(self, jti):
+        with self._lock:
+            self._evict()
+            return jti in self._revoked
+
+    def _evict(self):
+        now = time.time()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, jti = heapq.heappop(self._expiry)
+            self._revoked.pop(jti, None)
+
+token_denylist = TokenDenylist()
+
+class UserCache:
+    """
+    Cache LRU degli utenti (senza password_hash) per id. Ogni voce ricorda la versione della
+    tabella users con cui è stata letta (vedi _users_version()): quando gli utenti cambiano
+    (anche per setup_admin.py o altri processi) l'utente viene riletto alla richiesta
+    successiva, mentre le scritture su app e account non svuotano la cache.
+    """
+    def __init__(self, size=USER_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # id -> (versione degli utenti, utente)
+        self._size = size
+        self._checked = (None, None) # (versione dei dati, versione degli utenti letta con quella)
+
+    def _users_version(self):
+        """
+        Versione della tabella users (epoca e contatore dei trigger in change_log_meta).
+        Viene riletta solo quando cambia la versione dei dati del database predefinito.
+        """
+        version = devices.default.get_version()
+        with self._lock:
+            if self._checked[0] == version:
+                return self._checked[1]
+        conn = get_db_connection(readonly=True, device=devices.default)
+        try:
+            meta = dict(conn.execute("SELECT name, value FROM change_log_meta WHERE name IN ('epoch', 'users')").fetchall())
+        except sqlite3.OperationalError:
+            meta = {}
+        # Senza il contatore dei trigger (database non aggiornato) ogni modifica svuota la cache
+        users_version = (meta.get('epoch'), meta['users']) if 'users' in meta else ('data', version)
+        with self._lock:
+            self._checked = (version, users_version)
+        return users_version
+
+    def get(self, user_id):
+        users_version = self._users_version()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            hit = entry is not None and entry[0] == users_version
+            if hit:
+                self._entries.move_to_end(user_id)
+        record_cache('users', hit)
+        if hit:
+            return entry[1]
+        row = get_user_by_id(user_id)
+        user = dict(row) if row is not None else None
+        with self._lock:
+            self._entries[user_id] = (users_version, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id=None):
+        """Elimina dalla cache un utente (o tutti, se user_id è None)."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+user_cache = UserCache()
+
+def get_cached_user(user_id):
+    """Recupera un utente tramite ID passando dalla cache."""
+    return user_cache.get(user_id)
+
+def authenticated_user():
+    """
+    Restituisce l'utente del token inviato nell'header 'Authorization: Bearer <token>', o None se
+    manca o non è valido. Solo gli endpoint in QUERY_TOKEN_ENDPOINTS (EventSource non può impostare
+    header) accettano anche ?access_token=: altrove il token finirebbe nei log e nel Referer.
+    """
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        token = header[7:].strip()
+    elif request.endpoint in QUERY_TOKEN_ENDPOINTS:
+        token = request.args.get('access_token')
+    else:
+        token = None
+    payload = verify_token(token) if token else None
+    if payload is None:
+        return None
+    g.token = payload
+    return get_cached_user(payload['sub'])
+
+def login_required(view):
+    """
+    Decoratore che rende disponibile l'utente autenticato in g.user. Con AUTH_REQUIRED=1 le
+    richieste senza un token valido ricevono 401.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.user = authenticated_user()
+        if g.user is None and AUTH_REQUIRED:
+            return jsonify({'message': 'Authentication required'}), 401
+        return view(*args, **kwargs)
+    return wrapped
 
 def get_all_accounts():
     """Recupera tutti gli account dal database, inclusi order e is_hidden, ordinati per order e nome."""
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     accounts = conn.execute('SELECT id, name, abbreviation, "order", is_hidden FROM accounts ORDER BY "order", name').fetchall()
-    conn.close()
     return [dict(acc) for acc in accounts]
 
 def get_all_apps():
     """Recupera tutte le app dal database, inclusi order e is_hidden, ordinati per order e nome."""
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     apps = conn.execute('SELECT id, name, folder, "order", is_hidden FROM apps ORDER BY "order", name').fetchall()
-    conn.close()
     return [dict(app) for app in apps]
 
+# Join ordinata di app e account visibili, usata sia per l'albero completo sia per lo streaming
+VISIBLE_APPS_QUERY = """
+    SELECT
+        a.id as app_id,
+        a.name as app_name,
+        a.folder as app_folder,
+        a."order" as app_order,
+        a.is_hidden as app_is_hidden,
+        acc.id as account_id,
+        acc.name as account_name,
+        acc."order" as account_order,
+        acc.is_hidden as account_is_hidden
+    FROM
+        apps a
+    LEFT JOIN
+        app_accounts aa ON a.id = aa.app_id
+    LEFT JOIN
+        accounts acc ON aa.account_id = acc.id
+    WHERE
+        a.is_hidden = 0 AND (acc.is_hidden = 0 OR acc.is_hidden IS NULL)
+    ORDER BY
+        a."order", a.name, acc."order", acc.name;
+"""
+
+def iter_visible_apps():
+    """
+    Genera le app visibili, ciascuna con i suoi account visibili, nell'ordine personalizzato.
+    L'ordinamento è fatto interamente da SQL: le righe di una stessa app arrivano contigue e
+    già ordinate, quindi basta un'unica passata sul cursore senza riordinare in Python;
+    in memoria resta solo l'app corrente.
+    """
+    conn = get_db_connection(readonly=True)
+    cursor = conn.cursor()
+    cursor.row_factory = None # Tuple semplici: evita la conversione sqlite3.Row -> dict
+    cursor.execute(VISIBLE_APPS_QUERY)
+
+    app_data = None
+    for (app_id, app_name, app_folder, app_order, app_is_hidden,
+         account_id, account_name, account_order, account_is_hidden) in cursor:
+        if app_data is None or app_id != app_data['id']:
+            # Prima riga di una nuova app: la chiave primaria di app_accounts garantisce
+            # che ogni account compaia una sola volta, quindi non servono controlli sui duplicati
+            if app_data is not None:
+                yield app_data
+            app_data = {
+                'id': app_id,
+                'name': app_name,
+                'folder': app_folder,
+                'order': app_order,
+                'is_hidden': app_is_hidden,
+                'accounts': []
+            }
+
+        if account_id and account_name:
+            app_data['accounts'].append({
+                'id': account_id,
+                'name': account_name,
+                'order': account_order,
+                'is_hidden': account_is_hidden
+            })
+
+    if app_data is not None:
+        yield app_data
+
 def get_data_grouped_by_folder():
     """
     Recupera tutte le app e le unisce con i loro account, raggruppandole per cartella.
     Filtra le app e gli account nascosti, ordina per ordine personalizzato e nome.
     Restituisce un dizionario dove le chiavi sono i nomi delle cartelle.
     """
-    conn = get_db_connection()
-    query = """
-        SELECT
-            a.id as app_id,
-            a.name as app_name,
-            a.folder as app_folder,
-            a."order" as app_order,
-            a.is_hidden as app_is_hidden,
-            acc.id as account_id,
-            acc.name as account_name,
-            acc."order" as account_order,
-            acc.is_hidden as account_is_hidden
-        FROM
-            apps a
-        LEFT JOIN
-            app_accounts aa ON a.id = aa.app_id
-        LEFT JOIN
-            accounts acc ON aa.account_id = acc.id
-        WHERE
-            a.is_hidden = 0 AND (acc.is_hidden = 0 OR acc.is_hidden IS NULL)
-        ORDER BY
-            a."order", a.name, acc."order", acc.name;
-    """
-    rows = conn.execute(query).fetchall()
-    conn.close()
-
     folders_dict = {}
+    for app_data in iter_visible_apps():
+        folder_apps = folders_dict.get(app_data['folder'])
+        if folder_apps is None:
+            folder_apps = folders_dict[app_data['folder']] = []
+        folder_apps.append(app_data)
+    return folders_dict
 
-    for row in rows:
-        folder_name = row['app_folder']
-        app_id = row['app_id']
 
-        if folder_name not in folders_dict:
-            folders_dict[folder_name] = {}
-        
-        if app_id not in folders_dict[folder_name]:
-            folders_dict[folder_name][app_id] = {
-                'id': app_id,
-                'name': row['app_name'],
-                'folder': row['app_folder'],
-                'order': row['app_order'],
-                'is_hidden': row['app_is_hidden'],
-                'accounts': []
-            }
-        
-        if row['account_id'] and row['account_name']:
-            account_data = {
-                'id': row['account_id'],
-                'name': row['account_name'],
-                'order': row['account_order'],
-                'is_hidden': row['account_is_hidden']
-            }
-            if account_data not in folders_dict[folder_name][app_id]['accounts']:
-                folders_dict[folder_name][app_id]['accounts'].append(account_data)
+# --- Dispositivi, versione dei dati e cache delle risposte JSON di lettura ---
+# Ogni dispositivo ha il proprio database: quello predefinito è DB_FILE, gli altri
+# DEVICES_DIR/<nome>.db, scelti con il prefisso /devices/<nome>/ o con l'header X-Device.
+# La versione dei dati di un dispositivo aumenta a ogni scrittura fatta dagli endpoint e ogni
+# volta che il suo database viene modificato dall'esterno (import_data.py, altri worker).
+
+class Device:
+    """
+    Un dispositivo e lo stato in memoria legato al suo database: versione dei dati, risposte
+    JSON in cache e, creati al primo uso, la coda del group commit e le notifiche di /api/events.
+    """
+    def __init__(self, name, db_file):
+        self.name = name
+        self.db_file = db_file
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+        self._data_version = 0
+        self._watch = {'conn': None, 'file_id': None, 'data_version': None}
+        self.json_cache = {} # nome -> (versione dei dati, ETag, corpo JSON già serializzato, {codifica: corpo compresso})
+        self._content_tag = (None, None) # (versione dei dati, content_tag() letto per quella versione)
+        self._write_queue = None
+        self._change_feed = None
 
-    final_structure = {}
-    for folder, apps in folders_dict.items():
-        sorted_apps = sorted(apps.values(), key=lambda x: (x['order'], x['name']))
-        for app_data in sorted_apps:
-            if 'accounts' in app_data and app_data['accounts']:
-                app_data['accounts'] = sorted(app_data['accounts'], key=lambda x: (x['order'], x['name']))
-        final_structure[folder] = sorted_apps
-        
-    return final_structure
+    @property
+    def write_queue(self):
+        with self._lock:
+            if self._write_queue is None:
+                self._write_queue = WriteQueue(self)
+            return self._write_queue
 
+    @property
+    def change_feed(self):
+        with self._lock:
+            if self._change_feed is None:
+                self._change_feed = ChangeFeed(self)
+            return self._change_feed
+
+    def busy(self):
+        """
+        Vero se il dispositivo ha client collegati a /api/events o un thread del group commit
+        attivo (non va tolto dalla cache: un secondo Device aprirebbe un secondo scrittore).
+        """
+        if self._write_queue is not None and self._write_queue.busy():
+            return True
+        return self._change_feed is not None and self._change_feed.listeners > 0
+
+    def bump_version(self):
+        """Segnala che i dati sono cambiati, invalidando le cache basate sulla versione."""
+        with self._lock:
+            self._data_version += 1
+            change_feed = self._change_feed
+        if change_feed is not None:
+            change_feed.notify()
+
+    def _file_id(self):
+        """Identifica il file del database: cambia se il file viene sostituito o ricreato."""
+        try:
+            st = os.stat(self.db_file)
+        except OSError:
+            return None
+        return (os.path.abspath(self.db_file), st.st_dev, st.st_ino)
+
+    def get_version(self):
+        """
+        Restituisce la versione corrente dei dati.
+        Le modifiche esterne vengono rilevate con PRAGMA data_version su una connessione di
+        sola lettura dedicata, che cambia valore a ogni commit fatto da qualunque altra
+        connessione; un controllo sul file copre il caso in cui il database venga ricreato.
+        """
+        with self._lock:
+            watch = self._watch
+            file_id = self._file_id()
+            if watch['conn'] is not None and watch['file_id'] != file_id:
+                watch['conn'].close()
+                watch['conn'] = None
+            try:
+                if watch['conn'] is None:
+                    uri = 'file:' + quote(os.path.abspath(self.db_file)) + '?mode=ro'
+                    watch['conn'] = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                    watch['file_id'] = file_id
+                current = (file_id, watch['conn'].execute('PRAGMA data_version').fetchone()[0])
+            except sqlite3.Error:
+                if watch['conn'] is not None:
+                    watch['conn'].close()
+                watch['conn'] = None
+                current = None
+            if current is None or current != watch['data_version']:
+                watch['data_version'] = current
+                self._data_version += 1
+            return self._data_version
+
+    def get_content_tag(self):
+        """
+        Restituisce (versione dei dati, content_tag()) senza leggere i dati: il tag viene riletto
+        dalla connessione di controllo solo quando la versione cambia.
+        """
+        version = self.get_version()
+        with self._lock:
+            if self._content_tag[0] != version:
+                conn = self._watch['conn']
+                self._content_tag = (version, content_tag(conn) if conn is not None else None)
+            return self._content_tag
+
+    def close(self):
+        """Libera la connessione di controllo e le risposte in cache quando il dispositivo esce dalla cache."""
+        with self._lock:
+            if self._watch['conn'] is not None:
+                self._watch['conn'].close()
+            self._watch = {'conn': None, 'file_id': None, 'data_version': None}
+            self._content_tag = (None, None)
+            self.json_cache = {}
+
+class DeviceCache:
+    """
+    Dispositivi aperti, in ordine LRU: oltre al predefinito (sempre aperto) al più
+    DEVICE_CACHE_SIZE. Un dispositivo esce dalla cache quando serve posto o quando non
+    riceve richieste da DEVICE_IDLE_TIMEOUT secondi, tranne se ha client collegati a
+    /api/events; le connessioni dei thread verso i dispositivi usciti vengono chiuse al
+    successivo uso del pool (vedi _acquire_connection()).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = collections.OrderedDict() # nome -> Device
+        self.default = Device(DEFAULT_DEVICE, DB_FILE)
+        self.generation = 0 # Aumenta a ogni dispositivo tolto dalla cache
+        self.open_files = {DB_FILE}
+        self._last_sweep = 0
+
+    def get(self, name):
+        """Restituisce il dispositivo 'name', aprendolo se necessario; None se non ha un database."""
+        if name == DEFAULT_DEVICE:
+            return self.default
+        now = time.monotonic()
+        with self._lock:
+            device = self._devices.get(name)
+            record_cache('devices', device is not None)
+            if device is None:
+                db_file = device_db_file(name, DEVICES_DIR)
+                if not os.path.exists(db_file):
+                    return None
+                device = self._devices[name] = Device(name, db_file)
+                self.open_files = self.open_files | {db_file}
+            self._devices.move_to_end(name)
+            device.last_used = now
+            self._evict(now)
+            return device
+
+    def sweep(self):
+        """
+        Toglie dalla cache i dispositivi inattivi anche quando le richieste usano solo quello
+        predefinito (e get() non viene chiamato); al più una volta al secondo.
+        """
+        now = time.monotonic()
+        if not self._devices or now - self._last_sweep < 1:
+            return
+        with self._lock:
+            self._last_sweep = now
+            self._evict(now)
+
+    def _evict(self, now):
+        evicted = False
+        for name, device in list(self._devices.items()): # Dal meno recente
+            if len(self._devices) <= DEVICE_CACHE_SIZE and now - device.last_used < DEVICE_IDLE_TIMEOUT:
+                break
+            if device.busy():
+                continue
+            del self._devices[name]
+            device.close()
+            evicted = True
+            if METRICS_ENABLED:
+                metrics.inc('appmanager_device_evictions_total')
+        if evicted:
+            self.open_files = {DB_FILE} | {device.db_file for device in self._devices.values()}
+            self.generation += 1
+
+devices = DeviceCache()
+
+def current_device():
+    """Dispositivo della richiesta corrente (il predefinito fuori da una richiesta)."""
+    if not has_app_context():
+        return devices.default
+    g.device_used = True # La risposta dipende dal dispositivo: vedi add_device_vary()
+    return g.get('device') or devices.default
+
+def bump_data_version():
+    """Segnala che i dati del dispositivo corrente sono cambiati."""
+    current_device().bump_version()
+
+def get_data_version():
+    """Restituisce la versione corrente dei dati del dispositivo corrente (vedi Device.get_version())."""
+    return current_device().get_version()
+
+# Parte delle ETag delle risposte in cache: una nuova versione del codice non riusa quelle vecchie
+with open(__file__, 'rb') as _source:
+    ETAG_SALT = hashlib.blake2b(_source.read(), digest_size=8).hexdigest()
+
+def content_tag(conn):
+    """
+    Identifica il contenuto del database: l'epoca (casuale per ogni database, cambia a ogni
+    ripristino di una copia) e la
+    versione del registro delle modifiche, che cresce a ogni scrittura su apps, accounts e
+    app_accounts, anche fatta da altri processi (trigger). È uguale in tutti i worker per gli
+    stessi dati. Restituisce None se il database non ha il registro delle modifiche.
+    """
+    try:
+        current, _ = _change_log_state(conn.cursor())
+        epoch = conn.execute("SELECT value FROM change_log_meta WHERE name = 'epoch'").fetchone()
+    except sqlite3.Error:
+        return None
+    return f'{epoch[0] if epoch else 0}.{current}'
+
+def _response_etag(device, name, tag):
+    """
+    ETag della risposta 'name' del dispositivo per il contenuto 'tag' (cambia anche con il
+    codice che la genera): due dispositivi non condividono mai un'ETag.
+    """
+    raw = f'{ETAG_SALT}:{device.name}:{name}:{tag}'
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+def get_cached_body(name, render):
+    """
+    Restituisce (versione, ETag, corpo, versioni compresse) per la risposta 'name', chiamando
+    render() (che restituisce il corpo in byte) solo se i dati sono cambiati rispetto alla
+    versione memorizzata in cache. L'ETag deriva da content_tag(), letto nella stessa
+    transazione di render(), quindi è identico tra worker diversi per gli stessi dati (senza
+    registro delle modifiche è l'hash del corpo). Le versioni compresse vengono aggiunte da
+    cached_response() alla prima richiesta che le accetta.
+    """
+    device = current_device()
+    version = device.get_version()
+    entry = device.json_cache.get(name)
+    record_cache(f'response:{name}', entry is not None and entry[0] == version)
+    if entry is not None and entry[0] == version:
+        return entry
+    # La versione è letta prima della query: una scrittura concorrente la farà solo scadere prima
+    conn = get_db_connection(readonly=True)
+    own_transaction = not conn.in_transaction # render() può a sua volta usare get_cached_json()
+    if own_transaction:
+        conn.execute('BEGIN') # Tag e dati letti dalla stessa fotografia del database
+    try:
+        tag = content_tag(conn)
+        body = render()
+    finally:
+        if own_transaction:
+            conn.rollback()
+    etag = _response_etag(device, name, tag) if tag is not None else hashlib.blake2b(body, digest_size=16).hexdigest()
+    entry = (version, etag, body, {})
+    device.json_cache[name] = entry
+    return entry
+
+def get_cached_json(name, build):
+    """Come get_cached_body(), per una risposta JSON con il contenuto restituito da build()."""
+    return get_cached_body(name, lambda: app.json.response(build()).get_data())
+
+def cached_json_response(name, build):
+    """
+    Risponde con il JSON in cache per 'name', oppure con 304 Not Modified se il client
+    invia in If-None-Match l'ETag della versione corrente (senza ricostruire i dati).
+    """
+    return cached_response(name, lambda: app.json.response(build()).get_data(), app.json.mimetype)
+
+def cached_response(name, render, mimetype):
+    """
+    Risposta in cache (vedi get_cached_body()), compressa se il client lo accetta e con 304
+    sull'ETag. Il 304 viene deciso dal solo content_tag(), prima di leggere o generare i dati:
+    basta anche a un worker appena avviato o subito dopo una modifica.
+    """
+    device = current_device()
+    version, tag = device.get_content_tag()
+    if tag is not None:
+        etag = _response_etag(device, name, tag)
+        encoding = negotiate_encoding()
+        # La codifica dipende anche dalla dimensione del corpo, che qui non è ancora nota
+        for candidate in (etag, f'{etag}-{encoding}') if encoding is not None else (etag,):
+            if request.if_none_match.contains(candidate):
+                record_cache(f'response:{name}', True)
+                response = app.response_class(status=304)
+                response.set_etag(candidate)
+                response.headers['Cache-Control'] = 'no-cache'
+                if COMPRESS_ENABLED:
+                    response.vary.add('Accept-Encoding')
+                return response
+
+    version, etag, body, compressed = get_cached_body(name, render)
+    encoding = negotiate_encoding() if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding is not None:
+        etag = f'{etag}-{encoding}' # Ogni codifica è una rappresentazione diversa
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif encoding is None:
+        response = app.response_class(body, mimetype=mimetype)
+    else:
+        # Compressa una sola volta per versione dei dati, poi riusata da tutte le richieste
+        if encoding not in compressed:
+            compressed[encoding] = compress_body(body, encoding)
+        response = app.response_class(compressed[encoding], mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' # Il client deve sempre rivalidare
+    if COMPRESS_ENABLED:
+        response.vary.add('Accept-Encoding')
+    return response
+
+def negotiate_encoding():
+    """Sceglie la compressione ('br' o 'gzip') in base ad Accept-Encoding; None se non va compressa."""
+    if not COMPRESS_ENABLED:
+        return None
+    return request.accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+
+def compress_body(body, encoding):
+    """Comprime 'body' con la codifica indicata."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+@app.after_request
+def compress_response(response):
+    """Comprime al volo le risposte JSON e di testo non in cache, se il client lo accetta."""
+    if (not COMPRESS_ENABLED or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.status_code in (204, 304)
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is not None:
+        response.set_data(compress_body(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def _build_manage_data():
+    """Costruisce il contenuto di /api/manage/data."""
+    return {'accounts': get_all_accounts(), 'apps': get_all_apps()}
+
+# --- Formato compatto (?format=columnar) ---
+# Ogni tabella diventa {"columns": [...], "rows": [[...], ...]}: i nomi dei campi compaiono
+# una volta sola invece che in ogni oggetto. Le righe hanno lo stesso ordine del formato normale.
+APP_COLUMNS = ['id', 'name', 'folder', 'order', 'is_hidden', 'accounts']
+ACCOUNT_COLUMNS = ['id', 'name', 'order', 'is_hidden']
+
+def get_apps_columnar():
+    """
+    Versione compatta di /api/apps: {"folders": [...], "apps": {...}, "accounts": {...}}.
+    "folders" elenca le cartelle in ordine alfabetico, come le chiavi del formato normale;
+    nelle righe delle app 'folder' è l'indice della cartella in "folders" e 'accounts' la
+    lista degli id. Ogni account visibile collegato compare una sola volta in "accounts".
+    """
+    app_rows = []
+    accounts = {}
+    for app_data in iter_visible_apps():
+        account_ids = []
+        for account in app_data['accounts']:
+            account_ids.append(account['id'])
+            if account['id'] not in accounts:
+                accounts[account['id']] = [account['id'], account['name'], account['order'], account['is_hidden']]
+        app_rows.append([app_data['id'], app_data['name'], app_data['folder'], app_data['order'], app_data['is_hidden'], account_ids])
+    folders = sorted({row[2] for row in app_rows})
+    folder_index = {folder: index for index, folder in enumerate(folders)}
+    for row in app_rows:
+        row[2] = folder_index[row[2]]
+    return {
+        'folders': folders,
+        'apps': {'columns': APP_COLUMNS, 'rows': app_rows},
+        'accounts': {'columns': ACCOUNT_COLUMNS, 'rows': list(accounts.values())}
+    }
+
+def _build_manage_data_columnar():
+    """Versione compatta di /api/manage/data: stesse righe, una tabella per apps e accounts."""
+    conn = get_db_connection(readonly=True)
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    accounts = cursor.execute('SELECT id, name, abbreviation, "order", is_hidden FROM accounts ORDER BY "order", name').fetchall()
+    apps = cursor.execute('SELECT id, name, folder, "order", is_hidden FROM apps ORDER BY "order", name').fetchall()
+    return {
+        'accounts': {'columns': ['id', 'name', 'abbreviation', 'order', 'is_hidden'], 'rows': accounts},
+        'apps': {'columns': ['id', 'name', 'folder', 'order', 'is_hidden'], 'rows': apps}
+    }
+
+def _columnar_requested():
+    """Indica se il client ha chiesto il formato compatto; None se il valore di 'format' non è valido."""
+    value = request.args.get('format', 'nested')
+    return {'nested': False, 'columnar': True}.get(value)
+
+# --- Scritture ---
+
+class WriteQueue:
+    """
+    Coda di scritture svuotata da un unico thread con una propria connessione (GROUP_COMMIT=1).
+    Le operazioni in attesa vengono eseguite insieme in una sola transazione (un solo lock e un
+    solo fsync per gruppo), ognuna dentro un SAVEPOINT: se un'operazione fallisce viene annullata
+    solo lei e il chiamante riceve la sua eccezione, le altre vengono confermate.
+    Ogni dispositivo ha la propria coda; il thread termina (chiudendo la connessione) dopo
+    DEVICE_IDLE_TIMEOUT secondi senza scritture e riparte alla successiva.
+    """
+    def __init__(self, device):
+        self.device = device
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, operation):
+        """Accoda operation(cursor) e attende il suo risultato (o la sua eccezione)."""
+        future = Future()
+        with self._lock:
+            self._queue.put((operation, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'group-commit-{self.device.name}', daemon=True)
+                self._thread.start()
+        return future.result()
+
+    def busy(self):
+        """Vero se ci sono scritture in coda o il thread non è ancora terminato."""
+        with self._lock:
+            return self._thread is not None or not self._queue.empty()
+
+    def _next_group(self):
+        """
+        Attende la prima operazione, poi raccoglie quelle già in coda (fino a GROUP_COMMIT_MAX_BATCH).
+        Restituisce None se per DEVICE_IDLE_TIMEOUT secondi non arriva nulla.
+        """
+        try:
+            group = [self._queue.get(timeout=DEVICE_IDLE_TIMEOUT)]
+        except queue.Empty:
+            return None
+        deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+        while len(group) < GROUP_COMMIT_MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            try:
+                group.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return group
+
+    def _apply(self, conn, group):
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        results = []
+        for operation, _ in group:
+            cursor.execute('SAVEPOINT operation')
+            try:
+                results.append((True, operation(cursor)))
+            except Exception as e:
+                cursor.execute('ROLLBACK TO operation')
+                results.append((False, e))
+            cursor.execute('RELEASE operation')
+        conn.commit()
+        return results
+
+    def _run(self):
+        conn = None
+        while True:
+            group = self._next_group()
+            if group is None:
+                with self._lock:
+                    if self._queue.empty(): # submit() accoda e avvia il thread sotto lo stesso lock
+                        self._thread = None
+                        if conn is not None:
+                            conn.close()
+                        return
+                continue
+            try:
+                if conn is None:
+                    conn = _open_connection(db_file=self.device.db_file)
+                changes = conn.total_changes
+                results = self._apply(conn, group)
+            except sqlite3.Error as e:
+                # Transazione non riuscita (es. database bloccato da un altro processo): falliscono tutte
+                if conn is not None:
+                    conn.close()
+                conn = None
+                for _, future in group:
+                    future.set_exception(e)
+                continue
+            if conn.total_changes != changes:
+                self.device.bump_version()
+            for (_, future), (succeeded, value) in zip(group, results):
+                if succeeded:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+def run_write(operation):
+    """
+    Esegue operation(cursor) in una transazione e restituisce il suo risultato; se operation
+    solleva un'eccezione le sue modifiche vengono annullate e l'eccezione arriva al chiamante.
+    Con GROUP_COMMIT=1 l'operazione passa dalla coda del dispositivo corrente, altrimenti viene
+    eseguita subito sulla connessione della richiesta. 'operation' deve usare solo il cursore ricevuto.
+    In entrambi i casi la transazione parte con BEGIN IMMEDIATE: le letture fatte da operation
+    per decidere cosa scrivere (es. _reorder()) vedono lo stesso stato su cui scrive, senza che
+    un altro worker possa scrivere in mezzo. La versione dei dati cambia solo se operation ha
+    davvero modificato qualcosa.
+    """
+    if GROUP_COMMIT_ENABLED:
+        return current_device().write_queue.submit(operation)
+    conn = get_db_connection()
+    changes = conn.total_changes
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        result = operation(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if conn.total_changes != changes:
+        bump_data_version()
+    return result
 
 @app.route('/api/apps') # Changed route
 def get_apps_data(): # Changed function name
     """
     API endpoint che restituisce l'elenco di tutte le app, raggruppate per cartella, come JSON.
+    Con 'Accept: application/x-ndjson' oppure '?stream=1' le app vengono invece inviate in
+    streaming, una per riga (NDJSON), man mano che vengono lette dal database.
+    Con '?format=columnar' restituisce il formato compatto di get_apps_columnar().
+    """
+    if request.args.get('stream') == '1' or _prefers_ndjson():
+        return stream_apps_ndjson()
+    columnar = _columnar_requested()
+    if columnar is None:
+        return jsonify({'message': "format must be 'nested' or 'columnar'"}), 400
+    if columnar:
+        return cached_json_response('apps:columnar', get_apps_columnar)
+    return cached_json_response('apps', get_data_grouped_by_folder) # Return JSON (cached, con ETag)
+
+def _prefers_ndjson():
+    """Indica se, secondo l'header Accept, il client preferisce NDJSON a JSON."""
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def stream_apps_ndjson():
+    """
+    Invia le app visibili in streaming, una per riga in formato NDJSON, nello stesso ordine
+    e con la stessa forma usata in /api/apps (ogni app riporta la sua 'folder').
+    La memoria usata resta costante e il primo byte parte appena è pronta la prima app.
     """
-    apps_by_folder = get_data_grouped_by_folder()
-    return jsonify(apps_by_folder) # Return JSON
+    dumps = app.json.dumps
+
+    def generate():
+        for app_data in iter_visible_apps():
+            yield dumps(app_data) + '\n'
+
+    return app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
 
 @app.route('/api/manage/data') # Changed route
-# @login_required # Temporarily removed
+@login_required
 def get_manage_data(): # Changed function name
     """
     API endpoint che restituisce tutti gli account e le app per la pagina di gestione, come JSON.
+    Con '?format=columnar' ogni lista diventa {"columns": [...], "rows": [[...], ...]}.
     """
-    all_accounts = get_all_accounts()
-    all_apps = get_all_apps()
     # logged_in_user = get_user_by_id(session['user_id']) # Removed session usage
-    return jsonify({'accounts': all_accounts, 'apps': all_apps}) # Return JSON
+    columnar = _columnar_requested()
+    if columnar is None:
+        return jsonify({'message': "format must be 'nested' or 'columnar'"}), 400
+    if columnar:
+        return cached_json_response('manage_data:columnar', _build_manage_data_columnar)
+    return cached_json_response('manage_data', _build_manage_data) # Return JSON (cached, con ETag)
+
+# Colonne esponibili e filtri ammessi per le liste paginate di /api/manage/data/<kind>
+MANAGE_LISTS = {
+    'apps': {'fields': ('id', 'name', 'folder', 'order', 'is_hidden'), 'filters': ('folder', 'is_hidden', 'prefix')},
+    'accounts': {'fields': ('id', 'name', 'abbreviation', 'order', 'is_hidden'), 'filters': ('is_hidden', 'prefix')},
+}
+
+def _encode_cursor(order, name, item_id):
+    """Codifica la chiave ("order", name, id) dell'ultima voce di una pagina in un cursore opaco."""
+    raw = json.dumps([order, name, item_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    """Decodifica un cursore creato da _encode_cursor(); restituisce None se non è valido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        order, name, item_id = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(order, int) or not isinstance(name, str) or not isinstance(item_id, int):
+        return None
+    return order, name, item_id
+
+def get_manage_page(kind, limit, after=None, fields=None, folder=None, is_hidden=None, prefix=None):
+    """
+    Restituisce una pagina di app o account ordinata per ("order", name, id) con paginazione
+    keyset: la pagina successiva parte dalla chiave dell'ultima voce, quindi il costo non
+    dipende dalla posizione nella lista né dalla dimensione delle tabelle.
+    Restituisce (voci, cursore della pagina successiva oppure None).
+    """
+    table_fields = MANAGE_LISTS[kind]['fields']
+    fields = fields or table_fields
+    columns = ', '.join(f'"{column}"' for column in dict.fromkeys(('order', 'name', 'id') + tuple(fields)))
+
+    conditions = []
+    params = []
+    if is_hidden is not None:
+        conditions.append('is_hidden = ?')
+        params.append(is_hidden)
+    if folder is not None:
+        conditions.append('folder = ?')
+        params.append(folder)
+    if prefix:
+        # Intervallo [prefix, prefix + carattere massimo): sfrutta l'ordinamento binario di name
+        conditions.append('name >= ? AND name < ?')
+        params.extend([prefix, prefix + '\U0010ffff'])
+    if after is not None:
+        conditions.append('("order", name, id) > (?, ?, ?)')
+        params.extend(after)
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+    conn = get_db_connection(readonly=True)
+    rows = conn.execute(
+        f'SELECT {columns} FROM {kind} {where} ORDER BY "order", name, id LIMIT ?',
+        params + [limit + 1]
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(last['order'], last['name'], last['id'])
+    return [{field: row[field] for field in fields} for row in rows], next_cursor
+
+@app.route('/api/manage/data/<kind>')
+@login_required
+def get_manage_page_api(kind):
+    """
+    API endpoint che restituisce una pagina di app ('apps') o account ('accounts') per la pagina di gestione.
+    Parametri: limit, after (cursore restituito come 'next_cursor'), fields (elenco separato da virgole),
+    is_hidden (0/1), prefix (inizio del nome) e, solo per le app, folder.
+    """
+    if kind not in MANAGE_LISTS:
+        return jsonify({'message': f'Unknown list: {kind}'}), 404
+    allowed = MANAGE_LISTS[kind]
+    args = request.args
+
+    limit = args.get('limit', PAGE_DEFAULT_LIMIT, type=int)
+    if limit is None or limit < 1 or limit > PAGE_MAX_LIMIT:
+        return jsonify({'message': f'limit must be between 1 and {PAGE_MAX_LIMIT}'}), 400
+
+    after = None
+    if args.get('after'):
+        after = _decode_cursor(args['after'])
+        if after is None:
+            return jsonify({'message': 'Invalid cursor'}), 400
+
+    fields = None
+    if args.get('fields'):
+        fields = tuple(dict.fromkeys(field.strip() for field in args['fields'].split(',') if field.strip()))
+        unknown = [field for field in fields if field not in allowed['fields']]
+        if unknown or not fields:
+            return jsonify({'message': f'Unknown fields: {unknown}', 'allowed': list(allowed['fields'])}), 400
+
+    unsupported = [name for name in ('folder', 'is_hidden', 'prefix') if name in args and name not in allowed['filters']]
+    if unsupported:
+        return jsonify({'message': f'Unsupported filters for {kind}: {unsupported}'}), 400
+    is_hidden = None
+    if 'is_hidden' in args:
+        if args['is_hidden'] not in ('0', '1'):
+            return jsonify({'message': 'is_hidden must be 0 or 1'}), 400
+        is_hidden = int(args['is_hidden'])
+
+    items, next_cursor = get_manage_page(
+        kind, limit, after=after, fields=fields,
+        folder=args.get('folder'), is_hidden=is_hidden, prefix=args.get('prefix')
+    )
+    return jsonify({kind: items, 'next_cursor': next_cursor})
+
+def _build_search_query(text):
+    """
+    Trasforma il testo cercato in un'espressione MATCH di FTS5: ogni parola diventa un
+    termine tra virgolette con ricerca per prefisso e tutte le parole devono essere presenti.
+    Restituisce None se il testo non contiene parole.
+    """
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def search_catalog(text, kind=None, limit=SEARCH_DEFAULT_LIMIT, offset=0):
+    """
+    Cerca app e account nell'indice full-text 'search_index' per nome, cartella e abbreviazione.
+    I risultati sono ordinati per rilevanza (bm25, con il nome che pesa più degli altri campi).
+    Restituisce (risultati, True se esistono altri risultati dopo questa pagina).
+    """
+    match = _build_search_query(text)
+    if match is None:
+        return [], False
+    query = """
+        SELECT rowid, kind, name, folder, abbreviation, bm25(search_index, 0, 10.0, 2.0, 5.0) AS score
+        FROM search_index
+        WHERE search_index MATCH ?
+    """
+    params = [match]
+    if kind is not None:
+        query += ' AND kind = ?'
+        params.append(kind)
+    query += ' ORDER BY score LIMIT ? OFFSET ?'
+    params.extend([limit + 1, offset])
+
+    conn = get_db_connection(readonly=True)
+    rows = conn.execute(query, params).fetchall()
+    results = []
+    for row in rows[:limit]:
+        result = {'type': row['kind'], 'id': row['rowid'] >> 1, 'name': row['name'], 'score': round(-row['score'], 4)}
+        if row['kind'] == 'app':
+            result['folder'] = row['folder']
+        else:
+            result['abbreviation'] = row['abbreviation']
+        results.append(result)
+    return results, len(rows) > limit
+
+@app.route('/api/search')
+@login_required
+def search_api():
+    """
+    API endpoint di ricerca full-text su app (nome, cartella) e account (nome, abbreviazione).
+    Parametri: q (testo, ogni parola è cercata come prefisso), type ('app' o 'account'),
+    limit e offset per la paginazione.
+    """
+    text = request.args.get('q', '')
+    kind = request.args.get('type')
+    limit = request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int)
+    offset = request.args.get('offset', 0, type=int)
+
+    if _build_search_query(text) is None:
+        return jsonify({'message': 'Missing search text'}), 400
+    if kind not in (None, 'app', 'account'):
+        return jsonify({'message': "type must be 'app' or 'account'"}), 400
+    if limit is None or limit < 1 or limit > SEARCH_MAX_LIMIT or offset is None or offset < 0:
+        return jsonify({'message': f'limit must be between 1 and {SEARCH_MAX_LIMIT} and offset must not be negative'}), 400
+
+    try:
+        results, has_more = search_catalog(text, kind, limit, offset)
+    except sqlite3.OperationalError as e:
+        # Indice assente: il database non è stato aggiornato con python Dati/database.py
+        return jsonify({'message': f'Search index not available: {e}'}), 503
+    return jsonify({'results': results, 'next_offset': offset + limit if has_more else None})
 
 @app.route('/api/accounts/add', methods=['POST']) # Changed route
-# @login_required # Temporarily removed
+@login_required
 def add_account_api(): # Changed function name
     """
     API endpoint per aggiungere un'associazione tra un'app e un account.
@@ -154,22 +1513,17 @@ def add_account_api(): # Changed function name
     if not app_id or not account_id:
         return jsonify({'message': 'Missing app_id or account_id'}, 400)
 
-    conn = get_db_connection()
     try:
-        conn.execute(
+        run_write(lambda cursor: cursor.execute(
             'INSERT OR IGNORE INTO app_accounts (app_id, account_id) VALUES (?, ?)',
             (app_id, account_id)
-        )
-        conn.commit()
+        ))
         return jsonify({'message': 'Association added successfully'})
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'message': f'Error adding association: {e}'}, 500)
-    finally:
-        conn.close()
 
 @app.route('/api/accounts/remove', methods=['POST']) # Changed route
-# @login_required # Temporarily removed
+@login_required
 def remove_account_api(): # Changed function name
     """
     API endpoint per rimuovere un'associazione tra un'app e un account.
@@ -181,22 +1535,194 @@ def remove_account_api(): # Changed function name
     if not app_id or not account_id:
         return jsonify({'message': 'Missing app_id or account_id'}, 400)
 
-    conn = get_db_connection()
     try:
-        conn.execute(
+        run_write(lambda cursor: cursor.execute(
             'DELETE FROM app_accounts WHERE app_id = ? AND account_id = ?',
             (app_id, account_id)
-        )
-        conn.commit()
+        ))
         return jsonify({'message': 'Association removed successfully'})
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'message': f'Error removing association: {e}'}, 500)
-    finally:
-        conn.close()
+
+def _parse_association_pair(item):
+    """Converte una voce del batch ({'app_id', 'account_id'} oppure [app_id, account_id]) in una tupla di interi."""
+    try:
+        if isinstance(item, dict):
+            app_id, account_id = item['app_id'], item['account_id']
+        else:
+            app_id, account_id = item
+        if isinstance(app_id, bool) or isinstance(account_id, bool):
+            return None
+        app_id, account_id = int(app_id), int(account_id)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if app_id <= 0 or account_id <= 0:
+        return None
+    return (app_id, account_id)
+
+def _existing_ids(cursor, table, ids):
+    """Restituisce gli id (tra quelli indicati) presenti nella tabella."""
+    ids = list(ids)
+    if not ids:
+        return set()
+    placeholders = ','.join('?' * len(ids))
+    return {row[0] for row in cursor.execute(f'SELECT id FROM {table} WHERE id IN ({placeholders})', ids)}
+
+def _existing_pairs(cursor, pairs):
+    """Restituisce le coppie (app_id, account_id) già presenti in app_accounts."""
+    if not pairs:
+        return set()
+    values = ','.join(['(?, ?)'] * len(pairs))
+    params = [value for pair in pairs for value in pair]
+    query = f'SELECT app_id, account_id FROM app_accounts WHERE (app_id, account_id) IN (VALUES {values})'
+    return {(row[0], row[1]) for row in cursor.execute(query, params)}
+
+def _apply_association_batch(cursor, items, remove=False):
+    """
+    Applica un elenco di associazioni da aggiungere (o rimuovere) a blocchi di BATCH_CHUNK_SIZE,
+    con una executemany per blocco, all'interno della transazione del chiamante.
+    Restituisce (numero di righe modificate, esito per ciascuna voce nello stesso ordine).
+    Esiti possibili: 'added' / 'exists' in aggiunta, 'removed' / 'missing' in rimozione,
+    'not_found' se l'app o l'account non esistono, 'invalid' se la voce non è valida.
+    """
+    results = []
+    changed = 0
+    for start in range(0, len(items), BATCH_CHUNK_SIZE):
+        chunk = [_parse_association_pair(item) for item in items[start:start + BATCH_CHUNK_SIZE]]
+        pairs = {pair for pair in chunk if pair is not None}
+        existing = _existing_pairs(cursor, pairs)
+        if not remove:
+            app_ids = _existing_ids(cursor, 'apps', {pair[0] for pair in pairs})
+            account_ids = _existing_ids(cursor, 'accounts', {pair[1] for pair in pairs})
+
+        to_write = []
+        seen = set()
+        for pair in chunk:
+            if pair is None:
+                results.append('invalid')
+            elif remove:
+                if pair in existing and pair not in seen:
+                    to_write.append(pair)
+                    results.append('removed')
+                else:
+                    results.append('missing')
+            elif pair[0] not in app_ids or pair[1] not in account_ids:
+                results.append('not_found')
+            elif pair in existing or pair in seen:
+                results.append('exists')
+            else:
+                to_write.append(pair)
+                results.append('added')
+            if pair is not None:
+                seen.add(pair)
+
+        if remove:
+            cursor.executemany('DELETE FROM app_accounts WHERE app_id = ? AND account_id = ?', to_write)
+        else:
+            cursor.executemany('INSERT OR IGNORE INTO app_accounts (app_id, account_id) VALUES (?, ?)', to_write)
+        changed += len(to_write)
+    return changed, results
+
+@app.route('/api/accounts/batch', methods=['POST'])
+@login_required
+def batch_associations_api():
+    """
+    API endpoint per aggiungere e rimuovere molte associazioni app-account in un'unica transazione.
+    Corpo: {"add": [{"app_id": 1, "account_id": 2}, ...], "remove": [[1, 3], ...]}.
+    Le rimozioni vengono applicate prima delle aggiunte; la risposta riporta l'esito di ogni voce.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Invalid JSON body'}), 400
+    additions = data.get('add') or []
+    removals = data.get('remove') or []
+
+    if not isinstance(additions, list) or not isinstance(removals, list):
+        return jsonify({'message': "'add' and 'remove' must be lists"}), 400
+    if len(additions) + len(removals) > BATCH_MAX_ITEMS:
+        return jsonify({'message': f'Too many items in batch (max {BATCH_MAX_ITEMS})'}), 413
+
+    def apply_batch(cursor):
+        return (_apply_association_batch(cursor, removals, remove=True),
+                _apply_association_batch(cursor, additions))
+
+    try:
+        (removed, remove_results), (added, add_results) = run_write(apply_batch)
+        return jsonify({
+            'message': 'Batch applied successfully',
+            'added': added,
+            'removed': removed,
+            'results': {'add': add_results, 'remove': remove_results}
+        })
+    except sqlite3.Error as e:
+        return jsonify({'message': f'Error applying batch: {e}'}), 500
+
+def get_apps_by_accounts(account_ids):
+    """
+    Restituisce, per ciascun account indicato, l'elenco delle app collegate (incluse quelle
+    nascoste) ordinato per ordine personalizzato e nome: {account_id: [app, ...]}.
+    La ricerca parte dall'indice app_accounts(account_id, app_id), quindi il costo dipende
+    solo dal numero di collegamenti degli account richiesti e non dalla dimensione del catalogo.
+    """
+    result = {account_id: [] for account_id in account_ids}
+    if not result:
+        return result
+    placeholders = ','.join('?' * len(result))
+    query = f"""
+        SELECT aa.account_id, a.id, a.name, a.folder, a."order", a.is_hidden
+        FROM app_accounts aa
+        JOIN apps a ON a.id = aa.app_id
+        WHERE aa.account_id IN ({placeholders})
+        ORDER BY aa.account_id, a."order", a.name
+    """
+    conn = get_db_connection(readonly=True)
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    for account_id, app_id, name, folder, order, is_hidden in cursor.execute(query, list(result)):
+        result[account_id].append({'id': app_id, 'name': name, 'folder': folder, 'order': order, 'is_hidden': is_hidden})
+    return result
+
+def _existing_account_ids(account_ids):
+    """Restituisce gli id (tra quelli indicati) che corrispondono a un account esistente."""
+    conn = get_db_connection(readonly=True)
+    return _existing_ids(conn.cursor(), 'accounts', account_ids)
+
+@app.route('/api/accounts/<int:account_id>/apps')
+@login_required
+def get_account_apps_api(account_id):
+    """
+    API endpoint che restituisce tutte le app collegate a un account (es. per un account compromesso).
+    """
+    if not _existing_account_ids([account_id]):
+        return jsonify({'message': f'Account ID {account_id} not found'}), 404
+    return jsonify({'account_id': account_id, 'apps': get_apps_by_accounts([account_id])[account_id]})
+
+@app.route('/api/accounts/apps')
+@login_required
+def get_accounts_apps_api():
+    """
+    API endpoint che restituisce le app collegate a più account: ?ids=1,2,3.
+    Risposta: {"accounts": {"1": [...], "2": [...]}, "not_found": [...]}.
+    """
+    try:
+        account_ids = list(dict.fromkeys(int(value) for value in request.args.get('ids', '').split(',') if value.strip()))
+    except ValueError:
+        return jsonify({'message': 'ids must be a comma-separated list of integers'}), 400
+    if not account_ids:
+        return jsonify({'message': 'Missing ids'}), 400
+    if len(account_ids) > REVERSE_LOOKUP_MAX_IDS:
+        return jsonify({'message': f'Too many ids (max {REVERSE_LOOKUP_MAX_IDS})'}), 400
+
+    existing = _existing_account_ids(account_ids)
+    found = [account_id for account_id in account_ids if account_id in existing]
+    apps_by_account = get_apps_by_accounts(found)
+    return jsonify({
+        'accounts': {str(account_id): apps_by_account[account_id] for account_id in found},
+        'not_found': [account_id for account_id in account_ids if account_id not in existing]
+    })
 
 @app.route('/api/accounts', methods=['POST']) # Changed route
-# @login_required # Temporarily removed
+@login_required
 def add_new_account_api(): # Changed function name
     """
     API endpoint per aggiungere un nuovo account.
@@ -208,70 +1734,60 @@ def add_new_account_api(): # Changed function name
     if not name:
         return jsonify({'message': 'Missing account name'}, 400)
 
-    conn = get_db_connection()
     try:
-        cursor = conn.execute(
+        account_id = run_write(lambda cursor: cursor.execute(
             'INSERT INTO accounts (name, abbreviation) VALUES (?, ?)',
             (name, abbreviation)
-        )
-        conn.commit()
-        return jsonify({'message': 'Account added successfully', 'id': cursor.lastrowid})
+        ).lastrowid)
+        return jsonify({'message': 'Account added successfully', 'id': account_id})
     except sqlite3.IntegrityError:
         return jsonify({'message': 'An account with this name already exists'}, 409) # 409 Conflict
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'message': f'Error adding account: {e}'}, 500)
-    finally:
-        conn.close()
 
 @app.route('/api/accounts/<int:account_id>', methods=['DELETE']) # Changed route
-# @login_required # Temporarily removed
+@login_required
 def delete_account_api(account_id): # Changed function name
     """
     API endpoint per eliminare un account e tutte le sue associazioni.
     """
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
+    def delete_account(cursor):
         cursor.execute('DELETE FROM app_accounts WHERE account_id = ?', (account_id,))
         cursor.execute('DELETE FROM accounts WHERE id = ?', (account_id,))
-        conn.commit()
+
+    try:
+        run_write(delete_account)
         return jsonify({'message': f'Account ID {account_id} deleted successfully'})
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'message': f'Error deleting account: {e}'}, 500)
-    finally:
-        conn.close()
 
 @app.route('/api/accounts/<int:account_id>', methods=['PUT']) # Changed route
-# @login_required # Temporarily removed
+@login_required
 def update_account_settings_api(account_id): # Changed function name
     """
     API endpoint per aggiornare le impostazioni (ordine, visibilità) di un account.
     """
     data = request.get_json()
-    order = data.get('order', type=int)
+    try:
+        order = int(data.get('order'))
+    except (TypeError, ValueError):
+        order = None # Senza un ordine valido resta quello attuale (NULL romperebbe la paginazione keyset)
     is_hidden = 1 if data.get('is_hidden') else 0 # From boolean in JSON
 
     if account_id is None:
         return jsonify({'message': 'Missing account_id'}, 400)
 
-    conn = get_db_connection()
     try:
-        conn.execute(
-            'UPDATE accounts SET "order" = ?, is_hidden = ? WHERE id = ?',
+        run_write(lambda cursor: cursor.execute(
+            'UPDATE accounts SET "order" = COALESCE(?, "order"), is_hidden = ? WHERE id = ?',
             (order, is_hidden, account_id)
-        )
-        conn.commit()
+        ))
         return jsonify({'message': f'Account ID {account_id} settings updated successfully'})
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'message': f'Error updating account settings: {e}'}, 500)
-    finally:
-        conn.close()
             
 @app.route('/api/apps', methods=['POST']) # Changed route
-# @login_required # Temporarily removed
+@login_required
 def add_new_app_api(): # Changed function name
     """
     API endpoint per aggiungere una nuova applicazione.
@@ -283,68 +1799,989 @@ def add_new_app_api(): # Changed function name
     if not name or not folder:
         return jsonify({'message': 'Missing app name or folder'}, 400)
 
-    conn = get_db_connection()
     try:
-        cursor = conn.execute(
+        app_id = run_write(lambda cursor: cursor.execute(
             'INSERT INTO apps (name, folder) VALUES (?, ?)',
             (name, folder)
-        )
-        conn.commit()
-        return jsonify({'message': 'App added successfully', 'id': cursor.lastrowid})
+        ).lastrowid)
+        return jsonify({'message': 'App added successfully', 'id': app_id})
     except sqlite3.IntegrityError:
         return jsonify({'message': 'An app with this name already exists'}, 409) # 409 Conflict
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'message': f'Error adding app: {e}'}, 500)
-    finally:
-        conn.close()
 
 @app.route('/api/apps/<int:app_id>', methods=['DELETE']) # Changed route
-# @login_required # Temporarily removed
+@login_required
 def delete_app_api(app_id): # Changed function name
     """
     API endpoint per eliminare un'applicazione e tutte le sue associazioni.
     """
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
+    def delete_app(cursor):
         cursor.execute('DELETE FROM app_accounts WHERE app_id = ?', (app_id,))
         cursor.execute('DELETE FROM apps WHERE id = ?', (app_id,))
-        conn.commit()
+
+    try:
+        run_write(delete_app)
         return jsonify({'message': f'App ID {app_id} deleted successfully'})
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'message': f'Error deleting app: {e}'}, 500)
-    finally:
-        conn.close()
 
 @app.route('/api/apps/<int:app_id>', methods=['PUT']) # Changed route
-# @login_required # Temporarily removed
+@login_required
 def update_app_settings_api(app_id): # Changed function name
     """
     API endpoint per aggiornare le impostazioni (ordine, visibilità) di un'applicazione.
     """
     data = request.get_json()
-    order = data.get('order', type=int)
+    try:
+        order = int(data.get('order'))
+    except (TypeError, ValueError):
+        order = None # Senza un ordine valido resta quello attuale (NULL romperebbe la paginazione keyset)
     is_hidden = 1 if data.get('is_hidden') else 0
 
     if app_id is None:
         return jsonify({'message': 'Missing app_id'}, 400)
 
-    conn = get_db_connection()
     try:
-        conn.execute(
-            'UPDATE apps SET "order" = ?, is_hidden = ? WHERE id = ?',
+        run_write(lambda cursor: cursor.execute(
+            'UPDATE apps SET "order" = COALESCE(?, "order"), is_hidden = ? WHERE id = ?',
             (order, is_hidden, app_id)
-        )
-        conn.commit()
+        ))
         return jsonify({'message': f'App ID {app_id} settings updated successfully'})
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'message': f'Error updating app settings: {e}'}, 500)
+
+def _longest_increasing_run(keys):
+    """
+    Restituisce gli indici di una sottosequenza strettamente crescente di lunghezza massima
+    (patience sorting, O(n log n)). Le voci corrispondenti possono mantenere il loro "order".
+    """
+    tails = [] # tails[k] = indice dell'ultimo elemento della migliore sequenza lunga k + 1
+    tail_keys = []
+    previous = [None] * len(keys)
+    for i, key in enumerate(keys):
+        k = bisect.bisect_left(tail_keys, key)
+        if k > 0:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_keys.append(key)
+        else:
+            tails[k] = i
+            tail_keys[k] = key
+    result = set()
+    i = tails[-1] if tails else None
+    while i is not None:
+        result.add(i)
+        i = previous[i]
+    return result
+
+def _plan_reorder(current, ordered_ids):
+    """
+    Calcola i nuovi valori di "order" per portare le voci all'ordine richiesto.
+    'current' è la lista (id, order) nell'ordine attuale; 'ordered_ids' elenca tutte o parte
+    delle voci nel nuovo ordine: le voci elencate si scambiano le posizioni che occupano,
+    quelle non elencate restano dove sono.
+    Le voci già in ordine crescente mantengono il loro valore e le altre ricevono un valore
+    nello spazio libero tra le vicine, quindi spostare una sola voce aggiorna di solito una
+    sola riga. Solo se lo spazio è esaurito tutte le voci vengono rinumerate a passi di ORDER_GAP.
+    Restituisce (lista di (nuovo_order, id) da scrivere, True se c'è stato un ribilanciamento).
+    """
+    listed = set(ordered_ids)
+    replacements = iter(ordered_ids)
+    sequence = [next(replacements) if item_id in listed else item_id for item_id, _ in current]
+    keys_by_id = dict(current)
+    keys = [keys_by_id[item_id] if keys_by_id[item_id] is not None else 0 for item_id in sequence]
+
+    keep = _longest_increasing_run(keys)
+    new_keys = list(keys)
+    i = 0
+    while i < len(sequence):
+        if i in keep:
+            i += 1
+            continue
+        # Blocco di voci da spostare tra due voci che restano ferme
+        end = i
+        while end < len(sequence) and end not in keep:
+            end += 1
+        count = end - i
+        low = new_keys[i - 1] if i > 0 else None
+        high = keys[end] if end < len(sequence) else None
+        if low is None and high is None:
+            low = 0
+        if high is None:
+            block = [low + ORDER_GAP * (n + 1) for n in range(count)]
+        elif low is None:
+            block = [high - ORDER_GAP * (count - n) for n in range(count)]
+        elif high - low > count:
+            step = (high - low) // (count + 1)
+            block = [low + step * (n + 1) for n in range(count)]
+        else:
+            # Spazio esaurito: rinumera tutte le voci mantenendo il nuovo ordine
+            rebalanced = [ORDER_GAP * (n + 1) for n in range(len(sequence))]
+            updates = [(key, item_id) for key, item_id in zip(rebalanced, sequence) if keys_by_id[item_id] != key]
+            return updates, True
+        new_keys[i:end] = block
+        i = end
+
+    updates = [(key, item_id) for key, item_id in zip(new_keys, sequence) if keys_by_id[item_id] != key]
+    return updates, False
+
+def _reorder(table, ordered_ids, folder=None):
+    """
+    Applica un nuovo ordinamento alle voci di 'table' (solo quelle della cartella indicata,
+    per le app) in un'unica transazione. Restituisce una risposta JSON.
+    """
+    if (not isinstance(ordered_ids, list) or not ordered_ids
+            or not all(isinstance(item_id, int) and not isinstance(item_id, bool) for item_id in ordered_ids)):
+        return jsonify({'message': "'ids' must be a non-empty list of integers"}), 400
+    if len(set(ordered_ids)) != len(ordered_ids):
+        return jsonify({'message': "'ids' contains duplicates"}), 400
+
+    def reorder(cursor):
+        if folder is None:
+            rows = cursor.execute(f'SELECT id, "order" FROM {table} ORDER BY "order", name').fetchall()
+        else:
+            rows = cursor.execute(f'SELECT id, "order" FROM {table} WHERE folder = ? ORDER BY "order", name', (folder,)).fetchall()
+        current = [(row[0], row[1]) for row in rows]
+        known_ids = {item_id for item_id, _ in current}
+        unknown = [item_id for item_id in ordered_ids if item_id not in known_ids]
+        if unknown:
+            return unknown, None, False
+
+        updates, rebalanced = _plan_reorder(current, ordered_ids)
+        cursor.executemany(f'UPDATE {table} SET "order" = ? WHERE id = ?', updates)
+        return None, len(updates), rebalanced
+
+    try:
+        unknown, updated, rebalanced = run_write(reorder)
+        if unknown:
+            return jsonify({'message': f'Unknown ids for this list: {unknown}'}), 400
+        return jsonify({'message': 'Order updated successfully', 'updated': updated, 'rebalanced': rebalanced})
+    except sqlite3.Error as e:
+        return jsonify({'message': f'Error updating order: {e}'}), 500
+
+@app.route('/api/apps/order', methods=['PUT'])
+@login_required
+def reorder_apps_api():
+    """
+    API endpoint per riordinare le app di una cartella in un'unica richiesta.
+    Corpo: {"folder": "Social", "ids": [5, 2, 9]} con tutte o parte delle app della cartella nel nuovo ordine.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('folder'):
+        return jsonify({'message': 'Missing folder'}), 400
+    return _reorder('apps', data.get('ids'), folder=data['folder'])
+
+@app.route('/api/accounts/order', methods=['PUT'])
+@login_required
+def reorder_accounts_api():
+    """
+    API endpoint per riordinare l'elenco degli account in un'unica richiesta.
+    Corpo: {"ids": [3, 1, 4]} con tutti o parte degli account nel nuovo ordine.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Invalid JSON body'}), 400
+    return _reorder('accounts', data.get('ids'))
+
+@app.route('/api/export.xlsx')
+@login_required
+def export_xlsx_api():
+    """
+    API endpoint che esporta account, app e matrice delle associazioni in un file XLSX con la
+    stessa struttura letta da Dati/import_data.py. Il file viene generato in modalità write_only
+    su un file temporaneo e poi inviato a blocchi.
+    """
+    conn = get_db_connection(readonly=True)
+    conn.execute('BEGIN') # Fotografia coerente di tutte le tabelle
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    try:
+        write_xlsx(conn, output)
+    except sqlite3.Error as e:
+        output.close()
+        return jsonify({'message': f'Error exporting data: {e}'}), 500
+    finally:
+        conn.rollback()
+    output.seek(0)
+    return send_file(
+        output, as_attachment=True, download_name='AppCell.xlsx',
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+@app.route('/api/export.csv')
+@login_required
+def export_csv_api():
+    """
+    API endpoint che esporta in CSV un foglio ('POCO', predefinito, con app e matrice delle
+    associazioni, oppure 'Account' con ?sheet=Account). Le righe vengono inviate in streaming
+    man mano che sono lette dal database.
+    """
+    sheet = request.args.get('sheet', APP_SHEET)
+    if sheet not in SHEET_ROWS:
+        return jsonify({'message': f"sheet must be one of: {', '.join(SHEET_ROWS)}"}), 400
+    conn = get_db_connection(readonly=True)
+    conn.execute('BEGIN') # Chiusa da close_db_connections() al termine dello streaming
+    return app.response_class(
+        stream_with_context(iter_csv(conn, sheet)), mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={sheet}.csv'}
+    )
+
+# --- Sincronizzazione incrementale (/api/changes) ---
+# Il registro 'change_log' è popolato dai trigger creati da Dati/database.py (migrazione 6).
+
+def _change_log_state(cursor):
+    """Restituisce (versione corrente, versione minima ricostruibile) del registro delle modifiche."""
+    current = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    floor = cursor.execute("SELECT value FROM change_log_meta WHERE name = 'floor'").fetchone()
+    return (current[0] if current else 0), (floor[0] if floor else 0)
+
+def _rows_by_id(cursor, query, ids):
+    """Esegue 'query' (con un segnaposto {ids}) a blocchi di id e restituisce {id: riga}."""
+    rows = {}
+    for start in range(0, len(ids), BATCH_CHUNK_SIZE):
+        chunk = ids[start:start + BATCH_CHUNK_SIZE]
+        for row in cursor.execute(query.format(ids=','.join('?' * len(chunk))), chunk):
+            rows[row['id']] = dict(row)
+    return rows
+
+def get_changes(cursor, since, limit):
+    """
+    Restituisce le modifiche successive alla versione 'since'. Per ogni riga modificata (anche
+    più volte) viene riportato solo lo stato attuale: 'upsert' con i dati correnti se la riga
+    esiste ancora, 'delete' altrimenti. Le righe sono ordinate per ultima modifica, quindi
+    'version' è l'ultima versione inclusa per intero e può essere usata come 'since' successivo.
+    """
+    changed = cursor.execute("""
+        SELECT entity, entity_id, related_id, MAX(version) AS version
+        FROM change_log
+        WHERE version > ?
+        GROUP BY entity, entity_id, related_id
+        ORDER BY version
+        LIMIT ?
+    """, (since, limit + 1)).fetchall()
+    has_more = len(changed) > limit
+    changed = changed[:limit]
+
+    ids = {'apps': [], 'accounts': []}
+    pairs = []
+    for row in changed:
+        if row['entity'] == 'app_accounts':
+            pairs.append((row['entity_id'], row['related_id']))
+        else:
+            ids[row['entity']].append(row['entity_id'])
+
+    apps = _rows_by_id(cursor, 'SELECT id, name, folder, "order", is_hidden FROM apps WHERE id IN ({ids})', ids['apps'])
+    accounts = _rows_by_id(cursor, 'SELECT id, name, abbreviation, "order", is_hidden FROM accounts WHERE id IN ({ids})', ids['accounts'])
+    linked = set()
+    for start in range(0, len(pairs), BATCH_CHUNK_SIZE):
+        linked |= _existing_pairs(cursor, pairs[start:start + BATCH_CHUNK_SIZE])
+
+    result = {
+        'apps': {'upsert': [apps[i] for i in ids['apps'] if i in apps], 'delete': [i for i in ids['apps'] if i not in apps]},
+        'accounts': {'upsert': [accounts[i] for i in ids['accounts'] if i in accounts], 'delete': [i for i in ids['accounts'] if i not in accounts]},
+        'links': {'upsert': [list(p) for p in pairs if p in linked], 'delete': [list(p) for p in pairs if p not in linked]}
+    }
+    return result, (changed[-1]['version'] if changed else since), has_more
+
+def get_snapshot(cursor):
+    """Istantanea completa delle tabelle sincronizzate, nello stesso formato delle modifiche."""
+    return {
+        'apps': [dict(row) for row in cursor.execute('SELECT id, name, folder, "order", is_hidden FROM apps ORDER BY id')],
+        'accounts': [dict(row) for row in cursor.execute('SELECT id, name, abbreviation, "order", is_hidden FROM accounts ORDER BY id')],
+        'links': [[row[0], row[1]] for row in cursor.execute('SELECT app_id, account_id FROM app_accounts ORDER BY app_id, account_id')]
+    }
+
+@app.route('/api/changes')
+@login_required
+def get_changes_api():
+    """
+    API endpoint per la sincronizzazione incrementale: ?since=N&limit=M.
+    Se N è ancora nel registro restituisce {"full": false, "version", "has_more", "apps",
+    "accounts", "links"} con le modifiche successive a N; se il client è troppo indietro
+    (registro già compattato), se N manca o non è valido, restituisce {"full": true, "version",
+    "snapshot"} con tutti i dati. Il client salva 'version' e la usa come 'since' successivo.
+    """
+    try:
+        since = int(request.args['since']) if 'since' in request.args else None
+        limit = min(max(int(request.args.get('limit', CHANGES_DEFAULT_LIMIT)), 1), CHANGES_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'message': 'since and limit must be integers'}), 400
+
+    conn = get_db_connection(readonly=True)
+    cursor = conn.cursor()
+    try:
+        conn.execute('BEGIN') # Versione e dati letti dalla stessa fotografia del database
+        current, floor = _change_log_state(cursor)
+        if since is None or since < floor or since > current:
+            return jsonify({'full': True, 'version': current, 'snapshot': get_snapshot(cursor)})
+        changes, version, has_more = get_changes(cursor, since, limit)
+        return jsonify({'full': False, 'version': current if not has_more else version, 'has_more': has_more, **changes})
+    except sqlite3.OperationalError as e:
+        return jsonify({'message': f'Change log not available, run Dati/database.py: {e}'}), 503
+    finally:
+        conn.rollback()
+
+# --- Notifiche in tempo reale (/api/events, Server-Sent Events) ---
+
+def get_change_notice(cursor, since):
+    """
+    Riassume le modifiche registrate dopo la versione 'since' in {"apps": [...], "accounts": [...]}:
+    gli id di app e account modificati (per i collegamenti, entrambi gli id coinvolti).
+    """
+    apps, accounts = set(), set()
+    for entity, entity_id, related_id in cursor.execute(
+        'SELECT DISTINCT entity, entity_id, related_id FROM change_log WHERE version > ?', (since,)
+    ):
+        if entity == 'accounts':
+            accounts.add(entity_id)
+        else:
+            apps.add(entity_id)
+            if related_id is not None:
+                accounts.add(related_id)
+    return {'apps': sorted(apps), 'accounts': sorted(accounts)}
+
+def _sse_message(event, data, event_id=None):
+    """Formatta un messaggio Server-Sent Events."""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', 'data: ' + json.dumps(data, separators=(',', ':')), '', '']
+    return '\n'.join(lines)
+
+class ChangeFeed:
+    """
+    Distribuisce le notifiche di modifica a tutti i client collegati a /api/events.
+    Un solo thread per processo legge il registro delle modifiche (subito dopo le scritture
+    degli endpoint, tramite notify(), e ogni EVENTS_POLL_INTERVAL secondi per quelle di altri
+    processi), serializza la notifica una volta sola e la aggiunge a un buffer circolare;
+    i client restano in attesa sulla stessa Condition senza interrogare il database.
+    Con worker asincroni (es. gunicorn -k gevent) ogni client inattivo costa solo una greenlet.
+    Ogni dispositivo ha il proprio; il thread termina dopo DEVICE_IDLE_TIMEOUT secondi senza client.
+    """
+    def __init__(self, device):
+        self.device = device
+        self.listeners = 0
+        self._last_used = time.monotonic()
+        self._condition = threading.Condition()
+        self._wakeup = threading.Event()
+        self._events = collections.deque(maxlen=EVENTS_BUFFER_SIZE) # (versione precedente, versione, messaggio)
+        self._version = None
+        self._epoch = 0 # Aumenta quando la versione torna indietro (es. dopo il ripristino di una copia)
+        self._failed = False
+        self._thread = None
+
+    def notify(self):
+        """Chiede al thread di leggere subito le nuove modifiche (se il thread è attivo)."""
+        self._wakeup.set()
+
+    def version(self):
+        """Ultima versione pubblicata (attende l'avvio del thread)."""
+        with self._condition:
+            self._last_used = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'change-feed-{self.device.name}', daemon=True)
+                self._thread.start()
+            self._condition.wait_for(lambda: self._version is not None or self._failed, timeout=EVENTS_HEARTBEAT)
+            return self._version
+
+    def _run(self):
+        conn = None
+        while True:
+            try:
+                if conn is None:
+                    uri = 'file:' + quote(os.path.abspath(self.device.db_file)) + '?mode=ro'
+                    conn = sqlite3.connect(uri, uri=True)
+                    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}')
+                self._publish(conn.cursor())
+            except sqlite3.Error as e:
+                app.logger.warning('Lettura del registro delle modifiche non riuscita: %s', e)
+                with self._condition:
+                    self._failed = True
+                    self._condition.notify_all()
+                if conn is not None:
+                    conn.close()
+                conn = None
+            self._wakeup.wait(EVENTS_POLL_INTERVAL)
+            self._wakeup.clear()
+            with self._condition:
+                if self.listeners == 0 and time.monotonic() - self._last_used > DEVICE_IDLE_TIMEOUT:
+                    self._thread = None
+                    self._version = None
+                    if conn is not None:
+                        conn.close()
+                    return
+
+    def _publish(self, cursor):
+        cursor.execute('BEGIN')
+        try:
+            current, floor = _change_log_state(cursor)
+            previous = self._version
+            rewound = previous is not None and current < previous
+            if previous is None or current == previous:
+                message = None
+            elif rewound or previous < floor:
+                message = _sse_message('reset', {'version': current}, current)
+            else:
+                message = _sse_message('change', {'version': current, **get_change_notice(cursor, previous)}, current)
+        finally:
+            cursor.execute('ROLLBACK')
+        with self._condition:
+            self._failed = False
+            if rewound:
+                # Le versioni nel buffer non sono più confrontabili con quelle nuove
+                self._events.clear()
+                self._epoch += 1
+            if message is not None:
+                self._events.append((previous, current, message))
+            if previous is None or message is not None:
+                self._version = current
+                self._condition.notify_all()
+
+    def listen(self, last_version):
+        """
+        Genera i messaggi per un client a partire da 'last_version' (un heartbeat se per
+        EVENTS_HEARTBEAT secondi non arriva nulla). Se il client è rimasto indietro oltre il
+        buffer, o se la versione è tornata indietro, riceve un evento 'reset' e deve
+        risincronizzarsi con /api/changes.
+        """
+        with self._condition:
+            self.listeners += 1
+            epoch = self._epoch
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._version > last_version or self._epoch != epoch, timeout=EVENTS_HEARTBEAT)
+                    events = [event for event in self._events if event[1] > last_version]
+                    version = self._version
+                    rewound = self._epoch != epoch
+                    epoch = self._epoch
+                if rewound:
+                    yield _sse_message('reset', {'version': version}, version)
+                    last_version = version
+                    continue
+                if not events:
+                    yield ': heartbeat\n\n'
+                elif events[0][0] > last_version:
+                    yield _sse_message('reset', {'version': version}, version)
+                else:
+                    yield ''.join(message for _, _, message in events)
+                last_version = max(last_version, version)
+        finally:
+            with self._condition:
+                self.listeners -= 1
+                self._last_used = time.monotonic()
+
+@app.route('/api/events')
+@login_required
+def events_api():
+    """
+    API endpoint Server-Sent Events: invia un evento 'change' con {"version", "apps", "accounts"}
+    (id delle app e degli account modificati) a ogni modifica dei dati. L'id di ogni evento è la
+    versione del registro delle modifiche: alla riconnessione il browser la rimanda in
+    Last-Event-ID e riceve le modifiche perse, oppure 'reset' se sono già state compattate.
+    """
+    change_feed = current_device().change_feed
+    version = change_feed.version()
+    if version is None:
+        return jsonify({'message': 'Change log not available, run Dati/database.py'}), 503
+    try:
+        last_version = int(request.headers.get('Last-Event-ID', request.args.get('last_event_id', '')))
+    except ValueError:
+        last_version = None
+
+    first = f'retry: {EVENTS_RETRY_MS}\n\n'
+    if last_version is None or last_version == version:
+        first += _sse_message('version', {'version': version}, version)
+    elif last_version > version: # Versione di prima di un ripristino: il client deve risincronizzarsi
+        first += _sse_message('reset', {'version': version}, version)
+    else:
+        conn = get_db_connection(readonly=True)
+        cursor = conn.cursor()
+        try:
+            conn.execute('BEGIN')
+            current, floor = _change_log_state(cursor)
+            if last_version < floor:
+                first += _sse_message('reset', {'version': current}, current)
+            else:
+                first += _sse_message('change', {'version': current, **get_change_notice(cursor, last_version)}, current)
+        except sqlite3.OperationalError as e:
+            return jsonify({'message': f'Change log not available, run Dati/database.py: {e}'}), 503
+        finally:
+            conn.rollback()
+        version = max(version, current)
+
+    def generate():
+        yield first
+        yield from change_feed.listen(version)
+
+    return app.response_class(
+        generate(), mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# --- Scelta del dispositivo e ricerche su tutti i dispositivi (/api/devices) ---
+
+DEVICE_PREFIX = re.compile(r'^/devices/([^/]+)(/.*)$')
+
+class DevicePrefixMiddleware:
+    """
+    Middleware WSGI: /devices/<nome>/<percorso> raggiunge la stessa route di /<percorso>, con il
+    nome del dispositivo nell'environ ('appmanager.device'); il prefisso passa in SCRIPT_NAME.
+    """
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        match = DEVICE_PREFIX.match(environ.get('PATH_INFO', ''))
+        if match:
+            environ['appmanager.device'] = match.group(1)
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + environ['PATH_INFO'][:match.start(2)]
+            environ['PATH_INFO'] = match.group(2)
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = DevicePrefixMiddleware(app.wsgi_app)
+
+@app.before_request
+def select_device():
+    """Sceglie il dispositivo della richiesta dal prefisso /devices/<nome>/ o dall'header X-Device."""
+    name = request.environ.get('appmanager.device') or request.headers.get(DEVICE_HEADER)
+    if not name:
+        devices.sweep()
+        return None
+    g.device_used = True
+    if not DEVICE_NAME.match(name):
+        return jsonify({'message': f'Invalid device name: {name}'}), 400
+    device = devices.get(name)
+    if device is None:
+        return jsonify({'message': f'Unknown device: {name}'}), 404
+    g.device = device
+    return None
+
+@app.after_request
+def add_device_vary(response):
+    """
+    Le risposte che dipendono dal dispositivo variano con l'header X-Device: una cache
+    intermedia o il browser non devono riusarle (né i loro 304) per un altro dispositivo.
+    """
+    if g.get('device_used'):
+        response.vary.add(DEVICE_HEADER)
+    return response
+
+_fanout_lock = threading.Lock()
+_fanout_executor = None
+
+def device_files():
+    """Restituisce {nome: file del database} per tutti i dispositivi, compreso quello predefinito."""
+    files = {DEFAULT_DEVICE: DB_FILE}
+    for name in list_devices(DEVICES_DIR):
+        files.setdefault(name, device_db_file(name, DEVICES_DIR))
+    return files
+
+def fan_out(function):
+    """
+    Esegue function(file del database) per ogni dispositivo, in parallelo su un pool di
+    DEVICE_FANOUT_WORKERS thread (SQLite rilascia il GIL durante le query).
+    Restituisce ({nome: risultato}, {nome: errore}) in ordine di nome.
+    """
+    global _fanout_executor
+    with _fanout_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(DEVICE_FANOUT_WORKERS, thread_name_prefix='device-fanout')
+    futures = {name: _fanout_executor.submit(function, db_file) for name, db_file in sorted(device_files().items())}
+    results, errors = {}, {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except sqlite3.Error as e:
+            errors[name] = str(e)
+    return results, errors
+
+def find_account(db_file, account):
+    """
+    Cerca in un database gli account con nome o abbreviazione 'account' e conta le app collegate.
+    Usa una connessione temporanea e non passa da 'devices': una ricerca su tutti i dispositivi
+    non deve togliere dalla cache quelli usati dalle richieste.
+    """
+    conn = _open_connection(readonly=True, db_file=db_file)
+    try:
+        rows = conn.execute("""
+            SELECT accounts.id, accounts.name, accounts.abbreviation, COUNT(app_accounts.app_id) AS apps
+            FROM accounts
+            LEFT JOIN app_accounts ON app_accounts.account_id = accounts.id
+            WHERE accounts.name = ? OR accounts.abbreviation = ?
+            GROUP BY accounts.id
+        """, (account, account)).fetchall()
+        return [dict(row) for row in rows]
     finally:
         conn.close()
 
+@app.route('/api/devices')
+@login_required
+def list_devices_api():
+    """API endpoint che elenca i dispositivi ('default' è quello del database principale)."""
+    return jsonify({'devices': list(sorted(device_files()))})
+
+@app.route('/api/devices/accounts')
+@login_required
+def find_account_devices_api():
+    """
+    API endpoint "quali dispositivi hanno l'account X": ?name=<nome o abbreviazione>.
+    Interroga tutti i dispositivi in parallelo e restituisce {"account", "devices": [{"device",
+    "id", "name", "abbreviation", "apps"}], "errors": {dispositivo: errore}}.
+    """
+    account = request.args.get('name', '').strip()
+    if not account:
+        return jsonify({'message': 'name is required'}), 400
+    results, errors = fan_out(lambda db_file: find_account(db_file, account))
+    found = [{'device': name, **row} for name, rows in results.items() for row in rows]
+    return jsonify({'account': account, 'devices': found, 'errors': errors})
+
+# --- Copie di sicurezza (/api/admin/backups) ---
+
+_backup_lock = threading.Lock()
+_backup_state = {'running': False, 'last': None, 'error': None}
+
+def admin_required(view):
+    """
+    Decoratore per le operazioni di amministrazione: richiede sempre un token valido di un
+    utente amministratore, indipendentemente da AUTH_REQUIRED.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.user = authenticated_user()
+        if g.user is None:
+            return jsonify({'message': 'Authentication required'}), 401
+        if not g.user['is_admin']:
+            return jsonify({'message': 'Administrator privileges required'}), 403
+        return view(*args, **kwargs)
+    return wrapped
+
+def _run_backup(db_file):
+    """Crea una copia del database db_file (in un thread separato) e ne registra l'esito in _backup_state."""
+    try:
+        info = create_backup(db_file, BACKUP_DIR, BACKUP_KEEP, BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE)
+        app.logger.info('Copia del database creata: %s (%d byte, %.1fs)', info['file'], info['bytes'], info['seconds'])
+        result = {'last': {**info, 'file': os.path.basename(info['file']),
+                           'removed': [os.path.basename(path) for path in info['removed']]}, 'error': None}
+    except (sqlite3.Error, OSError) as e:
+        app.logger.warning('Copia del database non riuscita: %s', e)
+        result = {'error': str(e)}
+    with _backup_lock:
+        _backup_state.update(result, running=False)
+
+def _backup_list():
+    """Elenco delle copie disponibili per il dispositivo corrente, dalla più recente."""
+    return [
+        {'file': os.path.basename(path), 'created_at': stamp.isoformat(), 'bytes': os.path.getsize(path)}
+        for stamp, path in list_backups(BACKUP_DIR, current_device().db_file)
+    ]
+
+@app.route('/api/admin/backups')
+@admin_required
+def list_backups_api():
+    """API endpoint che elenca le copie disponibili e lo stato dell'ultima copia avviata."""
+    with _backup_lock:
+        state = dict(_backup_state)
+    return jsonify({**state, 'backups': _backup_list()})
+
+@app.route('/api/admin/backups', methods=['POST'])
+@admin_required
+def create_backup_api():
+    """
+    API endpoint che avvia una copia del database in background e risponde subito 202: la
+    copia procede a piccoli passi senza bloccare le altre richieste. L'esito si legge con
+    GET /api/admin/backups.
+    """
+    with _backup_lock:
+        if _backup_state['running']:
+            return jsonify({'message': 'Backup already running'}), 409
+        _backup_state['running'] = True
+    threading.Thread(target=_run_backup, args=(current_device().db_file,), name='backup', daemon=True).start()
+    return jsonify({'message': 'Backup started'}), 202
+
+@app.route('/api/admin/restore', methods=['POST'])
+@admin_required
+def restore_backup_api():
+    """
+    API endpoint per ripristinare una copia: {"file": "<nome>"} oppure {"at": "AAAA-MM-GGTHH:MM:SS"}
+    per la copia più recente fino a quella data. Lo stato attuale viene prima salvato in una
+    nuova copia, restituita come 'safety_backup'.
+    """
+    data = request.get_json(silent=True) or {}
+    db_file = current_device().db_file
+    available = {os.path.basename(path): path for _, path in list_backups(BACKUP_DIR, db_file)}
+    if data.get('file') is not None:
+        snapshot = available.get(data['file'])
+    else:
+        try:
+            at = datetime.fromisoformat(data['at']) if data.get('at') else None
+        except (TypeError, ValueError):
+            return jsonify({'message': 'at must be an ISO date'}), 400
+        snapshot = find_backup(at, BACKUP_DIR, db_file)
+    if snapshot is None:
+        return jsonify({'message': 'Backup not found'}), 404
+
+    with _backup_lock:
+        if _backup_state['running']:
+            return jsonify({'message': 'Backup already running'}), 409
+        _backup_state['running'] = True
+    try:
+        safety = restore_backup(snapshot, db_file, BACKUP_DIR, BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE)
+    except (sqlite3.Error, OSError) as e:
+        return jsonify({'message': f'Restore failed: {e}'}), 500
+    finally:
+        with _backup_lock:
+            _backup_state['running'] = False
+    user_cache.invalidate()
+    bump_data_version()
+    app.logger.info('Database ripristinato da %s', snapshot)
+    return jsonify({'message': 'Restore successful', 'restored': os.path.basename(snapshot),
+                    'safety_backup': os.path.basename(safety['file'])})
+
+# --- Manutenzione periodica del database ---
+
+def _compact_change_log_task(conn):
+    removed, floor = compact_change_log(conn, CHANGE_LOG_RETENTION, CHANGE_LOG_MAX_ROWS)
+    return 'ok', f'{removed} righe eliminate, versione minima {floor}'
+
+def _incremental_vacuum_task(conn):
+    freed = incremental_vacuum(conn, MAINTENANCE_VACUUM_PAGES)
+    if METRICS_ENABLED:
+        metrics.inc('appmanager_maintenance_pages_freed_total', (), freed)
+    return 'ok', f'{freed} pagine liberate'
+
+def _analyze_task(conn):
+    analyze_db(conn, MAINTENANCE_ANALYSIS_LIMIT)
+    return 'ok', ''
+
+def _optimize_task(conn):
+    optimize_db(conn)
+    return 'ok', ''
+
+def _wal_checkpoint_task(conn):
+    busy, log_pages, checkpointed = checkpoint_wal(conn)
+    return 'busy' if busy else 'ok', f'{checkpointed}/{log_pages} pagine del WAL'
+
+# Attività in ordine di esecuzione: il checkpoint per ultimo, dopo le scritture delle altre.
+# Ognuna restituisce (esito, dettaglio per il log).
+MAINTENANCE_TASKS = {
+    'compact_change_log': _compact_change_log_task,
+    'incremental_vacuum': _incremental_vacuum_task,
+    'optimize': _optimize_task,
+    'analyze': _analyze_task,
+    'wal_checkpoint': _wal_checkpoint_task,
+}
+
+_last_request_at = time.monotonic()
+
+@app.before_request
+def note_request_activity(exception=None):
+    """Ricorda l'ultima attività del worker, all'inizio e alla fine di ogni richiesta."""
+    global _last_request_at
+    _last_request_at = time.monotonic()
+
+app.teardown_request(note_request_activity)
+
+def _is_idle():
+    """Vero se questo worker non riceve richieste da almeno MAINTENANCE_IDLE secondi."""
+    return time.monotonic() - _last_request_at >= MAINTENANCE_IDLE
+
+class MaintenanceScheduler:
+    """
+    Esegue le attività di MAINTENANCE_TASKS ogni MAINTENANCE_INTERVALS[attività] secondi, nei
+    momenti in cui il worker è inattivo; un'attività in ritardo di oltre un intervallo viene
+    eseguita comunque. Con più worker, data dell'ultima esecuzione (maintenance_runs) e lease
+    (maintenance_lease) stanno nel database: un solo worker alla volta esegue la manutenzione,
+    e ogni attività viene eseguita una volta per intervallo in tutto.
+    Il database di ogni dispositivo ha i propri intervalli e il proprio lease.
+    Il thread non parte all'import del modulo (test, flask shell, script, master di gunicorn con
+    --preload) ma alla prima richiesta di ogni processo (vedi start_maintenance()).
+    """
+    def __init__(self):
+        self.owner = f'{os.getpid()}-{secrets.token_hex(4)}'
+        self.pid = None # Processo in cui è attivo il thread (dopo un fork va riavviato)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _open(self, db_file):
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        conn.execute(f'PRAGMA busy_timeout = {MAINTENANCE_BUSY_TIMEOUT}')
+        return conn
+
+    def due_tasks(self, conn, now):
+        """Restituisce [(attività, in ritardo)] per le attività da eseguire, nell'ordine di MAINTENANCE_TASKS."""
+        last_runs = dict(conn.execute('SELECT task, last_run FROM maintenance_runs').fetchall())
+        due = []
+        for task, interval in MAINTENANCE_INTERVALS.items():
+            if interval <= 0:
+                continue
+            if task not in last_runs:
+                due.append((task, False)) # Mai eseguita: alla prima finestra di inattività
+            elif now - last_runs[task] >= interval:
+                due.append((task, now - last_runs[task] >= 2 * interval))
+        return due
+
+    def _acquire_lease(self, conn, now):
+        conn.execute("""
+            INSERT INTO maintenance_lease (id, owner, expires_at) VALUES (1, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE maintenance_lease.expires_at < ? OR maintenance_lease.owner = excluded.owner
+        """, (self.owner, now + MAINTENANCE_LEASE_TTL, now))
+        return conn.execute('SELECT changes()').fetchone()[0] == 1
+
+    def _release_lease(self, conn):
+        conn.execute('DELETE FROM maintenance_lease WHERE owner = ?', (self.owner,))
+
+    def run_pending(self, db_file=None):
+        """
+        Esegue le attività scadute sul database db_file (predefinito: DB_FILE) se il worker è
+        inattivo (o se sono in ritardo) e se nessun altro worker sta già facendo la manutenzione
+        di quel database. Restituisce {attività: esito}.
+        """
+        db_file = db_file or DB_FILE
+        results = {}
+        conn = self._open(db_file)
+        try:
+            due = self.due_tasks(conn, time.time())
+            if not due or not (_is_idle() or any(overdue for _, overdue in due)):
+                return results
+            if not self._acquire_lease(conn, time.time()):
+                return results
+            try:
+                # Un altro worker potrebbe averle appena eseguite: si ricontrolla con il lease preso
+                for task, overdue in self.due_tasks(conn, time.time()):
+                    if not (overdue or _is_idle()):
+                        break # Sono arrivate richieste: il resto alla prossima finestra
+                    results[task] = self._run_task(conn, task, db_file)
+            finally:
+                self._release_lease(conn)
+        finally:
+            conn.close()
+        return results
+
+    def _run_task(self, conn, task, db_file):
+        start = time.perf_counter()
+        try:
+            result, detail = MAINTENANCE_TASKS[task](conn)
+        except sqlite3.Error as e:
+            result, detail = 'error', str(e)
+        elapsed = time.perf_counter() - start
+        # Anche in caso di errore si aspetta l'intervallo successivo invece di riprovare subito
+        conn.execute('INSERT OR REPLACE INTO maintenance_runs (task, last_run, seconds, result) VALUES (?, ?, ?, ?)',
+                     (task, time.time(), elapsed, result))
+        if METRICS_ENABLED:
+            metrics.inc('appmanager_maintenance_runs_total', (('task', task), ('result', result)))
+            metrics.observe('appmanager_maintenance_duration_seconds', (('task', task),), elapsed)
+        log = app.logger.warning if result == 'error' else app.logger.info
+        log('Manutenzione %s di %s: %s in %.3fs%s', task, os.path.basename(db_file), result, elapsed,
+            f' ({detail})' if detail else '')
+        return result
+
+    def _run(self):
+        while not self._stop.wait(MAINTENANCE_CHECK_INTERVAL):
+            devices.sweep()
+            db_files = [DB_FILE] + [device_db_file(name, DEVICES_DIR) for name in list_devices(DEVICES_DIR)]
+            for db_file in db_files:
+                try:
+                    self.run_pending(db_file)
+                except sqlite3.Error as e:
+                    app.logger.warning('Manutenzione del database %s non riuscita: %s', os.path.basename(db_file), e)
+
+    def start(self):
+        """Avvia il thread in questo processo, se non è già attivo."""
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.owner = f'{self.pid}-{secrets.token_hex(4)}'
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """Ferma il thread dopo l'attività in corso (all'uscita del processo)."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.pid = None
+
+maintenance = MaintenanceScheduler()
+atexit.register(maintenance.stop)
+
+@app.before_request
+def start_maintenance():
+    """Avvia la manutenzione alla prima richiesta di ogni processo (MAINTENANCE=1)."""
+    if MAINTENANCE_ENABLED and maintenance.pid != os.getpid():
+        maintenance.start()
+
+# --- Frontend compilato (SERVE_FRONTEND=1) ---
+# Serve Frontend/dist (npm run build) dalla stessa applicazione: i file con l'hash nel nome
+# non cambiano mai e vengono messi in cache per sempre, index.html viene sempre rivalidato.
+
+def send_frontend_asset(path, file_path):
+    """
+    Invia un file del frontend. Se il client accetta br o gzip e accanto al file esiste la
+    versione già compressa (.br/.gz), invia quella; i file con l'hash nel nome sono immutable.
+    """
+    mimetype = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+        if request.accept_encodings[encoding] and os.path.isfile(file_path + suffix):
+            response = send_file(file_path + suffix, mimetype=mimetype, conditional=True)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_file(file_path, mimetype=mimetype, conditional=True)
+    # send_file() aggiunge 'inline; filename=...' con il nome del file inviato (es. .gz): non serve
+    del response.headers['Content-Disposition']
+    response.vary.add('Accept-Encoding')
+    if HASHED_ASSET.match(path):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def render_index(index_file):
+    """
+    Restituisce index.html con il contenuto di /api/apps già incluso in window.__INITIAL_APPS__,
+    così la prima visualizzazione non deve aspettare la chiamata all'API.
+    """
+    with open(index_file, 'rb') as html_file:
+        html = html_file.read()
+    apps = get_cached_json('apps', get_data_grouped_by_folder)[2].rstrip()
+    # '<' compare solo dentro le stringhe JSON: con l'escape '</script>' non può chiudere il tag
+    script = b'<script>window.__INITIAL_APPS__=' + apps.replace(b'<', b'\\u003c') + b';</script>'
+    return html.replace(b'</head>', script + b'</head>', 1)
+
+def send_frontend_index():
+    """Invia index.html, sempre da rivalidare: 304 se il client ha già la versione corrente."""
+    index_file = os.path.join(FRONTEND_DIST, 'index.html')
+    if not os.path.isfile(index_file):
+        return jsonify({'message': 'Frontend not built: run npm run build in Frontend/'}), 404
+    if FRONTEND_INLINE_APPS:
+        # La pagina cambia sia con i dati sia con un nuovo build di index.html
+        name = f'index.html:{os.stat(index_file).st_mtime_ns}'
+        return cached_response(name, lambda: render_index(index_file), 'text/html')
+    response = send_file(index_file, mimetype='text/html', conditional=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def serve_frontend(path=''):
+    """
+    Route del frontend: i file esistenti in FRONTEND_DIST vengono inviati così come sono,
+    ogni altro percorso riceve index.html (le route della single-page app sono lato client).
+    """
+    if path.startswith('api/'):
+        return jsonify({'message': 'Not found'}), 404
+    file_path = safe_join(FRONTEND_DIST, path) if path else None
+    if file_path is not None and path != 'index.html' and os.path.isfile(file_path):
+        return send_frontend_asset(path, file_path)
+    return send_frontend_index()
+
+if SERVE_FRONTEND:
+    app.add_url_rule('/', 'serve_frontend', serve_frontend)
+    app.add_url_rule('/<path:path>', 'serve_frontend', serve_frontend)
+
 @app.route('/api/login', methods=['POST']) # Changed route
 def login_api(): # Changed function name
     """
@@ -356,22 +2793,24 @@ def login_api(): # Changed function name
     user = get_user_by_username(username)
 
     if user and check_password_hash(user['password_hash'], password):
-        # For now, return a placeholder token. JWT implementation will replace this.
-        # This will be replaced by a proper JWT token later
-        placeholder_token = "your_placeholder_jwt_token_here" 
-        return jsonify({'message': 'Login successful', 'token': placeholder_token, 'user_id': user['id'], 'username': user['username']})
+        return jsonify({
+            'message': 'Login successful', 'token': create_token(user), 'expires_in': TOKEN_TTL,
+            'user_id': user['id'], 'username': user['username']
+        })
     else:
-        return jsonify({'message': 'Invalid credentials'}, 401)
+        return jsonify({'message': 'Invalid credentials'}), 401
 
 @app.route('/api/logout', methods=['POST']) # Changed route
-# @login_required # Temporarily removed
+@login_required
 def logout_api(): # Changed function name
     """
     API endpoint per gestire il logout utente.
     """
-    # For token-based auth, logout is often handled client-side by deleting the token.
-    # This endpoint can be used for server-side token invalidation or just a confirmation.
-    # session.pop('user_id', None) # Session-based logout is removed
+    # Il token inviato viene revocato fino alla sua scadenza
+    token = g.get('token')
+    if token is not None:
+        token_denylist.revoke(token['jti'], token['exp'])
+        user_cache.invalidate(token['sub'])
     return jsonify({'message': 'Logout successful'})
 
 if __name__ == '__main__':
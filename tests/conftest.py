@@ -0,0 +1,61 @@
+import os
+import sys
+import uuid
+import sqlite3
+import tempfile
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+# Rende importabili Dati/*.py e Script/app.py come negli altri script del progetto
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, 'Dati'))
+sys.path.append(os.path.join(ROOT_DIR, 'Script'))
+
+# La configurazione di app.py viene letta all'import: tutti i test usano database temporanei
+TMP_DIR = tempfile.mkdtemp(prefix='appmanager-tests-')
+os.environ['APPMANAGER_DB'] = os.path.join(TMP_DIR, 'gestione.db')
+os.environ['DEVICES_DIR'] = os.path.join(TMP_DIR, 'devices')
+os.environ['BACKUP_DIR'] = os.path.join(TMP_DIR, 'backups')
+os.environ['MAINTENANCE'] = '0'
+
+@pytest.fixture(scope='session')
+def app_module():
+    from database import init_db
+    init_db(os.environ['APPMANAGER_DB'])
+    import app
+    return app
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+@pytest.fixture
+def make_device(app_module):
+    """Crea un dispositivo con un database nuovo e ne restituisce il nome."""
+    from database import init_db, device_db_file
+
+    def make():
+        name = f'test-{uuid.uuid4().hex[:12]}'
+        init_db(device_db_file(name, os.environ['DEVICES_DIR']))
+        return name
+    return make
+
+@pytest.fixture
+def auth_required(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'AUTH_REQUIRED', True)
+
+@pytest.fixture
+def user(app_module):
+    """Crea un utente nel database predefinito e restituisce (username, password)."""
+    username, password = f'user-{uuid.uuid4().hex[:8]}', 'secret'
+    conn = sqlite3.connect(app_module.DB_FILE)
+    conn.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (username, generate_password_hash(password)))
+    conn.commit()
+    conn.close()
+    return username, password
+
+@pytest.fixture
+def token(client, user):
+    """Token di accesso per 'user', ottenuto da /api/login."""
+    return client.post('/api/login', json={'username': user[0], 'password': user[1]}).get_json()['token']
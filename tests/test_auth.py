@@ -0,0 +1,55 @@
+import uuid
+import sqlite3
+
+def login(client, user):
+    response = client.post('/api/login', json={'username': user[0], 'password': user[1]})
+    assert response.status_code == 200
+    return response.get_json()['token']
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+def test_valid_token_is_accepted(client, user, auth_required):
+    token = login(client, user)
+    assert client.get('/api/manage/data', headers=bearer(token)).status_code == 200
+    assert client.get('/api/manage/data').status_code == 401
+
+def test_bad_signature_is_rejected(client, user, auth_required):
+    token = login(client, user)
+    payload, _, signature = token.partition('.')
+    forged = payload + '.' + ('A' if signature[0] != 'A' else 'B') + signature[1:]
+    assert client.get('/api/manage/data', headers=bearer(forged)).status_code == 401
+    assert client.get('/api/manage/data', headers=bearer('abc.déf')).status_code == 401
+
+def test_expired_token_is_rejected(app_module, client, user, auth_required, monkeypatch):
+    monkeypatch.setattr(app_module, 'TOKEN_TTL', -1)
+    token = login(client, user)
+    assert client.get('/api/manage/data', headers=bearer(token)).status_code == 401
+
+def test_logged_out_token_is_rejected(client, user, auth_required):
+    token = login(client, user)
+    assert client.post('/api/logout', headers=bearer(token)).status_code == 200
+    assert client.get('/api/manage/data', headers=bearer(token)).status_code == 401
+
+def test_query_token_only_for_events(app_module, client, user, auth_required):
+    token = login(client, user)
+    assert client.get(f'/api/manage/data?access_token={token}').status_code == 401
+    with app_module.app.test_request_context(f'/api/events?access_token={token}'):
+        app_module.app.preprocess_request()
+        assert app_module.authenticated_user() is not None
+
+def test_data_writes_keep_the_user_cache(app_module, client, user, auth_required):
+    token = login(client, user)
+    client.get('/api/manage/data', headers=bearer(token))
+    users_version = app_module.user_cache._users_version
+    with app_module.app.app_context():
+        before = users_version()
+    client.post('/api/apps', json={'name': f'App {uuid.uuid4().hex[:6]}', 'folder': 'Test'}, headers=bearer(token))
+    with app_module.app.app_context():
+        assert users_version() == before
+    conn = sqlite3.connect(app_module.DB_FILE)
+    conn.execute('UPDATE users SET is_admin = 1 WHERE username = ?', (user[0],))
+    conn.commit()
+    conn.close()
+    with app_module.app.app_context():
+        assert users_version() != before
@@ -0,0 +1,152 @@
+import sqlite3
+
+import pytest
+
+from database import init_db, compact_change_log
+
+@pytest.fixture
+def conn(tmp_path):
+    db_file = str(tmp_path / 'gestione.db')
+    init_db(db_file)
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    yield conn
+    conn.close()
+
+def log(conn, since=0):
+    return conn.execute(
+        'SELECT version, entity, entity_id, related_id, op FROM change_log WHERE version > ? ORDER BY version', (since,)
+    ).fetchall()
+
+def last_version(conn):
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM change_log').fetchone()[0]
+
+@pytest.mark.parametrize('table, insert, update', [
+    ('apps', "INSERT INTO apps (name, folder) VALUES ('Chat', 'Social')", "UPDATE apps SET folder = 'Lavoro'"),
+    ('accounts', "INSERT INTO accounts (name) VALUES ('mario@example.com')", "UPDATE accounts SET abbreviation = 'MR'"),
+])
+def test_one_row_per_write(conn, table, insert, update):
+    steps = [(insert, 'upsert'), (update, 'upsert'), (f'DELETE FROM {table}', 'delete')]
+    entity_id = None
+    for sql, op in steps:
+        since = last_version(conn)
+        cursor = conn.execute(sql)
+        entity_id = entity_id or cursor.lastrowid
+        assert [row[1:] for row in log(conn, since)] == [(table, entity_id, None, op)]
+
+def test_one_row_per_link_write(conn):
+    app_id = conn.execute("INSERT INTO apps (name, folder) VALUES ('Chat', 'Social')").lastrowid
+    account_id = conn.execute("INSERT INTO accounts (name) VALUES ('mario@example.com')").lastrowid
+    for sql, op in (('INSERT INTO app_accounts (app_id, account_id) VALUES (?, ?)', 'upsert'),
+                    ('DELETE FROM app_accounts WHERE app_id = ? AND account_id = ?', 'delete')):
+        since = last_version(conn)
+        conn.execute(sql, (app_id, account_id))
+        assert [row[1:] for row in log(conn, since)] == [('app_accounts', app_id, account_id, op)]
+
+def test_api_writes_log_one_row_each(client, app_module, make_device):
+    headers = {'X-Device': make_device()}
+    conn = sqlite3.connect(app_module.devices.get(headers['X-Device']).db_file)
+
+    def logged(write):
+        since = last_version(conn)
+        response = write()
+        return response, [row[1:] for row in log(conn, since)]
+
+    response, rows = logged(lambda: client.post('/api/apps', json={'name': 'Chat', 'folder': 'Social'}, headers=headers))
+    app_id = response.get_json()['id']
+    assert rows == [('apps', app_id, None, 'upsert')]
+
+    response, rows = logged(lambda: client.post('/api/accounts', json={'name': 'mario@example.com'}, headers=headers))
+    account_id = response.get_json()['id']
+    assert rows == [('accounts', account_id, None, 'upsert')]
+
+    link = {'app_id': app_id, 'account_id': account_id}
+    _, rows = logged(lambda: client.post('/api/accounts/add', json=link, headers=headers))
+    assert rows == [('app_accounts', app_id, account_id, 'upsert')]
+    _, rows = logged(lambda: client.post('/api/accounts/remove', json=link, headers=headers))
+    assert rows == [('app_accounts', app_id, account_id, 'delete')]
+    _, rows = logged(lambda: client.delete(f'/api/apps/{app_id}', headers=headers))
+    assert rows == [('apps', app_id, None, 'delete')]
+    conn.close()
+
+def test_compaction_keeps_latest_row_per_entity(conn):
+    app_id = conn.execute("INSERT INTO apps (name, folder) VALUES ('Chat', 'Social')").lastrowid
+    other_id = conn.execute("INSERT INTO apps (name, folder) VALUES ('Foto', 'Social')").lastrowid
+    account_id = conn.execute("INSERT INTO accounts (name) VALUES ('mario@example.com')").lastrowid
+    for folder in ('Social', 'Lavoro', 'Svago'):
+        conn.execute('UPDATE apps SET folder = ? WHERE id = ?', (folder, app_id))
+    conn.execute('INSERT INTO app_accounts (app_id, account_id) VALUES (?, ?)', (app_id, account_id))
+    conn.execute('DELETE FROM app_accounts WHERE app_id = ? AND account_id = ?', (app_id, account_id))
+    conn.execute('DELETE FROM apps WHERE id = ?', (other_id,))
+    latest = {}
+    for version, entity, entity_id, related_id, op in log(conn):
+        latest[(entity, entity_id, related_id)] = (version, op)
+    current = last_version(conn)
+
+    removed, floor = compact_change_log(conn)
+    rows = log(conn)
+    assert removed == 9 - len(latest)
+    assert floor == 0
+    assert {(entity, entity_id, related_id): (version, op) for version, entity, entity_id, related_id, op in rows} == latest
+    assert len(rows) == len(latest)
+
+    # Le versioni non vengono riutilizzate dopo la compattazione
+    conn.execute("UPDATE apps SET folder = 'Social' WHERE id = ?", (app_id,))
+    assert last_version(conn) == current + 1
+
+def test_compaction_raises_floor_beyond_max_rows(conn):
+    for i in range(5):
+        conn.execute("INSERT INTO apps (name, folder) VALUES (?, 'Social')", (f'App {i}',))
+    removed, floor = compact_change_log(conn, max_rows=2)
+    assert removed == 3
+    assert floor == 3
+    assert [row[0] for row in log(conn)] == [4, 5]
+
+def sync(client, headers, since, limit):
+    """Segue /api/changes a partire da 'since' fino a has_more = false; restituisce (pagine, versione finale)."""
+    pages = []
+    while True:
+        body = client.get(f'/api/changes?since={since}&limit={limit}', headers=headers).get_json()
+        assert body['full'] is False
+        pages.append(body)
+        since = body['version']
+        if not body['has_more']:
+            return pages, since
+
+def test_since_paging_is_stable(client, make_device):
+    headers = {'X-Device': make_device()}
+    base = client.get('/api/changes', headers=headers).get_json()
+    assert base['full'] is True
+
+    ids = [client.post('/api/apps', json={'name': f'App {i}', 'folder': 'Social'}, headers=headers).get_json()['id'] for i in range(7)]
+    client.put(f'/api/apps/{ids[0]}', json={'order': 5}, headers=headers)
+    client.delete(f'/api/apps/{ids[1]}', headers=headers)
+
+    # La stessa richiesta restituisce sempre la stessa pagina
+    first = client.get(f"/api/changes?since={base['version']}&limit=3", headers=headers).get_json()
+    assert client.get(f"/api/changes?since={base['version']}&limit=3", headers=headers).get_json() == first
+    assert first['has_more'] is True
+
+    pages, version = sync(client, headers, base['version'], 3)
+    upserts = [app['id'] for page in pages for app in page['apps']['upsert']]
+    deletes = [app_id for page in pages for app_id in page['apps']['delete']]
+    assert sorted(upserts) == sorted(ids[:1] + ids[2:])
+    assert deletes == [ids[1]]
+    assert next(app for page in pages for app in page['apps']['upsert'] if app['id'] == ids[0])['order'] == 5
+
+    # Una modifica fatta durante la sincronizzazione arriva nella pagina successiva
+    client.put(f'/api/apps/{ids[2]}', json={'is_hidden': True}, headers=headers)
+    pages, _ = sync(client, headers, version, 3)
+    assert [app['id'] for page in pages for app in page['apps']['upsert']] == [ids[2]]
+
+def test_since_before_floor_returns_snapshot(client, app_module, make_device):
+    headers = {'X-Device': make_device()}
+    for i in range(4):
+        client.post('/api/apps', json={'name': f'App {i}', 'folder': 'Social'}, headers=headers)
+    conn = sqlite3.connect(app_module.devices.get(headers['X-Device']).db_file, isolation_level=None)
+    _, floor = compact_change_log(conn, max_rows=1)
+    conn.close()
+
+    body = client.get(f'/api/changes?since={floor - 1}', headers=headers).get_json()
+    assert body['full'] is True
+    assert len(body['snapshot']['apps']) == 4
+    assert client.get(f'/api/changes?since={floor}', headers=headers).get_json()['full'] is False
@@ -0,0 +1,32 @@
+import time
+
+def test_device_responses_vary_on_device_header(client, make_device):
+    device = make_device()
+    for headers in ({}, {'X-Device': device}):
+        response = client.get('/api/apps', headers=headers)
+        assert response.status_code == 200
+        assert 'X-Device' in response.headers.get('Vary', '')
+        etag = response.headers['ETag']
+        response = client.get('/api/apps', headers={**headers, 'If-None-Match': etag})
+        assert response.status_code == 304
+        assert 'X-Device' in response.headers.get('Vary', '')
+
+def test_prefix_and_header_select_the_same_device(client, make_device):
+    device = make_device()
+    client.post(f'/devices/{device}/api/apps', json={'name': 'Solo qui', 'folder': 'Test'})
+    assert 'Solo qui' in client.get('/api/apps', headers={'X-Device': device}).get_data(as_text=True)
+    assert 'Solo qui' not in client.get('/api/apps').get_data(as_text=True)
+
+def test_unknown_and_invalid_devices(client):
+    assert client.get('/api/apps', headers={'X-Device': 'non-esiste'}).status_code == 404
+    assert client.get('/api/apps', headers={'X-Device': '../gestione'}).status_code == 400
+
+def test_idle_devices_evicted_from_default_requests(app_module, client, make_device, monkeypatch):
+    device = make_device()
+    client.get('/api/apps', headers={'X-Device': device})
+    cached = app_module.devices.get(device)
+    monkeypatch.setattr(app_module, 'DEVICE_IDLE_TIMEOUT', 0)
+    monkeypatch.setattr(app_module.devices, '_last_sweep', 0)
+    cached.last_used = time.monotonic() - 1
+    client.get('/api/apps') # Solo il dispositivo predefinito
+    assert device not in app_module.devices._devices
@@ -0,0 +1,42 @@
+import sqlite3
+
+from database import init_db
+
+def add_apps(client, device, names):
+    for name in names:
+        response = client.post('/api/apps', json={'name': name, 'folder': 'Test'}, headers={'X-Device': device})
+        assert response.status_code == 200
+
+def test_devices_never_share_an_etag(client, make_device):
+    first, second = make_device(), make_device()
+    add_apps(client, first, ['Alpha', 'Beta'])
+    add_apps(client, second, ['Gamma', 'Delta']) # Stesso numero di modifiche, contenuto diverso
+
+    first_etag = client.get('/api/apps', headers={'X-Device': first}).headers['ETag']
+    response = client.get('/api/apps', headers={'X-Device': second})
+    assert response.headers['ETag'] != first_etag
+
+    response = client.get('/api/apps', headers={'X-Device': second, 'If-None-Match': first_etag})
+    assert response.status_code == 200
+    assert 'Gamma' in response.get_data(as_text=True)
+
+def test_etag_revalidates_and_changes_with_data(client, make_device):
+    device = make_device()
+    add_apps(client, device, ['Alpha'])
+    etag = client.get('/api/apps', headers={'X-Device': device}).headers['ETag']
+    assert client.get('/api/apps', headers={'X-Device': device, 'If-None-Match': etag}).status_code == 304
+
+    add_apps(client, device, ['Beta'])
+    response = client.get('/api/apps', headers={'X-Device': device, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_each_database_gets_its_own_epoch(tmp_path):
+    epochs = set()
+    for name in ('one.db', 'two.db'):
+        db_file = str(tmp_path / name)
+        init_db(db_file)
+        conn = sqlite3.connect(db_file)
+        epochs.add(conn.execute("SELECT value FROM change_log_meta WHERE name = 'epoch'").fetchone()[0])
+        conn.close()
+    assert len(epochs) == 2
@@ -0,0 +1,116 @@
+import sqlite3
+
+import pytest
+from openpyxl import Workbook
+
+from database import init_db
+from export_data import write_xlsx
+from import_data import import_data
+
+ACCOUNTS = [('mario@example.com', 'MR'), ('anna@example.com', 'AN'), ('luca@example.com', None)]
+APPS = [('Social', 'Chat', 'x', None, 'x'), ('Social', 'Foto', None, 'x', None), ('Lavoro', 'Posta', 'x', 'x', None)]
+
+def save_workbook(path, accounts=ACCOUNTS, apps=APPS):
+    """Scrive un file con i fogli 'Account' e 'POCO' (matrice delle associazioni per abbreviazione o nome)."""
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    sheet = workbook.create_sheet('Account')
+    sheet.append(('indirizzo email', 'abbreviazione'))
+    for row in accounts:
+        sheet.append(row)
+    sheet = workbook.create_sheet('POCO')
+    sheet.append(('Cartella', 'Nome App', 'MR', 'AN', 'luca@example.com'))
+    for row in apps:
+        sheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+def links(db_file):
+    conn = sqlite3.connect(db_file)
+    rows = set(conn.execute("""
+        SELECT a.name, c.name FROM app_accounts aa
+        JOIN apps a ON a.id = aa.app_id JOIN accounts c ON c.id = aa.account_id
+    """))
+    conn.close()
+    return rows
+
+def change_count(db_file):
+    conn = sqlite3.connect(db_file)
+    count = conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0]
+    conn.close()
+    return count
+
+@pytest.fixture
+def db_file(tmp_path):
+    db_file = str(tmp_path / 'gestione.db')
+    init_db(db_file)
+    return db_file
+
+def test_first_import(tmp_path, db_file):
+    stats = import_data(save_workbook(tmp_path / 'dati.xlsx'), db_file)
+    assert stats['Account']['written'] == 3
+    assert stats['POCO']['written'] == 3
+    assert stats['associazioni']['added'] == 5
+    assert links(db_file) == {
+        ('Chat', 'mario@example.com'), ('Chat', 'luca@example.com'), ('Foto', 'anna@example.com'),
+        ('Posta', 'mario@example.com'), ('Posta', 'anna@example.com'),
+    }
+
+def test_reimport_unchanged_writes_nothing(tmp_path, db_file):
+    xlsx_file = save_workbook(tmp_path / 'dati.xlsx')
+    import_data(xlsx_file, db_file)
+    before = change_count(db_file)
+
+    stats = import_data(xlsx_file, db_file)
+    assert [stats[sheet]['written'] for sheet in ('Account', 'POCO')] == [0, 0]
+    assert [stats[sheet]['unchanged'] for sheet in ('Account', 'POCO')] == [3, 3]
+    assert stats['associazioni']['unchanged'] == 3
+    assert stats['associazioni']['added'] == stats['associazioni']['removed'] == 0
+    assert change_count(db_file) == before
+
+def test_reimport_writes_only_changed_row(tmp_path, db_file):
+    import_data(save_workbook(tmp_path / 'dati.xlsx'), db_file)
+    before = change_count(db_file)
+
+    apps = [APPS[0], ('Svago', 'Foto', None, 'x', None), APPS[2]] # Foto cambia cartella
+    stats = import_data(save_workbook(tmp_path / 'modificato.xlsx', apps=apps), db_file)
+    assert stats['Account']['written'] == 0
+    assert stats['POCO']['written'] == 1
+    assert stats['POCO']['unchanged'] == 2
+    assert change_count(db_file) == before + 1
+
+    apps[1] = ('Svago', 'Foto', None, 'x', 'x') # Foto collegata anche a luca
+    stats = import_data(save_workbook(tmp_path / 'collegato.xlsx', apps=apps), db_file)
+    assert stats['POCO']['written'] == 0
+    assert stats['associazioni']['added'] == 1
+    assert stats['associazioni']['unchanged'] == 2
+    assert change_count(db_file) == before + 2
+
+def test_reimport_restores_rows_deleted_outside_import(tmp_path, db_file):
+    xlsx_file = save_workbook(tmp_path / 'dati.xlsx')
+    import_data(xlsx_file, db_file)
+    conn = sqlite3.connect(db_file)
+    conn.execute("DELETE FROM apps WHERE name = 'Chat'")
+    conn.commit()
+    conn.close()
+
+    stats = import_data(xlsx_file, db_file)
+    assert stats['POCO']['written'] == 1
+    assert ('Chat', 'mario@example.com') in links(db_file)
+
+def test_export_import_round_trip_keeps_links(tmp_path, db_file):
+    import_data(save_workbook(tmp_path / 'dati.xlsx'), db_file)
+    exported = str(tmp_path / 'export.xlsx')
+    conn = sqlite3.connect(db_file)
+    write_xlsx(conn, exported)
+    conn.close()
+
+    copy_file = str(tmp_path / 'copia.db')
+    init_db(copy_file)
+    stats = import_data(exported, copy_file)
+    assert stats['associazioni']['unknown_columns'] == []
+    assert links(copy_file) == links(db_file)
+
+    stats = import_data(exported, copy_file)
+    assert stats['POCO']['written'] == 0
+    assert stats['associazioni']['added'] == stats['associazioni']['removed'] == 0
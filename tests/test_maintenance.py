@@ -0,0 +1,16 @@
+import threading
+
+def maintenance_threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'maintenance']
+
+def test_scheduler_starts_on_first_request_and_stops(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'MAINTENANCE_ENABLED', True)
+    assert not maintenance_threads() # L'import non avvia nulla
+
+    client.get('/api/apps')
+    assert len(maintenance_threads()) == 1
+    client.get('/api/apps')
+    assert len(maintenance_threads()) == 1 # Un solo thread per processo
+
+    app_module.maintenance.stop()
+    assert not maintenance_threads()
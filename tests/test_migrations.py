@@ -0,0 +1,33 @@
+import sqlite3
+
+import pytest
+
+from database import init_db, SCHEMA_VERSION
+
+@pytest.fixture
+def conn(tmp_path):
+    db_file = str(tmp_path / 'gestione.db')
+    init_db(db_file)
+    conn = sqlite3.connect(db_file)
+    yield conn
+    conn.close()
+
+def query_plan(conn, sql, params=()):
+    """Restituisce il testo di EXPLAIN QUERY PLAN per la query, una riga per passo."""
+    return '\n'.join(row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+
+def test_schema_version(conn):
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+
+def test_reverse_lookup_uses_account_index(conn):
+    plan = query_plan(conn, 'DELETE FROM app_accounts WHERE account_id = ?', (1,))
+    assert 'idx_app_accounts_account' in plan
+
+@pytest.mark.parametrize('table, index', [
+    ('apps', 'idx_apps_visible_order'),
+    ('accounts', 'idx_accounts_visible_order'),
+])
+def test_visible_ordered_list_uses_index(conn, table, index):
+    plan = query_plan(conn, f'SELECT id, name FROM {table} WHERE is_hidden = 0 ORDER BY "order", name')
+    assert index in plan
+    assert 'USE TEMP B-TREE' not in plan
@@ -0,0 +1,79 @@
+import base64
+import json
+import random
+import sqlite3
+
+import pytest
+
+@pytest.fixture
+def catalog(app_module, make_device):
+    """Dispositivo con 40 app in 2 cartelle e molti pari merito su "order"; restituisce (header, righe attese)."""
+    name = make_device()
+    conn = sqlite3.connect(app_module.devices.get(name).db_file)
+    rnd = random.Random(3)
+    rows = [(f'App {rnd.randint(0, 10 ** 6):07d}-{i}', f'Cartella {i % 2}', rnd.choice([0, 0, 5, 10])) for i in range(40)]
+    conn.executemany('INSERT INTO apps (name, folder, "order") VALUES (?, ?, ?)', rows)
+    conn.commit()
+    expected = [dict(zip(('id', 'name', 'folder', 'order'), row)) for row in conn.execute(
+        'SELECT id, name, folder, "order" FROM apps ORDER BY "order", name, id'
+    )]
+    conn.close()
+    return {'X-Device': name}, expected
+
+def fetch_all(client, headers, query):
+    items, cursor, pages = [], None, 0
+    while True:
+        url = f'/api/manage/data/apps?{query}' + (f'&after={cursor}' if cursor else '')
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        body = response.get_json()
+        items.extend(body['apps'])
+        pages += 1
+        cursor = body['next_cursor']
+        if cursor is None:
+            return items, pages
+
+def encode(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii').rstrip('=')
+
+def test_cursor_round_trip_with_ties(client, catalog):
+    headers, expected = catalog
+    items, pages = fetch_all(client, headers, 'limit=7')
+    assert [item['id'] for item in items] == [row['id'] for row in expected]
+    assert pages == 6
+
+def test_fields_and_filters(client, catalog):
+    headers, expected = catalog
+    items, _ = fetch_all(client, headers, 'limit=4&fields=id,name&folder=Cartella%201')
+    assert all(set(item) == {'id', 'name'} for item in items)
+    assert [item['id'] for item in items] == [row['id'] for row in expected if row['folder'] == 'Cartella 1']
+
+    prefix = expected[0]['name'][:5]
+    items, _ = fetch_all(client, headers, f'limit=3&prefix={prefix}')
+    assert [item['id'] for item in items] == [row['id'] for row in expected if row['name'].startswith(prefix)]
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor!',
+    encode(['0', 'App', 1]), # order non intero
+    encode([0, 'App']), # chiave incompleta
+    encode({'order': 0, 'name': 'App', 'id': 1}),
+    encode([None, 'App', 1]),
+])
+def test_invalid_cursors_are_rejected(client, catalog, cursor):
+    headers, _ = catalog
+    response = client.get(f'/api/manage/data/apps?after={cursor}', headers=headers)
+    assert response.status_code == 400
+
+def test_put_without_order_keeps_pages_valid(client, catalog):
+    headers, expected = catalog
+    item = expected[3]
+    assert client.put(f"/api/apps/{item['id']}", json={'is_hidden': False}, headers=headers).status_code == 200
+    items, _ = fetch_all(client, headers, 'limit=5&fields=id,order')
+    assert [row['id'] for row in items] == [row['id'] for row in expected]
+    assert all(row['order'] is not None for row in items)
+
+def test_unknown_fields_and_filters(client, catalog):
+    headers, _ = catalog
+    assert client.get('/api/manage/data/apps?fields=password', headers=headers).status_code == 400
+    assert client.get('/api/manage/data/accounts?folder=x', headers=headers).status_code == 400
+    assert client.get('/api/manage/data/apps?limit=0', headers=headers).status_code == 400
@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+@pytest.fixture
+def plan(app_module):
+    return app_module._plan_reorder
+
+def expected_sequence(current, ordered_ids):
+    """Le voci elencate si scambiano le posizioni che occupano, le altre restano dove sono."""
+    listed = iter(ordered_ids)
+    return [next(listed) if item_id in set(ordered_ids) else item_id for item_id, _ in current]
+
+def apply(current, updates):
+    orders = dict(current)
+    orders.update({item_id: key for key, item_id in updates})
+    return orders
+
+def strict_lis_length(keys):
+    """Lunghezza della più lunga sottosequenza strettamente crescente (O(n^2), per confronto)."""
+    best = []
+    for i, key in enumerate(keys):
+        best.append(1 + max((best[j] for j in range(i) if keys[j] < key), default=0))
+    return max(best, default=0)
+
+def check(current, ordered_ids, updates, rebalanced):
+    sequence = expected_sequence(current, ordered_ids)
+    orders = apply(current, updates)
+    final = [orders[item_id] for item_id in sequence]
+    assert all(key is not None for key in final)
+    assert final == sorted(final) and len(set(final)) == len(final) # Ordine univoco, senza pari merito
+    keys = [dict(current)[item_id] for item_id in sequence]
+    if not rebalanced and None not in keys:
+        # Restano ferme quante più voci possibile: le altre sono il minimo da riscrivere
+        assert len(updates) == len(sequence) - strict_lis_length(keys)
+
+def test_moving_one_item_writes_one_row(plan):
+    current = [(1, 1024), (2, 2048), (3, 3072), (4, 4096)]
+    updates, rebalanced = plan(current, [4, 1, 2, 3])
+    assert updates == [(0, 4)]
+    assert not rebalanced
+
+def test_partial_list_leaves_other_items_in_place(plan):
+    current = [(1, 10), (2, 20), (3, 30), (4, 40), (5, 50)]
+    updates, rebalanced = plan(current, [4, 2])
+    check(current, [4, 2], updates, rebalanced)
+    orders = apply(current, updates)
+    assert sorted(orders, key=orders.get) == [1, 4, 3, 2, 5]
+    assert len(updates) == 2
+
+def test_noop_writes_nothing(plan):
+    current = [(1, 10), (2, 20), (3, 30)]
+    assert plan(current, [1, 2, 3]) == ([], False)
+    assert plan(current, [2]) == ([], False)
+
+def test_ties_and_null_orders_become_distinct(plan):
+    current = [(1, None), (2, None), (3, 0), (4, 5), (5, 5)]
+    updates, rebalanced = plan(current, [1, 2, 3, 4, 5])
+    check(current, [1, 2, 3, 4, 5], updates, rebalanced)
+    assert {1, 2} <= {item_id for _, item_id in updates} # I NULL vengono sempre riscritti
+
+def test_ties_keep_one_item_per_value(plan):
+    current = [(1, 10), (2, 10), (3, 10), (4, 20)]
+    updates, rebalanced = plan(current, [3, 2, 1])
+    check(current, [3, 2, 1], updates, rebalanced)
+    assert len(updates) == 2
+
+def test_rebalances_when_gaps_run_out(plan):
+    current = [(1, 0), (2, 1), (3, 2)]
+    updates, rebalanced = plan(current, [1, 3, 2])
+    assert rebalanced
+    check(current, [1, 3, 2], updates, rebalanced)
+
+def test_random_permutations(plan):
+    rnd = random.Random(7)
+    rebalances = 0
+    for _ in range(500):
+        size = rnd.randint(1, 12)
+        if rnd.random() < 0.3: # Valori vicini, ripetuti o NULL: pari merito e ribilanciamenti
+            values = [rnd.choice([None] + list(range(3 * size))) for _ in range(size)]
+        else:
+            values = [rnd.randrange(0, 4096 * size, 512) for _ in range(size)]
+        keys = sorted(values, key=lambda key: -1 if key is None else key) # NULL prima, come in SQLite
+        current = list(zip(range(1, size + 1), keys))
+        ordered_ids = [item_id for item_id, _ in current if rnd.random() < 0.7] or [1]
+        rnd.shuffle(ordered_ids)
+        updates, rebalanced = plan(current, ordered_ids)
+        check(current, ordered_ids, updates, rebalanced)
+        rebalances += rebalanced
+    assert rebalances > 0
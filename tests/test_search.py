@@ -0,0 +1,12 @@
+def test_search_finds_apps_and_accounts(client, make_device):
+    headers = {'X-Device': make_device()}
+    client.post('/api/apps', json={'name': 'Spotify Music', 'folder': 'Audio'}, headers=headers)
+    client.post('/api/accounts', json={'name': 'spot@example.com'}, headers=headers)
+    results = client.get('/api/search?q=spot', headers=headers).get_json()['results']
+    assert {result['type'] for result in results} == {'app', 'account'}
+    results = client.get('/api/search?q=spot&type=app', headers=headers).get_json()['results']
+    assert [result['name'] for result in results] == ['Spotify Music']
+
+def test_search_requires_authentication(client, token, auth_required):
+    assert client.get('/api/search?q=spot').status_code == 401
+    assert client.get('/api/search?q=spot', headers={'Authorization': f'Bearer {token}'}).status_code == 200
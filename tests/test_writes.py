@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+def test_write_holds_the_lock_while_planning(app_module, make_device):
+    device = app_module.devices.get(make_device())
+
+    def operation(cursor):
+        # Un altro worker non può scrivere tra le letture di operation e le sue scritture
+        other = sqlite3.connect(device.db_file, timeout=0)
+        try:
+            with pytest.raises(sqlite3.OperationalError, match='locked'):
+                other.execute("INSERT INTO apps (name, folder) VALUES ('Intrusa', 'Test')")
+        finally:
+            other.close()
+        return cursor.connection.in_transaction
+
+    with app_module.app.app_context():
+        app_module.g.device = device
+        assert app_module.run_write(operation) is True
+
+def test_noop_writes_keep_the_data_version(app_module, client, make_device):
+    name = make_device()
+    headers = {'X-Device': name}
+    ids = [client.post('/api/accounts', json={'name': f'a{i}@example.com'}, headers=headers).get_json()['id'] for i in range(3)]
+    client.put('/api/accounts/order', json={'ids': ids}, headers=headers)
+    device = app_module.devices.get(name)
+    version = device.get_version()
+
+    response = client.put('/api/accounts/order', json={'ids': ids}, headers=headers) # Già in questo ordine
+    assert response.get_json()['updated'] == 0
+    assert client.put('/api/accounts/order', json={'ids': [999]}, headers=headers).status_code == 400
+    assert device.get_version() == version
+
+    client.put('/api/accounts/order', json={'ids': ids[::-1]}, headers=headers)
+    assert device.get_version() != version